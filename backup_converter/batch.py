@@ -0,0 +1,298 @@
+import glob
+import json
+import logging
+import os
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from .core import BackupFormat, SCHEMA_MAP, convert_backup, merge_backups
+from .stream import BackupWriter, open_backup
+from .view import open_view
+
+# Batch mode.
+#
+# Starting a process per backup means importing protobuf and the schema modules
+# every time, which for small backups costs more than the conversion itself.
+# `batch` runs many convert/merge/info jobs on one pool of worker processes
+# instead, each of which imports every schema once up front.
+#
+# At most `queue_size` jobs are handed to the pool at a time, so a manifest of
+# thousands of jobs doesn't get pickled into the pool's queue all at once.
+# Timeouts are enforced in the worker with SIGALRM, which aborts the job
+# (BackupWriter removes its partial output). Where that isn't available
+# (Windows) or a job doesn't react to it, the parent gives up on the job after
+# a grace period and kills the pool's processes at the end.
+
+BACKUP_PATTERNS = ("*.tachibk", "*.proto.gz", "*.tachibk.zst", "*.tachibk.lz4")
+_TARGETS = ("mihon", "sy", "komikku", "yokai")
+_TIMEOUT_GRACE = 5.0
+_POLL_INTERVAL = 0.5
+
+
+class Job(NamedTuple):
+    op: str  # "convert", "merge" or "info"
+    inputs: List[str]
+    output: Optional[str] = None
+    target: Optional[str] = None  # convert only
+    compress_level: Optional[int] = None
+    threads: int = 1
+
+
+class JobTimeout(BaseException):
+    # Not an Exception, so the broad `except Exception` in open_backup and
+    # load_backup can't swallow it and carry on with the job
+    pass
+
+
+def find_backups(sources: Iterable[str]) -> List[str]:
+    """Expands directories and glob patterns into backup files, in sorted order per source."""
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            matches = set()
+            for pattern in BACKUP_PATTERNS:
+                matches.update(glob.glob(os.path.join(source, pattern)))
+            paths.extend(sorted(matches))
+        elif glob.has_magic(source):
+            paths.extend(sorted(p for p in glob.glob(source) if os.path.isfile(p)))
+        else:
+            paths.append(source)
+    return paths
+
+
+def read_manifest(path: str) -> List[Job]:
+    """
+    Reads a JSON lines manifest, one job per line:
+        {"op": "convert", "input": "a.tachibk", "target": "mihon", "output": "a_mihon.tachibk"}
+        {"op": "merge", "inputs": ["a.tachibk", "b.tachibk"], "output": "merged.tachibk"}
+        {"op": "info", "input": "a.tachibk"}
+    Relative paths are relative to the manifest's directory.
+    """
+    base = os.path.dirname(os.path.abspath(path))
+
+    def resolve(p):
+        return p if p is None else os.path.join(base, p)
+
+    jobs = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                entry = json.loads(line)
+                op = entry["op"]
+                inputs = entry["inputs"] if "inputs" in entry else [entry["input"]]
+            except (ValueError, KeyError, TypeError) as e:
+                raise ValueError(f"{path}:{line_no}: invalid job: {e}")
+            if op not in ("convert", "merge", "info"):
+                raise ValueError(f"{path}:{line_no}: unknown op {op!r}")
+            inputs = [resolve(p) for p in inputs]
+            output = resolve(entry.get("output"))
+            if op == "convert":
+                if entry.get("target") not in _TARGETS:
+                    raise ValueError(f"{path}:{line_no}: convert needs a target ({', '.join(_TARGETS)})")
+                output = output or _converted_path(inputs[0], entry["target"], os.path.dirname(inputs[0]))
+            elif op == "merge" and not output:
+                raise ValueError(f"{path}:{line_no}: merge needs an output")
+            jobs.append(Job(op, inputs, output, entry.get("target"), entry.get("compress_level"), entry.get("threads", 1)))
+    return jobs
+
+
+def _init_worker():
+    # Keep every schema loaded for the life of the worker
+    for fmt in BackupFormat:
+        SCHEMA_MAP[fmt]
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s [%(levelname)s] %(message)s")
+
+
+def _on_alarm(signum, frame):
+    raise JobTimeout()
+
+
+def _convert(job: Job) -> dict:
+    backup = open_backup(job.inputs[0])
+    if not backup:
+        raise ValueError(f"Could not load {job.inputs[0]}")
+    target_fmt = BackupFormat[job.target.upper()]
+    with backup, BackupWriter(job.output, target_fmt, level=job.compress_level, threads=job.threads) as writer:
+        convert_backup(backup, target_fmt, writer=writer)
+    return {"source_format": backup.fmt.name, "manga": writer.manga_count}
+
+
+def _merge(job: Job) -> dict:
+    loaded = []
+    try:
+        for path in job.inputs:
+            backup = open_backup(path)
+            if backup:
+                loaded.append((backup, backup.fmt))
+        if not loaded:
+            raise ValueError("No valid backups loaded")
+        with BackupWriter(job.output, BackupFormat.SY, level=job.compress_level, threads=job.threads) as writer:
+            merge_backups(loaded, writer=writer)
+    finally:
+        for backup, _ in loaded:
+            backup.close()
+    return {"loaded": len(loaded), "manga": writer.manga_count}
+
+
+def _info(job: Job) -> dict:
+    view = open_view(job.inputs[0])
+    if not view:
+        raise ValueError(f"Could not load {job.inputs[0]}")
+    return {
+        "format": view.fmt.name,
+        "manga": len(view),
+        "favorites": view.favorite_count,
+        "chapters": view.total_chapters,
+        "categories": len(getattr(view.extras, "backupCategories", [])),
+        "sources": len(view.source_counts),
+    }
+
+
+_OPS = {"convert": _convert, "merge": _merge, "info": _info}
+
+
+def run_job(job: Job, timeout: Optional[float] = None) -> dict:
+    """Runs one job (in a worker). Never raises; failures end up in the result."""
+    start = time.perf_counter()
+    use_alarm = timeout and hasattr(signal, "setitimer")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        result = {"status": "ok", "result": _OPS[job.op](job)}
+    except JobTimeout:
+        result = {"status": "timeout", "error": f"Timed out after {timeout}s"}
+    except Exception as e:
+        result = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def _describe(job: Job) -> dict:
+    entry = {"op": job.op, "inputs": job.inputs}
+    if job.output:
+        entry["output"] = job.output
+    if job.target:
+        entry["target"] = job.target
+    return entry
+
+
+def run_batch(jobs: List[Job], workers: int, timeout: Optional[float] = None,
+              queue_size: Optional[int] = None, fail_fast: bool = False) -> dict:
+    """
+    Runs `jobs` on a pool of `workers` processes and returns the summary report.
+    Failed jobs don't stop the batch unless `fail_fast` is set, in which case
+    jobs not started yet are reported as skipped.
+    """
+    queue_size = max(queue_size or 2 * workers, 1)
+    results: List[Optional[dict]] = [None] * len(jobs)
+    # future -> [job index, time it was first seen running]
+    pending: Dict = {}
+    next_index = 0
+    stop = False
+    # Jobs whose worker didn't stop at the timeout
+    stuck: List[Job] = []
+    started = time.perf_counter()
+
+    def new_pool():
+        return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+
+    def record(index: int, result: dict):
+        nonlocal stop
+        results[index] = dict(_describe(jobs[index]), **result)
+        if result["status"] == "ok":
+            logging.info(f"[{index + 1}/{len(jobs)}] {jobs[index].op} {', '.join(jobs[index].inputs)}: ok")
+        else:
+            logging.error(f"[{index + 1}/{len(jobs)}] {jobs[index].op} {', '.join(jobs[index].inputs)}: {result['error']}")
+            stop = stop or fail_fast
+
+    pool = new_pool()
+    try:
+        while True:
+            # Keep the pool's queue topped up, but bounded
+            while not stop and next_index < len(jobs) and len(pending) < queue_size:
+                pending[pool.submit(run_job, jobs[next_index], timeout)] = [next_index, None]
+                next_index += 1
+            if not pending:
+                break
+
+            done, _ = wait(pending, timeout=_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            broken = False
+            for future in done:
+                index, _ = pending.pop(future)
+                try:
+                    record(index, future.result())
+                except BrokenProcessPool:
+                    broken = True
+                    record(index, {"status": "error", "error": "Worker process died"})
+            if broken:
+                # Everything still in that pool is lost with it
+                for future, (index, _) in pending.items():
+                    record(index, {"status": "error", "error": "Worker process died"})
+                pending.clear()
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = new_pool()
+                continue
+
+            if timeout:
+                now = time.perf_counter()
+                for future, entry in list(pending.items()):
+                    if entry[1] is None and future.running():
+                        entry[1] = now
+                    elif entry[1] is not None and now - entry[1] > timeout + _TIMEOUT_GRACE:
+                        # The worker didn't stop by itself; give up on it
+                        del pending[future]
+                        stuck.append(jobs[entry[0]])
+                        record(entry[0], {"status": "timeout", "error": f"Timed out after {timeout}s (worker unresponsive)",
+                                          "seconds": round(now - entry[1], 3)})
+    finally:
+        if stuck:
+            # No public API to stop a running task, so kill the workers
+            processes = list((getattr(pool, "_processes", None) or {}).values())
+            pool.shutdown(wait=False, cancel_futures=True)
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
+            # Killed mid-write, nothing cleaned up after them
+            for job in stuck:
+                if job.op != "info" and job.output and os.path.exists(job.output):
+                    os.remove(job.output)
+        else:
+            pool.shutdown()
+
+    for index, result in enumerate(results):
+        if result is None:
+            results[index] = dict(_describe(jobs[index]), status="skipped")
+    counts = {status: sum(1 for r in results if r["status"] == status) for status in ("ok", "error", "timeout", "skipped")}
+    return {
+        "jobs": results,
+        "total": len(jobs),
+        **counts,
+        "workers": workers,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def jobs_for_paths(paths: List[str], op: str, output_dir: str = ".", target: Optional[str] = None,
+                   output: Optional[str] = None, compress_level: Optional[int] = None, threads: int = 1) -> List[Job]:
+    """Jobs for the files found by find_backups: one per file, or a single merge of all of them."""
+    if op == "merge":
+        return [Job("merge", paths, output or os.path.join(output_dir, "merged_backup.tachibk"), None, compress_level, threads)]
+    if op == "info":
+        return [Job("info", [p]) for p in paths]
+    return [Job("convert", [p], _converted_path(p, target, output_dir), target, compress_level, threads) for p in paths]
+
+
+def _converted_path(path: str, target: str, output_dir: str) -> str:
+    # Same naming as the convert command
+    return os.path.join(output_dir, f"converted_{target.upper()}_{os.path.basename(path)}")
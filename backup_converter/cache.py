@@ -0,0 +1,251 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from .core import BackupFormat, SCHEMA_MAP
+from .view import BackupView, open_view
+
+# On-disk index cache.
+#
+# Building a BackupView still means gunzipping the whole backup. For archives
+# that get `info`/`merge` run over them again and again, the view is stored in
+# a cache directory as a compact binary index that is memory-mapped on the next
+# run, so nothing has to be decompressed.
+#
+# Index files are named by a hash of the backup's content, so copies and
+# renames share one index. To avoid re-hashing unchanged files on every run,
+# paths.json remembers (size, mtime) -> hash per path. The cache is capped in
+# size; the least recently used indexes are evicted first (a hit bumps the
+# index file's mtime).
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+_MAGIC = b"BCIDX\x00\x00\x01"
+# magic, byte order, count, fmt length, url blob length, genres length, extras length
+_HEADER = struct.Struct("<8s1sxxxIIQQQ")
+_PATHS_FILE = "paths.json"
+
+
+def _pad(n: int) -> int:
+    return (n + 7) & ~7
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class _UrlTable:
+    # Decodes urls from the index blob on access
+    def __init__(self, blob, ends):
+        self._blob = blob
+        self._ends = ends
+
+    def __len__(self):
+        return len(self._ends)
+
+    def __getitem__(self, index: int) -> str:
+        start = self._ends[index - 1] if index else 0
+        return bytes(self._blob[start:self._ends[index]]).decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self._ends)):
+            yield self[i]
+
+
+def write_index(view: BackupView, path: str):
+    """Serializes a BackupView into the binary index format."""
+    urls = [u.encode("utf-8") for u in view.urls]
+    url_ends = array("q")
+    total = 0
+    for u in urls:
+        total += len(u)
+        url_ends.append(total)
+    url_blob = b"".join(urls)
+    fmt = view.fmt.value.encode()
+    genres = json.dumps(view.genre_counts).encode()
+    extras = view.extras.SerializeToString() if view.extras is not None else b""
+    order = b"<" if sys.byteorder == "little" else b">"
+
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, order, len(view), len(fmt), len(url_blob), len(genres), len(extras)))
+        f.write(fmt.ljust(_pad(len(fmt)), b"\0"))
+        for column in (view.offsets, view.sizes, view.sources, view.chapter_counts, url_ends):
+            f.write(array("q", column).tobytes())
+        f.write(bytes(view.favorites).ljust(_pad(len(view)), b"\0"))
+        f.write(url_blob)
+        f.write(genres)
+        f.write(extras)
+    os.replace(tmp, path)
+
+
+def read_index(index_path: str, backup_path: str) -> Optional[BackupView]:
+    """Memory-maps an index file as a BackupView. Returns None if it's unusable."""
+    try:
+        return _read_index(index_path, backup_path)
+    except (OSError, ValueError, struct.error) as e:
+        logging.warning(f"Ignoring unreadable index {index_path}: {e}")
+        return None
+
+
+def _read_index(index_path: str, backup_path: str) -> Optional[BackupView]:
+    with open(index_path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            return None
+    if len(mm) < _HEADER.size:
+        return None
+    magic, order, count, fmt_len, url_len, genres_len, extras_len = _HEADER.unpack_from(mm, 0)
+    if magic != _MAGIC or order != (b"<" if sys.byteorder == "little" else b">"):
+        return None
+
+    buf = memoryview(mm)
+    pos = _HEADER.size
+    fmt = BackupFormat(bytes(buf[pos:pos + fmt_len]).decode())
+    pos += _pad(fmt_len)
+
+    view = BackupView(backup_path, fmt)
+    columns = []
+    for _ in range(5):
+        columns.append(buf[pos:pos + 8 * count].cast("q"))
+        pos += 8 * count
+    view.offsets, view.sizes, view.sources, view.chapter_counts, url_ends = columns
+    view.favorites = buf[pos:pos + count]
+    pos += _pad(count)
+    view.urls = _UrlTable(buf[pos:pos + url_len], url_ends)
+    pos += url_len
+    view.genre_counts = Counter(json.loads(bytes(buf[pos:pos + genres_len])))
+    pos += genres_len
+    view.extras = SCHEMA_MAP[fmt].Backup.FromString(bytes(buf[pos:pos + extras_len]))
+    # Keep the mapping alive as long as the view
+    view._mmap = mm
+    return view
+
+
+class CacheEntry(NamedTuple):
+    path: str
+    size: int
+    last_used: float
+
+
+class IndexCache:
+    """Directory of backup indexes with an LRU size cap."""
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._paths_file = os.path.join(directory, _PATHS_FILE)
+        self._paths: Dict[str, dict] = self._load_paths()
+
+    def _load_paths(self) -> Dict[str, dict]:
+        try:
+            with open(self._paths_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_paths(self):
+        # Forget files whose index has been evicted
+        live = {os.path.basename(e.path)[:-4] for e in self.entries()}
+        self._paths = {p: info for p, info in self._paths.items() if info["digest"] in live}
+        tmp = f"{self._paths_file}.tmp{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._paths, f)
+        os.replace(tmp, self._paths_file)
+
+    def digest(self, path: str) -> str:
+        """Content hash of `path`, reusing the stored one if size and mtime are unchanged."""
+        st = os.stat(path)
+        key = os.path.abspath(path)
+        known = self._paths.get(key)
+        if known and known["size"] == st.st_size and known["mtime_ns"] == st.st_mtime_ns:
+            return known["digest"]
+        digest = file_digest(path)
+        self._paths[key] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "digest": digest}
+        return digest
+
+    def index_path(self, digest: str) -> str:
+        return os.path.join(self.directory, f"{digest}.idx")
+
+    def get_view(self, path: str) -> Optional[BackupView]:
+        """Returns the view of `path` from the cache. On a miss it is built and stored."""
+        try:
+            digest = self.digest(path)
+        except OSError as e:
+            logging.error(f"Failed to load {path}: {e}")
+            return None
+        index_path = self.index_path(digest)
+        if os.path.exists(index_path):
+            view = read_index(index_path, path)
+            if view is not None:
+                os.utime(index_path)  # LRU bookkeeping
+                logging.debug(f"Index cache hit for {path}")
+                self._save_paths()
+                return view
+
+        view = open_view(path)
+        if view is None:
+            return None
+        write_index(view, index_path)
+        self.evict()
+        return view
+
+    def entries(self) -> List[CacheEntry]:
+        result = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".idx"):
+                continue
+            full = os.path.join(self.directory, name)
+            try:
+                st = os.stat(full)
+            except OSError:
+                continue
+            result.append(CacheEntry(full, st.st_size, st.st_mtime))
+        return result
+
+    def evict(self, max_bytes: Optional[int] = None) -> Tuple[int, int]:
+        """
+        Removes least recently used indexes until the cache fits in `max_bytes`
+        (default: the cache's cap). Returns (files removed, bytes freed).
+        """
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        entries = sorted(self.entries(), key=lambda e: e.last_used)
+        total = sum(e.size for e in entries)
+        removed = freed = 0
+        for entry in entries:
+            if total <= limit:
+                break
+            try:
+                os.remove(entry.path)
+            except OSError:
+                continue
+            total -= entry.size
+            removed += 1
+            freed += entry.size
+        self._save_paths()
+        return removed, freed
+
+
+def parse_size(text: str) -> int:
+    """Parses sizes like 512M, 2G or 1048576."""
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+    text = text.strip().upper().rstrip("B")
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
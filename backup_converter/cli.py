@@ -1,9 +1,20 @@
 import argparse
+import atexit
+import json
 import sys
 import logging
 import os
 from datetime import datetime
-from .core import load_backup, save_backup, convert_backup, merge_backups, BackupFormat
+from .core import convert_backup, merge_backups, resolve_format, BackupFormat, READ_ERRORS
+from .stream import open_backup, BackupWriter
+from .batch import find_backups, jobs_for_paths, read_manifest, run_batch
+from .view import open_view
+from .cache import IndexCache, parse_size
+from .compress import LEVELS, check_level, codec_available, codec_for_path
+from .fuzzy import DEFAULT_THRESHOLD, dedupe_file
+from .subset import And, Favorite, HasGenre, InCategory, ReadRatio, SourceIn, UpdatedSince, \
+    filter_backup, parse_date, parse_predicate
+from . import trace
 
 def setup_logging():
     logging.basicConfig(
@@ -12,6 +23,69 @@ def setup_logging():
         handlers=[logging.StreamHandler()]
     )
 
+def size_arg(text):
+    try:
+        size = parse_size(text)
+    except ValueError:
+        size = -1
+    if size < 0:
+        raise argparse.ArgumentTypeError(f"invalid size {text!r}, expected e.g. 512M, 2G or a number of bytes")
+    return size
+
+def level_arg(text):
+    # Only the widest range can be checked here, the output path picks the codec
+    low, high = min(r[0] for r in LEVELS.values()), max(r[1] for r in LEVELS.values())
+    try:
+        level = int(text)
+    except ValueError:
+        level = None
+    if level is None or not low <= level <= high:
+        ranges = ", ".join(f"{r[0]}-{r[1]} for {codec}" for codec, r in LEVELS.items())
+        raise argparse.ArgumentTypeError(f"invalid level {text!r}, expected {ranges}")
+    return level
+
+def add_compression_args(parser):
+    parser.add_argument("--compress-level", type=level_arg, help="Compression level, 0-9 for gzip, 1-22 for .zst, 0-16 for .lz4 "
+                        "(default: 9 for gzip, the codec's default for .zst/.lz4)")
+    parser.add_argument("--threads", type=int, default=1, help="Compress on N threads (default: 1)")
+
+def open_writer(path, fmt, args):
+    codec = codec_for_path(path)
+    if not codec_available(codec):
+        logging.error(f"Writing {codec} files needs an optional package, see README")
+        sys.exit(1)
+    try:
+        check_level(codec, args.compress_level)
+    except ValueError as e:
+        logging.error(f"{path}: {e}")
+        sys.exit(1)
+    return BackupWriter(path, fmt, level=args.compress_level, threads=args.threads)
+
+def finish_profile(trace_path):
+    tracer = trace.disable()
+    if trace_path:
+        tracer.write_chrome_trace(trace_path)
+        logging.info(f"Trace written to {trace_path}")
+    print(tracer.summary(), file=sys.stderr)
+
+def temp_path(path):
+    # Written next to `path` and renamed over it, keeping the extension that picks the codec
+    root, ext = os.path.splitext(path)
+    return f"{root}.partial{ext}"
+
+def fuzzy_dedupe(path, out_path, threshold, args):
+    """Cross-source dedupe of `path` into `out_path`, which may be the same file."""
+    write_path = temp_path(out_path) if os.path.abspath(path) == os.path.abspath(out_path) else out_path
+    try:
+        with open_writer(write_path, resolve_format(path), args) as writer:
+            report = dedupe_file(path, threshold, writer)
+    except ValueError as e:
+        logging.error(str(e))
+        sys.exit(1)
+    if write_path != out_path:
+        os.replace(write_path, out_path)
+    return report
+
 def main():
     setup_logging()
     
@@ -23,6 +97,13 @@ def main():
             pass # older python or weird environment
     
     parser = argparse.ArgumentParser(prog="backup-tool", description="Manga Backup Converter & Merger")
+    parser.add_argument("--cache-dir", default=os.environ.get("BACKUP_TOOL_CACHE"),
+                        help="Keep indexes of parsed backups here to speed up repeated info runs (env: BACKUP_TOOL_CACHE)")
+    parser.add_argument("--cache-size", type=size_arg, default="256M", help="Size cap of the index cache (default: 256M)")
+    parser.add_argument("--profile", action="store_true", help="Print time, CPU, memory and item counts per stage at the end")
+    parser.add_argument("--trace", metavar="FILE", help="Like --profile, and write the stages as a Chrome trace (JSON) to FILE")
+    parser.add_argument("--trace-malloc", action="store_true",
+                        help="Also record Python allocations per stage with tracemalloc (makes the run slower)")
     subparsers = parser.add_subparsers(dest="command", required=True)
 
     # INFO
@@ -32,28 +113,98 @@ def main():
     # CONVERT
     conv_parser = subparsers.add_parser("convert", help="Convert backup to another format")
     conv_parser.add_argument("input", help="Input backup file")
-    conv_parser.add_argument("target", choices=["mihon", "sy"], help="Target format")
+    conv_parser.add_argument("target", choices=["mihon", "sy", "komikku", "yokai"], help="Target format")
     conv_parser.add_argument("-o", "--output", help="Output file path (optional)")
+    add_compression_args(conv_parser)
 
     # MERGE
     merge_parser = subparsers.add_parser("merge", help="Merge multiple backups")
     merge_parser.add_argument("inputs", nargs="+", help="Input backup files")
     merge_parser.add_argument("-o", "--output", help="Output file path")
+    merge_parser.add_argument("-j", "--jobs", type=int, default=1, help="Load and convert inputs on N processes (default: 1)")
+    merge_parser.add_argument("--base", help="Previous merged backup to update incrementally (its fingerprint index is kept next to it)")
+    merge_parser.add_argument("--fuzzy", type=float, nargs="?", const=DEFAULT_THRESHOLD, metavar="THRESHOLD",
+                              help=f"Also fold the same series on different sources, matched by title (default threshold: {DEFAULT_THRESHOLD})")
+    add_compression_args(merge_parser)
+
+    # FILTER
+    filter_parser = subparsers.add_parser("filter", help="Keep only the manga matching a filter, e.g. favorites of one source")
+    filter_parser.add_argument("input", help="Input backup file")
+    filter_parser.add_argument("-o", "--output", help="Output file path (default: filtered_<input>)")
+    filter_parser.add_argument("--source", type=int, action="append", metavar="ID", help="Source id to keep (repeatable)")
+    filter_parser.add_argument("--favorite", action="store_true", help="Only favorites")
+    filter_parser.add_argument("--category", action="append", metavar="NAME", help="Category to keep (repeatable, 'Default' for none)")
+    filter_parser.add_argument("--genre", action="append", metavar="NAME", help="Genre to keep (repeatable)")
+    filter_parser.add_argument("--updated-since", metavar="DATE", help="Modified on or after DATE (YYYY-MM-DD or epoch ms)")
+    filter_parser.add_argument("--min-read-ratio", type=float, help="At least this share of chapters read (0-1)")
+    filter_parser.add_argument("--max-read-ratio", type=float, help="At most this share of chapters read (0-1)")
+    filter_parser.add_argument("--where", metavar="EXPR",
+                               help='Filter expression, e.g. \'favorite and (genre = Action or read_ratio < 0.5)\' (see subset.py)')
+    add_compression_args(filter_parser)
+
+    # DEDUPE
+    dedupe_parser = subparsers.add_parser("dedupe", help="Find (and fold) the same series on different sources by title")
+    dedupe_parser.add_argument("input", help="Backup file, e.g. a merged backup")
+    dedupe_parser.add_argument("-o", "--output", help="Output file path (default: deduped_<input>)")
+    dedupe_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                               help=f"Title similarity needed for a match, 0-1 (default: {DEFAULT_THRESHOLD})")
+    dedupe_parser.add_argument("--report-only", action="store_true", help="Only report the duplicates, don't write a backup")
+    dedupe_parser.add_argument("--report", help="Write the JSON report of the duplicates here")
+    add_compression_args(dedupe_parser)
+
+    # BATCH
+    batch_parser = subparsers.add_parser("batch", help="Run many convert/merge/info jobs on a pool of worker processes")
+    batch_parser.add_argument("sources", nargs="*", help="Backup files, directories or glob patterns")
+    batch_parser.add_argument("--manifest", help="JSON lines file with one job per line instead of sources")
+    batch_parser.add_argument("--op", choices=["convert", "merge", "info"], default="convert", help="What to do with the sources (default: convert)")
+    batch_parser.add_argument("--target", choices=["mihon", "sy", "komikku", "yokai"], help="Target format for convert")
+    batch_parser.add_argument("--output-dir", default=".", help="Where converted files go (default: current directory)")
+    batch_parser.add_argument("-o", "--output", help="Output file of --op merge")
+    batch_parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="Worker processes (default: CPU count)")
+    batch_parser.add_argument("--timeout", type=float, help="Abort jobs running longer than this many seconds")
+    batch_parser.add_argument("--queue", type=int, help="Max jobs handed to the pool at once (default: 2x workers)")
+    batch_parser.add_argument("--fail-fast", action="store_true", help="Stop starting new jobs after the first failure")
+    batch_parser.add_argument("--report", help="Write the JSON summary here instead of stdout")
+    add_compression_args(batch_parser)
+
+    # EXPORT
+    export_parser = subparsers.add_parser("export", help="Flatten backups into columnar tables (Parquet or .npy)")
+    export_parser.add_argument("sources", nargs="+", help="Backup files, directories or glob patterns")
+    export_parser.add_argument("-o", "--output", required=True, help="Output directory")
+    export_parser.add_argument("--format", choices=["parquet", "npy"], help="Table format (default: parquet if pyarrow is installed, else npy)")
+
+    # STATS
+    stats_parser = subparsers.add_parser("stats", help="Library statistics over exported tables or backups")
+    stats_parser.add_argument("sources", nargs="+", help="An export directory, or backup files, directories or glob patterns")
+    stats_parser.add_argument("--json", action="store_true", help="Print the statistics as JSON")
+
+    # CACHE
+    cache_parser = subparsers.add_parser("cache", help="Inspect or evict the index cache")
+    cache_parser.add_argument("action", choices=["list", "evict", "clear"])
+    cache_parser.add_argument("--max-size", type=size_arg, help="Evict down to this size instead of --cache-size")
 
     args = parser.parse_args()
+    if args.profile or args.trace or args.trace_malloc:
+        # Worker processes (merge -j, batch) aren't recorded, only the time spent waiting for them
+        trace.enable(malloc=args.trace_malloc, root="total", command=args.command)
+        atexit.register(finish_profile, args.trace)
+    cache = IndexCache(args.cache_dir, args.cache_size) if args.cache_dir else None
 
     if args.command == "info":
-        backup, fmt = load_backup(args.path)
-        if not backup:
-            return
-        
-        mangas = backup.backupManga
+        # Single streaming pass that doesn't decode chapters (see view.py),
+        # or no pass at all if the index is cached
+        view = cache.get_view(args.path) if cache else open_view(args.path)
+        if not view:
+            sys.exit(1)
+        backup = view.extras
+        fmt = view.fmt
+
         print(f"File: {os.path.basename(args.path)}")
         print(f"Detected Format: {fmt.name}")
         
         # General Stats
         print(f"\n=== General Stats ===")
-        print(f"Total Manga       : {len(mangas)}")
+        print(f"Total Manga       : {len(view)}")
         categories = getattr(backup, 'backupCategories', [])
         print(f"Categories        : {len(categories)}")
         sources = getattr(backup, 'backupSources', [])
@@ -62,13 +213,13 @@ def main():
         print(f"Extension Repos   : {len(extensions)}")
 
         # Library Stats
-        fav_count = sum(1 for m in mangas if getattr(m, 'favorite', False))
+        fav_count = view.favorite_count
         print(f"\n=== Library ===")
         print(f"Favorites         : {fav_count}")
-        print(f"Non-Favorites     : {len(mangas) - fav_count}")
+        print(f"Non-Favorites     : {len(view) - fav_count}")
         
         # Chapter Stats
-        all_chapters = [len(m.chapters) for m in mangas]
+        all_chapters = view.chapter_counts
         if all_chapters:
             import statistics
             print(f"\n=== Chapters ===")
@@ -77,8 +228,7 @@ def main():
             print(f"Max Chapters      : {max(all_chapters)}")
         
         # Source breakdown
-        from collections import Counter
-        source_counts = Counter(m.source for m in mangas)
+        source_counts = view.source_counts
         
         # Try to map source IDs to names if available in backupSources
         source_names = {s.sourceId: s.name for s in sources}
@@ -89,52 +239,274 @@ def main():
             print(f"  - {name:<20} : {count} manga")
 
         # Genres
-        all_genres = [g for m in mangas for g in getattr(m, 'genre', [])]
-        if all_genres:
-             top_genres = Counter(all_genres).most_common(5)
+        if view.genre_counts:
+             top_genres = view.genre_counts.most_common(5)
              print(f"\n=== Top Genres ===")
              for g, c in top_genres:
                  print(f"  - {g:<20} : {c}")
         
     elif args.command == "convert":
-        backup, fmt = load_backup(args.input)
+        backup = open_backup(args.input)
         if not backup:
             sys.exit(1)
+        fmt = backup.fmt
             
         target_fmt = BackupFormat[args.target.upper()]
         logging.info(f"Converting {fmt.name} -> {target_fmt.name}...")
         
-        new_backup = convert_backup(backup, target_fmt)
-        
         if args.output:
             out_path = args.output
         else:
             out_path = f"converted_{target_fmt.name}_{os.path.basename(args.input)}"
             
-        save_backup(new_backup, out_path)
+        # Streams straight from the input to the output, one manga at a time
+        try:
+            with backup, open_writer(out_path, target_fmt, args) as writer:
+                convert_backup(backup, target_fmt, writer=writer)
+        except READ_ERRORS as e:
+            # Truncated or corrupt past the header (the partial output is removed)
+            logging.error(f"Failed to load {args.input}: {e}")
+            sys.exit(1)
         logging.info(f"Saved to {out_path}")
 
     elif args.command == "merge":
+        if args.output:
+            out_path = args.output
+        else:
+            ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+            out_path = f"merged_backup_{ts}.tachibk"
+
+        if args.base and args.fuzzy:
+            # Folded manga would no longer match the fingerprint index
+            logging.error("--fuzzy can't be combined with --base, run dedupe on the result instead")
+            sys.exit(1)
+
+        if args.base:
+            from .incremental import merge_incremental
+            base = args.base if os.path.exists(args.base) else None
+            if base is None:
+                logging.info(f"{args.base} doesn't exist yet, starting a new merged backup")
+            # The base is read while the output is written, so don't write over it directly
+            write_path = temp_path(out_path) if base and os.path.abspath(base) == os.path.abspath(out_path) else out_path
+            try:
+                with open_writer(write_path, BackupFormat.SY, args) as writer:
+                    index = merge_incremental(base, args.inputs, writer)
+            except ValueError as e:
+                logging.error(str(e))
+                sys.exit(1)
+            if write_path != out_path:
+                os.replace(write_path, out_path)
+            index.save(out_path)
+            logging.info(f"Merge Complete! Saved to {out_path}")
+            return
+
+        if args.jobs > 1:
+            from .parallel import merge_files_parallel
+            logging.info(f"Merging {len(args.inputs)} backups on {args.jobs} processes...")
+            try:
+                with open_writer(out_path, BackupFormat.SY, args) as writer:
+                    merge_files_parallel(args.inputs, args.jobs, writer=writer)
+            except ValueError as e:
+                logging.error(str(e))
+                sys.exit(1)
+            if args.fuzzy:
+                fuzzy_dedupe(out_path, out_path, args.fuzzy, args)
+            logging.info(f"Merge Complete! Saved to {out_path}")
+            return
+
         loaded = []
         for path in args.inputs:
-            b, f = load_backup(path)
-            if b: loaded.append((b, f))
+            b = open_backup(path)
+            if b: loaded.append((b, b.fmt))
         
         if not loaded:
             logging.error("No valid backups loaded")
             sys.exit(1)
             
         logging.info(f"Merging {len(loaded)} backups...")
-        merged = merge_backups(loaded)
         
-        if args.output:
-            out_path = args.output
-        else:
-            ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-            out_path = f"merged_backup_{ts}.tachibk"
-            
-        save_backup(merged, out_path)
+        try:
+            # Inputs that turn out to be corrupt part way through are skipped
+            with open_writer(out_path, BackupFormat.SY, args) as writer:
+                merge_backups(loaded, writer=writer)
+        except ValueError as e:
+            logging.error(str(e))
+            sys.exit(1)
+        finally:
+            for b, _ in loaded:
+                b.close()
+        if args.fuzzy:
+            fuzzy_dedupe(out_path, out_path, args.fuzzy, args)
         logging.info(f"Merge Complete! Saved to {out_path}")
 
+    elif args.command == "filter":
+        # Every option has to match
+        try:
+            parts = [parse_predicate(args.where)] if args.where else []
+            if args.source:
+                parts.append(SourceIn(args.source))
+            if args.favorite:
+                parts.append(Favorite())
+            if args.category:
+                parts.append(InCategory(args.category))
+            if args.genre:
+                parts.append(HasGenre(args.genre))
+            if args.updated_since:
+                parts.append(UpdatedSince(parse_date(args.updated_since)))
+            if args.min_read_ratio is not None or args.max_read_ratio is not None:
+                parts.append(ReadRatio(args.min_read_ratio, args.max_read_ratio))
+        except ValueError as e:
+            logging.error(str(e))
+            sys.exit(1)
+        if not parts:
+            logging.error("No filter given, see filter --help")
+            sys.exit(1)
+        predicate = parts[0] if len(parts) == 1 else And(parts)
+
+        out_path = args.output or os.path.join(os.path.dirname(args.input), f"filtered_{os.path.basename(args.input)}")
+        try:
+            with open_writer(out_path, resolve_format(args.input), args) as writer:
+                kept, total = filter_backup(args.input, predicate, writer)
+        except ValueError as e:
+            logging.error(str(e))
+            sys.exit(1)
+        logging.info(f"Saved {kept} of {total} manga to {out_path}")
+
+    elif args.command == "dedupe":
+        if args.report_only:
+            try:
+                report = dedupe_file(args.input, args.threshold)
+            except ValueError as e:
+                logging.error(str(e))
+                sys.exit(1)
+        else:
+            out_path = args.output or os.path.join(os.path.dirname(args.input), f"deduped_{os.path.basename(args.input)}")
+            report = fuzzy_dedupe(args.input, out_path, args.threshold, args)
+            logging.info(f"Saved to {out_path}")
+
+        if args.report:
+            with open(args.report, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+        else:
+            for group in report["groups"]:
+                keep = group["keep"]
+                print(f"{keep['title']} (source {keep['source']})")
+                for d in group["duplicates"]:
+                    print(f"  = {d['title']} (source {d['source']}, {d['score']:.2f})")
+        logging.info(f"{len(report['groups'])} series found on several sources, "
+                     f"{report['removed']} of {report['manga']} manga {'would be ' if args.report_only else ''}folded")
+
+    elif args.command == "batch":
+        if args.manifest:
+            try:
+                jobs = read_manifest(args.manifest)
+            except (OSError, ValueError) as e:
+                logging.error(str(e))
+                sys.exit(1)
+        else:
+            if args.op == "convert" and not args.target:
+                logging.error("batch --op convert needs --target")
+                sys.exit(1)
+            paths = find_backups(args.sources)
+            if args.op == "convert":
+                os.makedirs(args.output_dir, exist_ok=True)
+            jobs = jobs_for_paths(paths, args.op, args.output_dir, args.target, args.output,
+                                  args.compress_level, args.threads)
+        if not jobs:
+            logging.error("Nothing to do")
+            sys.exit(1)
+        try:
+            for job in jobs:
+                if job.output:
+                    check_level(codec_for_path(job.output), job.compress_level)
+        except ValueError as e:
+            logging.error(f"{job.output}: {e}")
+            sys.exit(1)
+
+        logging.info(f"Running {len(jobs)} jobs on {args.jobs} workers...")
+        report = run_batch(jobs, args.jobs, args.timeout, args.queue, args.fail_fast)
+        text = json.dumps(report, indent=2)
+        if args.report:
+            with open(args.report, "w", encoding="utf-8") as f:
+                f.write(text)
+        else:
+            print(text)
+        logging.info(f"Batch done in {report['seconds']}s: {report['ok']} ok, {report['error']} failed, "
+                     f"{report['timeout']} timed out, {report['skipped']} skipped")
+        if report["ok"] != report["total"]:
+            sys.exit(1)
+
+    elif args.command == "export":
+        from .columnar import build_tables, export_tables
+        paths = find_backups(args.sources)
+        logging.info(f"Exporting {len(paths)} backups...")
+        tables = build_tables(paths)
+        if not tables.files:
+            logging.error("No valid backups loaded")
+            sys.exit(1)
+        try:
+            fmt = export_tables(tables, args.output, args.format)
+        except ValueError as e:
+            logging.error(str(e))
+            sys.exit(1)
+        chapters = len(tables.columns["chapters"]["manga"])
+        logging.info(f"Exported {len(tables)} manga and {chapters} chapters as {fmt} to {args.output}")
+
+    elif args.command == "stats":
+        from .columnar import build_tables, library_stats, load_tables
+        if len(args.sources) == 1 and os.path.isdir(args.sources[0]) and \
+                os.path.exists(os.path.join(args.sources[0], "dictionaries.json")):
+            try:
+                tables = load_tables(args.sources[0])
+            except (OSError, ValueError) as e:
+                logging.error(str(e))
+                sys.exit(1)
+        else:
+            tables = build_tables(find_backups(args.sources))
+        stats = library_stats(tables)
+        if args.json:
+            print(json.dumps(stats, indent=2))
+            return
+
+        print(f"\n=== General Stats ===")
+        print(f"Backups           : {stats['files']}")
+        print(f"Total Manga       : {stats['manga']}")
+        print(f"Favorites         : {stats['favorites']}")
+        print(f"Tracked           : {stats['tracked']}")
+        if stats["chapters"]:
+            print(f"\n=== Chapters ===")
+            print(f"Total Chapters    : {stats['chapters']}")
+            print(f"Average per Manga : {stats['chapters'] / stats['manga']:.1f}")
+            print(f"Max Chapters      : {stats['max_chapters']}")
+            print(f"Read              : {stats['read_chapters']} ({stats['read_ratio']:.1%})")
+            print(f"Reading Time      : {stats['read_hours']:.1f} h")
+            if stats["median_upload_gap_days"] is not None:
+                print(f"Upload Cadence    : every {stats['median_upload_gap_days']:.1f} days (median)")
+
+        print(f"\n=== Sources Used ===")
+        for s in stats["sources"]:
+            name = s["name"] or f"ID: {s['source']}"
+            print(f"  - {name:<20} : {s['manga']} manga, {s['chapters']} chapters, {s['read']} read")
+
+        if stats["top_genres"]:
+            print(f"\n=== Top Genres ===")
+            for g, c in stats["top_genres"]:
+                print(f"  - {g:<20} : {c}")
+
+    elif args.command == "cache":
+        if not cache:
+            logging.error("No cache directory configured (use --cache-dir or BACKUP_TOOL_CACHE)")
+            sys.exit(1)
+        if args.action == "list":
+            entries = sorted(cache.entries(), key=lambda e: e.last_used, reverse=True)
+            for e in entries:
+                used = datetime.fromtimestamp(e.last_used).strftime("%Y-%m-%d %H:%M")
+                print(f"  {os.path.basename(e.path):<46} {e.size / 1024:>10.1f} KiB  last used {used}")
+            print(f"{len(entries)} indexes, {sum(e.size for e in entries) / 2**20:.1f} MiB")
+        else:
+            limit = 0 if args.action == "clear" else args.max_size
+            removed, freed = cache.evict(limit)
+            logging.info(f"Evicted {removed} indexes ({freed / 2**20:.1f} MiB)")
+
 if __name__ == "__main__":
     main()
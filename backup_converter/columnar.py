@@ -0,0 +1,400 @@
+import ast
+import json
+import logging
+import os
+import struct
+import sys
+from array import array
+from typing import Dict, List, Optional
+
+from . import trace
+from .converter import convert_bytes
+from .core import READ_ERRORS
+from .schemas import sy_pb2
+from .stream import open_backup
+
+try:
+    import numpy
+except ImportError:  # optional, only makes the aggregates faster
+    numpy = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # optional, .npy files are written without it
+    pyarrow = None
+
+# Columnar export.
+#
+# Analytics over many backups (read ratios, per-source chapter counts, upload
+# cadence, ...) don't need protobuf messages, just a few numbers per manga and
+# per chapter. `export` flattens backups once into tables of typed columns:
+#   manga     one row per manga (file, source, url, favorite, counts, dates)
+#   chapters  one row per chapter, `manga` is the row in the manga table
+#   history, tracking, genres   same, one row per entry
+# Source ids, urls and genres are integer-coded, with the dictionaries stored
+# next to the tables. Columns are plain array.array while building and are
+# written as Parquet (with pyarrow) or one .npy file per column, which is
+# written here directly so numpy isn't needed for it either.
+#
+# library_stats() computes the `info` statistics (and a few more) from the
+# tables. With numpy installed (optional, see README) each figure is one
+# numpy call over a whole column; without it the same figures come from plain
+# Python loops over the columns, which is slower on big exports.
+
+PARQUET = "parquet"
+NPY = "npy"
+
+# table -> [(column, array typecode)]
+TABLES = {
+    "manga": [
+        ("file", "i"), ("source", "i"), ("url", "i"), ("favorite", "B"), ("status", "i"),
+        ("date_added", "q"), ("last_modified", "q"), ("chapters", "i"), ("read", "i"),
+    ],
+    "chapters": [
+        ("manga", "i"), ("read", "B"), ("bookmark", "B"), ("last_page_read", "q"),
+        ("date_fetch", "q"), ("date_upload", "q"), ("chapter_number", "f"), ("source_order", "q"),
+    ],
+    "history": [("manga", "i"), ("last_read", "q"), ("read_duration", "q")],
+    "tracking": [
+        ("manga", "i"), ("sync_id", "i"), ("status", "i"), ("score", "f"),
+        ("last_chapter_read", "f"), ("total_chapters", "i"),
+    ],
+    "genres": [("manga", "i"), ("genre", "i")],
+}
+DICTIONARIES_FILE = "dictionaries.json"
+
+_NPY_DTYPES = {"i": "<i4", "q": "<i8", "B": "|u1", "f": "<f4"}
+_NPY_TYPECODES = {v: k for k, v in _NPY_DTYPES.items()}
+_ARROW_TYPES = {"i": "int32", "q": "int64", "B": "uint8", "f": "float32"}
+_MS_PER_DAY = 24 * 60 * 60 * 1000
+
+
+class _Dictionary:
+    # value -> code, codes assigned in first-seen order
+    def __init__(self, values=()):
+        self.values: List = []
+        self.codes: Dict = {}
+        for value in values:
+            self.code(value)
+
+    def code(self, value) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def __len__(self):
+        return len(self.values)
+
+    def truncate(self, size: int):
+        # Forgets the values added after the first `size`
+        for value in self.values[size:]:
+            del self.codes[value]
+        del self.values[size:]
+
+
+class LibraryTables:
+    """Columnar tables of one or more backups (see above)."""
+
+    def __init__(self):
+        self.columns: Dict[str, Dict] = {
+            table: {name: array(typecode) for name, typecode in columns}
+            for table, columns in TABLES.items()
+        }
+        self.files: List[str] = []
+        self.sources = _Dictionary()
+        self.source_names: Dict[int, str] = {}
+        self.urls = _Dictionary()
+        self.genres = _Dictionary()
+
+    def __len__(self) -> int:
+        return len(self.columns["manga"]["file"])
+
+    def add_backup(self, path: str) -> bool:
+        """Appends the rows of one backup. Returns False if it can't be loaded."""
+        reader = open_backup(path)
+        if not reader:
+            return False
+        sizes = self._sizes()
+        try:
+            with reader:
+                self._add_rows(reader, len(self.files))
+        except READ_ERRORS as e:
+            # Truncated or corrupt part way through: drop the rows it got to add
+            logging.error(f"Failed to load {path}: {e}")
+            self._truncate(sizes)
+            return False
+        self.files.append(path)
+        return True
+
+    def _sizes(self) -> tuple:
+        columns = {table: {name: len(column) for name, column in table_cols.items()}
+                   for table, table_cols in self.columns.items()}
+        return columns, len(self.sources), len(self.urls), len(self.genres)
+
+    def _truncate(self, sizes: tuple):
+        columns, sources, urls, genres = sizes
+        for table, table_sizes in columns.items():
+            for name, size in table_sizes.items():
+                del self.columns[table][name][size:]
+        self.sources.truncate(sources)
+        self.urls.truncate(urls)
+        self.genres.truncate(genres)
+
+    def _add_rows(self, reader, file_code: int):
+        manga_cols = self.columns["manga"]
+        chapter_cols = self.columns["chapters"]
+        history_cols = self.columns["history"]
+        tracking_cols = self.columns["tracking"]
+        genre_cols = self.columns["genres"]
+        src_desc = reader.schema.BackupManga.DESCRIPTOR
+        dst_desc = sy_pb2.BackupManga.DESCRIPTOR
+        manga = sy_pb2.BackupManga()
+
+        # Every fork read as SY, so the field names are the same for all
+        for payload in reader.iter_raw_manga():
+            manga.Clear()
+            manga.ParseFromString(convert_bytes(payload, src_desc, dst_desc))
+            row = len(manga_cols["file"])
+            read = 0
+            for chapter in manga.chapters:
+                read += chapter.read
+                chapter_cols["manga"].append(row)
+                chapter_cols["read"].append(chapter.read)
+                chapter_cols["bookmark"].append(chapter.bookmark)
+                chapter_cols["last_page_read"].append(chapter.lastPageRead)
+                chapter_cols["date_fetch"].append(chapter.dateFetch)
+                chapter_cols["date_upload"].append(chapter.dateUpload)
+                chapter_cols["chapter_number"].append(chapter.chapterNumber)
+                chapter_cols["source_order"].append(chapter.sourceOrder)
+            for history in manga.history:
+                history_cols["manga"].append(row)
+                history_cols["last_read"].append(history.lastRead)
+                history_cols["read_duration"].append(history.readDuration)
+            for track in manga.tracking:
+                tracking_cols["manga"].append(row)
+                tracking_cols["sync_id"].append(track.syncId)
+                tracking_cols["status"].append(track.status)
+                tracking_cols["score"].append(track.score)
+                tracking_cols["last_chapter_read"].append(track.lastChapterRead)
+                tracking_cols["total_chapters"].append(track.totalChapters)
+            for genre in manga.genre:
+                genre_cols["manga"].append(row)
+                genre_cols["genre"].append(self.genres.code(genre))
+
+            manga_cols["file"].append(file_code)
+            manga_cols["source"].append(self.sources.code(manga.source))
+            manga_cols["url"].append(self.urls.code(manga.url))
+            manga_cols["favorite"].append(manga.favorite)
+            manga_cols["status"].append(manga.status)
+            manga_cols["date_added"].append(manga.dateAdded)
+            manga_cols["last_modified"].append(manga.lastModifiedAt)
+            manga_cols["chapters"].append(len(manga.chapters))
+            manga_cols["read"].append(read)
+
+        for source in getattr(reader.finish(), "backupSources", []):
+            if source.name:
+                self.source_names.setdefault(source.sourceId, source.name)
+
+    def _dictionaries(self) -> dict:
+        return {
+            "files": self.files,
+            "sources": [[sid, self.source_names.get(sid, "")] for sid in self.sources.values],
+            "urls": self.urls.values,
+            "genres": self.genres.values,
+        }
+
+    def _set_dictionaries(self, data: dict):
+        self.files = data["files"]
+        self.sources = _Dictionary(sid for sid, _ in data["sources"])
+        self.source_names = {sid: name for sid, name in data["sources"] if name}
+        self.urls = _Dictionary(data["urls"])
+        self.genres = _Dictionary(data["genres"])
+
+
+def build_tables(paths: List[str]) -> LibraryTables:
+    tables = LibraryTables()
+    for path in paths:
+        with trace.stage("export_input", file=path) as st:
+            rows = len(tables)
+            if not tables.add_backup(path):
+                logging.error(f"Skipping {path}: could not be loaded")
+            st.count(len(tables) - rows)
+    return tables
+
+
+def _write_npy(path: str, column: array):
+    # .npy format 1.0: magic, header length, header dict padded to 64 bytes, data
+    header = f"{{'descr': '{_NPY_DTYPES[column.typecode]}', 'fortran_order': False, 'shape': ({len(column)},), }}"
+    header += " " * (-(10 + len(header) + 1) % 64) + "\n"
+    if sys.byteorder != "little":
+        column = array(column.typecode, column)
+        column.byteswap()
+    with open(path, "wb") as f:
+        f.write(b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1"))
+        f.write(column.tobytes())
+
+
+def _read_npy(path: str):
+    if numpy is not None:
+        return numpy.load(path, mmap_mode="r")
+    with open(path, "rb") as f:
+        if f.read(8)[:6] != b"\x93NUMPY":
+            raise ValueError(f"{path}: not a .npy file")
+        (header_len,) = struct.unpack("<H", f.read(2))
+        header = ast.literal_eval(f.read(header_len).decode("latin1"))
+        column = array(_NPY_TYPECODES[header["descr"]])
+        column.frombytes(f.read())
+    if sys.byteorder != "little":
+        column.byteswap()
+    return column
+
+
+def _arrow_array(column: array):
+    # Wraps the column's buffer, without going through Python objects
+    arrow_type = getattr(pyarrow, _ARROW_TYPES[column.typecode])()
+    return pyarrow.Array.from_buffers(arrow_type, len(column), [None, pyarrow.py_buffer(column)])
+
+
+def export_tables(tables: LibraryTables, directory: str, fmt: Optional[str] = None) -> str:
+    """
+    Writes `tables` into `directory` as Parquet (one file per table) or .npy
+    (one file per column, <table>.<column>.npy). `fmt` defaults to Parquet if
+    pyarrow is installed. Returns the format used.
+    """
+    fmt = fmt or (PARQUET if pyarrow is not None else NPY)
+    if fmt == PARQUET and pyarrow is None:
+        raise ValueError("Parquet export needs pyarrow (pip install pyarrow)")
+    os.makedirs(directory, exist_ok=True)
+
+    for table, columns in tables.columns.items():
+        if fmt == PARQUET:
+            arrow_table = pyarrow.table({name: _arrow_array(column) for name, column in columns.items()})
+            pyarrow.parquet.write_table(arrow_table, os.path.join(directory, f"{table}.parquet"))
+        else:
+            for name, column in columns.items():
+                _write_npy(os.path.join(directory, f"{table}.{name}.npy"), column)
+
+    tmp = os.path.join(directory, f"{DICTIONARIES_FILE}.tmp{os.getpid()}")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(dict(tables._dictionaries(), format=fmt), f)
+    os.replace(tmp, os.path.join(directory, DICTIONARIES_FILE))
+    return fmt
+
+
+def load_tables(directory: str) -> LibraryTables:
+    """Reads tables written by export_tables. Columns are numpy arrays if numpy is installed."""
+    with open(os.path.join(directory, DICTIONARIES_FILE), "r", encoding="utf-8") as f:
+        data = json.load(f)
+    tables = LibraryTables()
+    tables._set_dictionaries(data)
+    for table, columns in TABLES.items():
+        if data.get("format") == PARQUET:
+            if pyarrow is None:
+                raise ValueError(f"{directory} holds Parquet files, reading them needs pyarrow")
+            arrow_table = pyarrow.parquet.read_table(os.path.join(directory, f"{table}.parquet"))
+            for name, typecode in columns:
+                values = arrow_table.column(name)
+                tables.columns[table][name] = values.to_numpy() if numpy is not None else array(typecode, values.to_pylist())
+        else:
+            for name, _ in columns:
+                tables.columns[table][name] = _read_npy(os.path.join(directory, f"{table}.{name}.npy"))
+    return tables
+
+
+# Aggregates over whole columns. With numpy these run in C; the fallbacks
+# loop over the values in Python, so stats work without it, only slower.
+
+def _counts(codes, size: int, weights=None) -> List[int]:
+    if numpy is not None:
+        counts = numpy.bincount(numpy.asarray(codes, dtype=numpy.int64), weights=weights, minlength=size)
+        return [int(c) for c in counts]
+    counts = [0] * size
+    if weights is None:
+        for code in codes:
+            counts[code] += 1
+    else:
+        for code, weight in zip(codes, weights):
+            counts[code] += weight
+    return counts
+
+
+def _total(column) -> int:
+    if numpy is not None:
+        return int(numpy.asarray(column, dtype=numpy.int64).sum())
+    return sum(column)
+
+
+def _median_upload_gap(manga, uploads) -> Optional[float]:
+    # Median days between consecutive chapter uploads of the same manga
+    if numpy is not None:
+        manga = numpy.asarray(manga)
+        uploads = numpy.asarray(uploads)
+        known = uploads > 0
+        manga, uploads = manga[known], uploads[known]
+        if len(uploads) < 2:
+            return None
+        order = numpy.lexsort((uploads, manga))
+        manga, uploads = manga[order], uploads[order]
+        same = manga[1:] == manga[:-1]
+        gaps = (uploads[1:] - uploads[:-1])[same]
+        return float(numpy.median(gaps)) / _MS_PER_DAY if len(gaps) else None
+
+    by_manga: Dict[int, List[int]] = {}
+    for m, upload in zip(manga, uploads):
+        if upload > 0:
+            by_manga.setdefault(m, []).append(upload)
+    gaps = []
+    for dates in by_manga.values():
+        dates.sort()
+        gaps.extend(b - a for a, b in zip(dates, dates[1:]))
+    if not gaps:
+        return None
+    gaps.sort()
+    mid = len(gaps) // 2
+    median = gaps[mid] if len(gaps) % 2 else (gaps[mid - 1] + gaps[mid]) / 2
+    return median / _MS_PER_DAY
+
+
+def library_stats(tables: LibraryTables) -> dict:
+    """The `info` statistics of all backups in `tables`, plus read and upload figures."""
+    manga = tables.columns["manga"]
+    chapters = tables.columns["chapters"]
+    count = len(manga["file"])
+    total_chapters = len(chapters["manga"])
+    read_chapters = _total(manga["read"])
+    n_sources = len(tables.sources)
+
+    per_source_manga = _counts(manga["source"], n_sources)
+    per_source_chapters = _counts(manga["source"], n_sources, weights=manga["chapters"])
+    per_source_read = _counts(manga["source"], n_sources, weights=manga["read"])
+    sources = []
+    for code in sorted(range(n_sources), key=lambda c: -per_source_manga[c]):
+        source_id = tables.sources.values[code]
+        sources.append({
+            "source": source_id,
+            "name": tables.source_names.get(source_id, ""),
+            "manga": per_source_manga[code],
+            "chapters": per_source_chapters[code],
+            "read": per_source_read[code],
+        })
+
+    genre_counts = _counts(tables.columns["genres"]["genre"], len(tables.genres))
+    top_genres = sorted(range(len(genre_counts)), key=lambda c: -genre_counts[c])[:5]
+
+    return {
+        "files": len(tables.files),
+        "manga": count,
+        "favorites": _total(manga["favorite"]),
+        "chapters": total_chapters,
+        "max_chapters": max(manga["chapters"]) if count else 0,
+        "read_chapters": read_chapters,
+        "read_ratio": read_chapters / total_chapters if total_chapters else 0.0,
+        "read_hours": _total(tables.columns["history"]["read_duration"]) / 3_600_000,
+        "median_upload_gap_days": _median_upload_gap(chapters["manga"], chapters["date_upload"]),
+        "tracked": len(set(tables.columns["tracking"]["manga"])),
+        "sources": sources,
+        "top_genres": [(tables.genres.values[c], genre_counts[c]) for c in top_genres if genre_counts[c]],
+    }
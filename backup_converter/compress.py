@@ -0,0 +1,200 @@
+import gzip
+import io
+import os
+import struct
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+try:
+    import zstandard
+except ImportError:  # optional, only needed for .zst working files
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # optional, only needed for .lz4 working files
+    lz4_frame = None
+
+# Compression backends.
+#
+# Backups that go back to a device must be gzip, which is what all the apps
+# read. Compressing a large merged backup at level 9 on one core is by far the
+# slowest part of a merge, so gzip output can be compressed on several threads
+# the way pigz does it: the stream is cut into blocks, each block is deflated
+# on its own (primed with the last 32 KiB of the previous block, so the ratio
+# barely changes) and ended with a sync flush, which makes the compressed
+# blocks concatenate into one ordinary deflate stream. The result is a single
+# regular gzip member. zlib releases the GIL while compressing, so plain
+# threads are enough.
+#
+# Intermediate files that never leave the machine can use zstd or lz4 instead
+# (picked by the .zst / .lz4 extension), which are much faster than gzip at a
+# similar ratio. Reading detects the codec from the file's magic bytes.
+
+GZIP = "gzip"
+ZSTD = "zstd"
+LZ4 = "lz4"
+
+# gzip.open's default, what backups have always been written with
+DEFAULT_GZIP_LEVEL = 9
+BLOCK_SIZE = 1 << 20
+# Accepted compression levels per codec (zstd's negative "fast" levels aren't offered)
+LEVELS = {GZIP: (0, 9), ZSTD: (1, 22), LZ4: (0, 16)}
+_WINDOW = 32 * 1024
+
+_MAGIC = {
+    b"\x1f\x8b": GZIP,
+    b"\x28\xb5\x2f\xfd": ZSTD,
+    b"\x04\x22\x4d\x18": LZ4,
+}
+_EXTENSIONS = {".zst": ZSTD, ".zstd": ZSTD, ".lz4": LZ4}
+_PACKAGES = {ZSTD: "zstandard", LZ4: "lz4"}
+
+# Exceptions the optional decompressors raise on corrupt input
+DECOMPRESS_ERRORS = (OSError, EOFError, zlib.error) + (
+    (zstandard.ZstdError,) if zstandard is not None else ()
+)
+
+
+def codec_for_path(path: str) -> str:
+    """Output codec for `path`: zstd/lz4 by extension, gzip for everything else."""
+    return _EXTENSIONS.get(os.path.splitext(path)[1].lower(), GZIP)
+
+
+def codec_available(codec: str) -> bool:
+    if codec == ZSTD:
+        return zstandard is not None
+    if codec == LZ4:
+        return lz4_frame is not None
+    return True
+
+
+def _require(codec: str, path: str):
+    if not codec_available(codec):
+        raise OSError(f"{path}: {codec} support needs the '{_PACKAGES[codec]}' package (pip install {_PACKAGES[codec]})")
+
+
+def detect_codec(path: str) -> Optional[str]:
+    with open(path, "rb") as f:
+        head = f.read(4)
+    for magic, codec in _MAGIC.items():
+        if head.startswith(magic):
+            return codec
+    return None
+
+
+def open_read(path: str):
+    """
+    Opens a compressed backup for reading. The returned file supports read,
+    peek, tell and (forward) seek in decompressed offsets.
+    """
+    codec = detect_codec(path)
+    if codec == ZSTD:
+        _require(codec, path)
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+        return io.BufferedReader(reader)
+    if codec == LZ4:
+        _require(codec, path)
+        return lz4_frame.open(path, "rb")
+    # Not compressed at all (or not gzip) fails on the first read, as before
+    return gzip.open(path, "rb")
+
+
+def check_level(codec: str, level: Optional[int]):
+    """Raises ValueError if `level` isn't one of `codec`'s levels. None means the default."""
+    if level is None:
+        return
+    low, high = LEVELS[codec]
+    if not isinstance(level, int) or not low <= level <= high:
+        raise ValueError(f"Compression level {level!r} is out of range for {codec} ({low}-{high})")
+
+
+def open_write(path: str, codec: Optional[str] = None, level: Optional[int] = None, threads: int = 1):
+    """
+    Opens `path` for writing compressed data. `codec` defaults to the one
+    implied by the extension; `level` to the codec's default (9 for gzip).
+    """
+    codec = codec or codec_for_path(path)
+    _require(codec, path)
+    check_level(codec, level)
+    if codec == ZSTD:
+        params = {"threads": threads if threads > 1 else 0}
+        if level is not None:
+            params["level"] = level
+        compressor = zstandard.ZstdCompressor(**params)
+        return compressor.stream_writer(open(path, "wb"), closefd=True)
+    if codec == LZ4:
+        return lz4_frame.open(path, "wb", compression_level=level or 0)
+
+    level = DEFAULT_GZIP_LEVEL if level is None else level
+    if threads > 1:
+        return ParallelGzipWriter(path, level, threads)
+    return gzip.open(path, "wb", compresslevel=level)
+
+
+def _deflate_block(data: bytes, level: int, dictionary: bytes, last: bool) -> bytes:
+    if dictionary:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL, 0, dictionary)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+class ParallelGzipWriter(io.RawIOBase):
+    """
+    Writes a single-member gzip file, deflating blocks of BLOCK_SIZE bytes on
+    `threads` threads. At most 2 * threads blocks are in flight, and blocks are
+    written in order, so memory stays bounded and the output is deterministic.
+    """
+
+    def __init__(self, path: str, level: int = DEFAULT_GZIP_LEVEL, threads: int = 2, block_size: int = BLOCK_SIZE):
+        self.path = path
+        self.level = level
+        self.block_size = block_size
+        self._file = open(path, "wb")
+        self._pool = ThreadPoolExecutor(max_workers=threads)
+        self._max_pending = 2 * threads
+        self._pending = deque()
+        self._buffer = bytearray()
+        self._previous = b""
+        self._crc = 0
+        self._size = 0
+        # gzip header: deflate, no name, mtime, xfl 2 (max compression) / 4 (fastest), OS unknown
+        xfl = 2 if level == 9 else 4 if level == 1 else 0
+        self._file.write(struct.pack("<BBBBIBB", 0x1F, 0x8B, 8, 0, int(time.time()), xfl, 255))
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        while len(self._buffer) >= self.block_size:
+            block = bytes(self._buffer[:self.block_size])
+            del self._buffer[:self.block_size]
+            self._submit(block, last=False)
+        return len(data)
+
+    def _submit(self, block: bytes, last: bool):
+        self._crc = zlib.crc32(block, self._crc)
+        self._size += len(block)
+        self._pending.append(self._pool.submit(_deflate_block, block, self.level, self._previous, last))
+        self._previous = block[-_WINDOW:]
+        while len(self._pending) >= self._max_pending:
+            self._file.write(self._pending.popleft().result())
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self._submit(bytes(self._buffer), last=True)
+            self._buffer = bytearray()
+            while self._pending:
+                self._file.write(self._pending.popleft().result())
+            self._file.write(struct.pack("<II", self._crc, self._size & 0xFFFFFFFF))
+        finally:
+            self._pool.shutdown()
+            self._file.close()
+            super().close()
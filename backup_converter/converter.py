@@ -0,0 +1,284 @@
+import functools
+from typing import Dict, NamedTuple, Optional
+
+from google.protobuf import message_factory
+from google.protobuf.descriptor import Descriptor, FieldDescriptor
+from google.protobuf.message import Message
+
+from .wire import LENGTH_DELIMITED, VARINT, decode_varint, encode_tag, encode_varint, iter_fields
+
+# Direct descriptor-to-descriptor conversion.
+#
+# The forks (SY, Mihon, J2K, ...) share most of their field names, so instead of
+# round-tripping through a dict we build a small mapping table per
+# (source message, target message) pair and copy set fields straight across.
+# Tables are computed once and cached; fields the target doesn't know about (or
+# knows with an incompatible type) are simply dropped, same as the JSON path.
+
+# Kinds of copy operation, picked once when the table is built
+SCALAR = 0
+REPEATED_SCALAR = 1
+MESSAGE = 2
+REPEATED_MESSAGE = 3
+
+_INT_TYPES = {
+    FieldDescriptor.CPPTYPE_INT32,
+    FieldDescriptor.CPPTYPE_INT64,
+    FieldDescriptor.CPPTYPE_UINT32,
+    FieldDescriptor.CPPTYPE_UINT64,
+}
+_FLOAT_TYPES = {FieldDescriptor.CPPTYPE_FLOAT, FieldDescriptor.CPPTYPE_DOUBLE}
+
+
+class FieldMapping(NamedTuple):
+    name: str  # attribute name on the target message
+    kind: int
+    sub_map: Optional[Dict[int, "FieldMapping"]]  # for message fields
+
+
+def is_repeated(field: FieldDescriptor) -> bool:
+    # `label` is gone in newer protobuf releases, `is_repeated` is missing in older ones
+    label = getattr(field, "label", None)
+    if label is not None:
+        return label == FieldDescriptor.LABEL_REPEATED
+    return field.is_repeated
+
+
+def _types_compatible(src: FieldDescriptor, dst: FieldDescriptor) -> bool:
+    if src.cpp_type == dst.cpp_type:
+        return True
+    # int32 <-> int64 (e.g. J2K category order) and float <-> double are fine,
+    # enums are stored as plain ints on the wire too.
+    ints = _INT_TYPES | {FieldDescriptor.CPPTYPE_ENUM}
+    if src.cpp_type in ints and dst.cpp_type in ints:
+        return True
+    return src.cpp_type in _FLOAT_TYPES and dst.cpp_type in _FLOAT_TYPES
+
+
+@functools.lru_cache(maxsize=None)
+def get_field_map(src_desc: Descriptor, dst_desc: Descriptor) -> Dict[int, FieldMapping]:
+    """
+    Returns the mapping table for copying `src_desc` messages into `dst_desc` messages,
+    keyed by source field number. Fields are matched by name (like the JSON path did).
+    """
+    table: Dict[int, FieldMapping] = {}
+    for src_field in src_desc.fields:
+        dst_field = dst_desc.fields_by_name.get(src_field.name)
+        if dst_field is None or is_repeated(src_field) != is_repeated(dst_field):
+            continue
+
+        repeated = is_repeated(src_field)
+        if src_field.cpp_type == FieldDescriptor.CPPTYPE_MESSAGE:
+            if dst_field.cpp_type != FieldDescriptor.CPPTYPE_MESSAGE:
+                continue
+            # Self-referencing messages would recurse forever here; none of the
+            # backup schemas have them.
+            sub_map = get_field_map(src_field.message_type, dst_field.message_type)
+            kind = REPEATED_MESSAGE if repeated else MESSAGE
+            table[src_field.number] = FieldMapping(dst_field.name, kind, sub_map)
+        elif _types_compatible(src_field, dst_field):
+            kind = REPEATED_SCALAR if repeated else SCALAR
+            table[src_field.number] = FieldMapping(dst_field.name, kind, None)
+    return table
+
+
+def _copy(src: Message, dst: Message, table: Dict[int, FieldMapping]):
+    # ListFields() only returns populated fields, so unset optionals stay unset
+    # and unknown fields are dropped.
+    for field, value in src.ListFields():
+        mapping = table.get(field.number)
+        if mapping is None:
+            continue
+        kind = mapping.kind
+        if kind == SCALAR:
+            setattr(dst, mapping.name, value)
+        elif kind == REPEATED_SCALAR:
+            getattr(dst, mapping.name).extend(value)
+        elif kind == REPEATED_MESSAGE:
+            container = getattr(dst, mapping.name)
+            sub_map = mapping.sub_map
+            for item in value:
+                _copy(item, container.add(), sub_map)
+        else:
+            sub = getattr(dst, mapping.name)
+            sub.SetInParent()
+            _copy(value, sub, mapping.sub_map)
+
+
+def copy_message(src: Message, dst: Message) -> Message:
+    """
+    Copies every field of `src` that has a compatible counterpart into `dst`.
+    `src` and `dst` may come from different schema modules.
+    """
+    plan = get_wire_plan(src.DESCRIPTOR, dst.DESCRIPTOR)
+    if plan.identical or plan.walk:
+        # Serializing and parsing happen in C, and most of the bytes in between
+        # are passed through untouched (see convert_bytes below)
+        dst.MergeFromString(convert_bytes(src.SerializePartialToString(), src.DESCRIPTOR, dst.DESCRIPTOR))
+    else:
+        _copy(src, dst, get_field_map(src.DESCRIPTOR, dst.DESCRIPTOR))
+    return dst
+
+
+def to_schema(msg: Message, schema_module) -> Message:
+    """
+    Returns `msg` as the same-named message type of `schema_module`,
+    converting only when it comes from a different schema.
+    """
+    dst_cls = getattr(schema_module, msg.DESCRIPTOR.name)
+    if msg.DESCRIPTOR is dst_cls.DESCRIPTOR:
+        return msg
+    return copy_message(msg, dst_cls())
+
+
+# Wire-level passthrough.
+#
+# Most messages are laid out identically on the wire in source and target
+# schema: same field numbers, same encodings, e.g. BackupChapter in every
+# SY/Mihon/Komikku pair. Decoding those only to encode the same bytes again is
+# where the conversion time goes, chapters being most of a backup. So for
+# serialized input, a per-pair wire plan says what to do with each source field:
+#   - PASS: copy its bytes as they are (also int32 -> int64, enum -> int)
+#   - NARROW: int64 -> int32, copied as is after checking the value fits
+#   - NESTED: submessage that differs, rewritten recursively
+#   - DECODE: anything else (float <-> double, ...), converted through get_field_map
+# Fields the target doesn't have are dropped, like copy_message does. A message
+# whose fields are all PASS is copied whole; protobuf keeps unknown fields
+# when re-serializing too, so those come along in that case.
+#
+# Walking the fields happens in Python, which is slower than parsing in C and
+# copying with get_field_map unless it gets to skip submessages. So a message
+# is only rewritten on the wire when each of its submessages can be copied
+# whole or rewritten the same way, e.g. SY -> Mihon manga, whose chapters are
+# identical. J2K and Yokai chapters differ from SY/Mihon ones and have no
+# submessages, so their manga are parsed and copied instead.
+
+PASS = 0
+NARROW = 1
+NESTED = 2
+DECODE = 3
+
+_INT32_MIN, _INT32_MAX = -(1 << 31), (1 << 31) - 1
+
+
+class FieldPlan(NamedTuple):
+    kind: int
+    tag: bytes  # encoded tag, for NESTED fields
+    sub_plan: Optional["WirePlan"]  # for NESTED fields
+
+
+class WirePlan(NamedTuple):
+    src_desc: Descriptor
+    dst_desc: Descriptor
+    # Source field number -> FieldPlan; fields not in here are dropped
+    fields: Dict[int, FieldPlan]
+    # Every field passes through, the message bytes can be copied whole
+    identical: bool
+    # Rewritten by walking its fields (see above), otherwise parsed and copied
+    walk: bool
+
+
+def _wire_kind(src: FieldDescriptor, dst: FieldDescriptor) -> int:
+    if src.number != dst.number:
+        return DECODE
+    if src.type == dst.type:
+        if src.type != FieldDescriptor.TYPE_ENUM:
+            return PASS
+        dst_values = set(dst.enum_type.values_by_number)
+        return PASS if set(src.enum_type.values_by_number) <= dst_values else DECODE
+    # int32 values (enums are int32 on the wire) are sign-extended to 64 bits
+    # when encoded, so int64 reads them unchanged. The other way around only
+    # works for values that fit.
+    int32_like = (FieldDescriptor.TYPE_INT32, FieldDescriptor.TYPE_ENUM)
+    if src.type in int32_like and dst.type in (FieldDescriptor.TYPE_INT32, FieldDescriptor.TYPE_INT64):
+        return PASS
+    if src.type == FieldDescriptor.TYPE_INT64 and dst.type == FieldDescriptor.TYPE_INT32:
+        return NARROW
+    return DECODE
+
+
+@functools.lru_cache(maxsize=None)
+def get_wire_plan(src_desc: Descriptor, dst_desc: Descriptor) -> WirePlan:
+    """Wire plan for rewriting serialized `src_desc` messages as `dst_desc` (see above)."""
+    table = get_field_map(src_desc, dst_desc)
+    fields: Dict[int, FieldPlan] = {}
+    has_messages = False
+    walk = True
+    for src_field in src_desc.fields:
+        if src_field.number not in table:
+            continue  # dropped
+        dst_field = dst_desc.fields_by_name[src_field.name]
+        sub_plan = None
+        if src_field.cpp_type == FieldDescriptor.CPPTYPE_MESSAGE:
+            has_messages = True
+            kind = DECODE
+            if src_field.number == dst_field.number:
+                sub_plan = get_wire_plan(src_field.message_type, dst_field.message_type)
+                if sub_plan.identical:
+                    kind = PASS
+                elif sub_plan.walk:
+                    kind = NESTED
+            walk = walk and kind != DECODE
+        else:
+            kind = _wire_kind(src_field, dst_field)
+        tag = encode_tag(src_field.number, LENGTH_DELIMITED) if kind == NESTED else b""
+        fields[src_field.number] = FieldPlan(kind, tag, sub_plan)
+
+    identical = len(fields) == len(src_desc.fields) and all(f.kind == PASS for f in fields.values())
+    return WirePlan(src_desc, dst_desc, fields, identical, walk and has_messages)
+
+
+def _decode_field(plan: WirePlan, raw) -> bytes:
+    # Slow path for one field (or a whole message): parse it as a partial
+    # source message and convert
+    src = message_factory.GetMessageClass(plan.src_desc).FromString(bytes(raw))
+    dst = message_factory.GetMessageClass(plan.dst_desc)()
+    _copy(src, dst, get_field_map(plan.src_desc, plan.dst_desc))
+    return dst.SerializePartialToString()
+
+
+def _rewrite(buf: memoryview, start: int, end: int, plan: WirePlan, out: bytearray):
+    fields = plan.fields
+    field_start = start
+    for number, wire_type, value_start, value_end in iter_fields(buf, start, end):
+        field = fields.get(number)
+        if field is None:
+            pass  # not in the target (or unknown), dropped
+        elif field.kind == PASS:
+            out += buf[field_start:value_end]
+        elif field.kind == NESTED and wire_type == LENGTH_DELIMITED:
+            inner = bytearray()
+            _rewrite(buf, value_start, value_end, field.sub_plan, inner)
+            out += field.tag
+            out += encode_varint(len(inner))
+            out += inner
+        elif field.kind == NARROW and wire_type == VARINT:
+            value, _ = decode_varint(buf, value_start)
+            if value >= 1 << 63:
+                value -= 1 << 64
+            if not _INT32_MIN <= value <= _INT32_MAX:
+                name = plan.src_desc.fields_by_number[number].name
+                raise ValueError(f"Value {value} of {plan.src_desc.name}.{name} is out of range for the target")
+            out += buf[field_start:value_end]
+        else:
+            # DECODE, or an encoding the plan didn't expect (packed repeated ints)
+            out += _decode_field(plan, buf[field_start:value_end])
+        field_start = value_end
+
+
+def convert_bytes(payload: bytes, src_desc: Descriptor, dst_desc: Descriptor) -> bytes:
+    """
+    Converts a serialized `src_desc` message into a serialized `dst_desc`
+    message. Same result as parsing, copy_message and serializing, but fields
+    that are encoded the same way in both schemas are copied as bytes.
+    """
+    if src_desc is dst_desc:
+        return payload
+    plan = get_wire_plan(src_desc, dst_desc)
+    if plan.identical:
+        return payload
+    if not plan.walk:
+        return _decode_field(plan, payload)
+    out = bytearray()
+    _rewrite(memoryview(payload), 0, len(payload), plan, out)
+    return bytes(out)
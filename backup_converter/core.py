@@ -1,10 +1,17 @@
 import logging
-import gzip
+import os
 import enum
+import re
+import importlib
+import sys
+from collections.abc import Mapping
 from typing import Optional, List, Dict, Type, Any
-from google.protobuf.message import Message
-from google.protobuf import json_format
-from .schemas import sy_pb2, mihon_pb2, j2k_pb2
+from google.protobuf.message import DecodeError, Message
+from .compress import DECOMPRESS_ERRORS, open_read
+from .converter import convert_bytes, copy_message, to_schema
+from .merge import MangaUnion, MergedTables, merge_categories
+from .sniff import sniff_format
+from . import trace
 
 # Default to SY as the "superset" schema for internal representation if possible,
 # allows preserving the most data during merge.
@@ -15,52 +22,172 @@ class BackupFormat(enum.Enum):
     MIHON = "mihon"
     NEKO = "neko" # Treated as SY
     J2K = "j2k"
+    KOMIKKU = "komikku"
+    YOKAI = "yokai"
 
-SCHEMA_MAP = {
-    BackupFormat.SY: sy_pb2,
-    BackupFormat.NEKO: sy_pb2,
-    BackupFormat.MIHON: mihon_pb2,
-    BackupFormat.J2K: j2k_pb2,
+# Generated module in .schemas per format
+SCHEMA_MODULES = {
+    BackupFormat.SY: "sy_pb2",
+    BackupFormat.NEKO: "sy_pb2",
+    BackupFormat.MIHON: "mihon_pb2",
+    BackupFormat.J2K: "j2k_pb2",
+    BackupFormat.KOMIKKU: "komikku_pb2",
+    BackupFormat.YOKAI: "yokai_pb2",
 }
 
+class _SchemaMap(Mapping):
+    # Importing a schema module builds all its descriptors, which is a good part
+    # of the CLI's startup time. So modules are only imported on first lookup.
+    def __getitem__(self, fmt: BackupFormat):
+        return importlib.import_module(f"{_SCHEMAS}.{SCHEMA_MODULES[fmt]}")
+
+    def __iter__(self):
+        return iter(SCHEMA_MODULES)
+
+    def __len__(self):
+        return len(SCHEMA_MODULES)
+
+    def loaded(self):
+        """(format, module) pairs of the schemas imported so far, by anyone."""
+        names = ((fmt, f"{_SCHEMAS}.{name}") for fmt, name in SCHEMA_MODULES.items())
+        return [(fmt, sys.modules[name]) for fmt, name in names if name in sys.modules]
+
+_SCHEMAS = f"{__package__}.schemas"
+SCHEMA_MAP = _SchemaMap()
+
+# Schema backups of a format are parsed with, where it isn't the format's own.
+# SY has every Mihon field, encoded the same way, so reading a Mihon backup as
+# SY gives the same messages, plus the SY fields of one that only looked like
+# Mihon in the part sniff_format read. Writing it out as Mihon drops those again.
+_READ_AS = {BackupFormat.MIHON: BackupFormat.SY}
+
+def read_schema(fmt: BackupFormat):
+    """Schema module backups of `fmt` are parsed with (see _READ_AS)."""
+    return SCHEMA_MAP[_READ_AS.get(fmt, fmt)]
+
+# What reading a truncated or corrupt backup raises. Streamed inputs only run
+# into these part way through, after the reader has been opened.
+READ_ERRORS = DECOMPRESS_ERRORS + (DecodeError,)
+
+class NoBackupsLoaded(ValueError):
+    """Every input of a merge failed to read (each was logged and skipped)."""
+
+_NAME_TOKENS = re.compile(r"[^a-z0-9]+")
+
 def detect_schema(path: str) -> Optional[BackupFormat]:
-    lower = path.lower()
-    if "neko" in lower: return BackupFormat.NEKO
-    if "sy" in lower: return BackupFormat.SY
-    if "mihon" in lower: return BackupFormat.MIHON
-    if "j2k" in lower: return BackupFormat.J2K
+    # Only look at the file name, directories like /home/sysadmin/ would match "sy".
+    # Whole words only, or "easy", "fantasy" and synth_j2k_0 would be SY files.
+    tokens = set(_NAME_TOKENS.split(os.path.basename(path).lower()))
+    for fmt in (BackupFormat.NEKO, BackupFormat.KOMIKKU, BackupFormat.YOKAI,
+                BackupFormat.SY, BackupFormat.MIHON, BackupFormat.J2K):
+        if fmt.value in tokens:
+            return fmt
     
     # Fallback/Default heuristics could go here if filenames are generic
     return None
 
-def load_backup(path: str) -> tuple[Optional[Message], Optional[BackupFormat]]:
+def resolve_format(path: str) -> BackupFormat:
+    # The file name wins if the content fits it, otherwise the content decides (see sniff.py)
+    fmt, confidence = sniff_format(path)
+    if fmt:
+        logging.debug(f"Sniffed {path} as {fmt.name} (confidence {confidence:.2f})")
+        return fmt
     fmt = detect_schema(path)
     if not fmt:
         # Try to brute force? For now default to standard Tachiyomi/Mihon if unknown
         fmt = BackupFormat.MIHON 
+    return fmt
+
+def load_backup(path: str) -> tuple[Optional[Message], Optional[BackupFormat]]:
+    fmt = resolve_format(path)
     
-    schema_module = SCHEMA_MAP.get(fmt)
-    if not schema_module:
+    if fmt not in SCHEMA_MAP:
         raise ValueError(f"Unsupported format: {fmt}")
+    schema_module = read_schema(fmt)
 
     try:
-        with gzip.open(path, "rb") as f:
+        with trace.stage("load", file=path) as st, trace.wrap_file(open_read(path), "decompress") as f:
             backup = schema_module.Backup()
-            backup.ParseFromString(f.read())
+            trace.timed("parse", backup.ParseFromString)(f.read())
+            st.count(len(backup.backupManga))
             return backup, fmt
     except Exception as e:
         logging.error(f"Failed to load {path}: {e}")
         return None, None
 
-def save_backup(backup: Message, path: str):
-    with gzip.open(path, "wb") as f:
-        f.write(backup.SerializeToString())
+def save_backup(backup: Message, path: str, level: Optional[int] = None, threads: int = 1):
+    # Written field by field so the whole backup is never serialized in one go
+    from .stream import BackupWriter
+    with trace.stage("save", file=path) as st, \
+            BackupWriter(path, _format_of(backup), level=level, threads=threads) as writer:
+        writer.add_backup(backup)
+        st.count(writer.manga_count)
+
+def _format_of(backup: Message) -> BackupFormat:
+    # A message's schema module has necessarily been imported already
+    for fmt, schema_module in SCHEMA_MAP.loaded():
+        if backup.DESCRIPTOR is schema_module.Backup.DESCRIPTOR:
+            return fmt
+    raise ValueError(f"Unsupported backup message: {backup.DESCRIPTOR.full_name}")
+
+def convert_backup(backup: Message, target_fmt: BackupFormat, writer=None) -> Optional[Message]:
+    """
+    Converts a backup message from one format to another by copying fields
+    directly between the schema descriptors (see converter.py).
+
+    `backup` may also be a streaming BackupReader; its manga are converted one
+    at a time as they are read.
+    If a BackupWriter is given, converted data is written through it as it is
+    produced and None is returned instead of the converted message.
+    """
+    target_schema = SCHEMA_MAP[target_fmt]
+    target_backup = target_schema.Backup()
+
+    try:
+        with trace.stage("convert", target=target_fmt.name) as st:
+            if writer is not None:
+                # The writer converts each message to its own (target) schema.
+                # Streamed manga are converted as bytes without being parsed.
+                if isinstance(backup, Message):
+                    for manga in backup.backupManga:
+                        writer.add_manga(manga)
+                else:
+                    src_desc = backup.schema.BackupManga.DESCRIPTOR
+                    for payload in backup.iter_raw_manga():
+                        writer.add_raw_manga(payload, src_desc)
+                st.count(writer.manga_count)
+                extras = backup if isinstance(backup, Message) else backup.extras
+                for field, value in extras.ListFields():
+                    if field.name != "backupManga":
+                        for item in value:
+                            writer.add(field.name, item)
+                return None
+            if isinstance(backup, Message):
+                copy_message(backup, target_backup)
+            else:
+                src_desc = backup.schema.BackupManga.DESCRIPTOR
+                dst_desc = target_schema.BackupManga.DESCRIPTOR
+                convert = trace.timed("convert_bytes", convert_bytes)
+                for payload in backup.iter_raw_manga():
+                    target_backup.backupManga.add().MergeFromString(convert(payload, src_desc, dst_desc))
+                copy_message(backup.extras, target_backup)
+            st.count(len(target_backup.backupManga))
+    except (ValueError, TypeError) as e:
+        # e.g. a value that doesn't fit the narrower int type of the target
+        logging.error(f"Error converting data: {e}")
+        raise
+
+    return target_backup
 
-def convert_backup(backup: Message, target_fmt: BackupFormat) -> Message:
+def convert_backup_json(backup: Message, target_fmt: BackupFormat) -> Message:
     """
     Converts a backup message from one format to another using JSON serialization
     as the intermediate representation.
+
+    This is the original conversion path, kept as a reference for benchmarks.
+    It is much slower and uses ~3x the memory of convert_backup.
     """
+    from google.protobuf import json_format
     target_schema = SCHEMA_MAP[target_fmt]
     target_backup = target_schema.Backup()
 
@@ -69,87 +196,154 @@ def convert_backup(backup: Message, target_fmt: BackupFormat) -> Message:
     # 2. Re-construct target backup from Dict
     
     # We use preserving_proto_field_name=True to match .proto definitions
-    data_dict = json_format.MessageToDict(backup, preserving_proto_field_name=True, use_integers_for_enums=True)
-    
-    # Conversion Edge Cases & Cleanup
-    # -----------------------------
-    
-    # Some fields might inevitably differ or need manual mapping if names don't match.
-    # Luckily, Tachiyomi forks usually share field names (backupManga, backupCategories, etc.)
-    
-    # Remove fields that definitely don't exist in target to avoid ParseError
-    # (ParsetDict usually ignores unknown fields if ignore_unknown_fields=True is set,
-    # but let's be safe).
-    
-    try:
-        json_format.ParseDict(data_dict, target_backup, ignore_unknown_fields=True)
-    except json_format.ParseError as e:
-        logging.error(f"Error converting data: {e}")
-        raise
+    with trace.stage("convert_json", target=target_fmt.name) as st:
+        data_dict = trace.timed("to_dict", json_format.MessageToDict)(
+            backup, preserving_proto_field_name=True, use_integers_for_enums=True)
+
+        try:
+            trace.timed("from_dict", json_format.ParseDict)(data_dict, target_backup, ignore_unknown_fields=True)
+        except json_format.ParseError as e:
+            logging.error(f"Error converting data: {e}")
+            raise
+        st.count(len(target_backup.backupManga))
 
     return target_backup
 
-def merge_backups(backups: List[tuple[Message, BackupFormat]]) -> Message:
+def merge_backups(backups: List[tuple[Message, BackupFormat]], writer=None) -> Optional[Message]:
     """
     Merges multiple backups into a single SY-format backup (as it's the superset).
-    Deduplicates by (source_id, url).
+    Deduplicates by (source_id, url), merging the chapters, history, tracking
+    and categories of duplicate copies. Categories, sources and extension repos
+    are deduplicated too, and manga category references remapped to match.
+    Inputs can be loaded Backup messages or streaming BackupReaders.
+    If an SY BackupWriter is given, the result is written through it and None is
+    returned, so the merged Backup message is never assembled in memory.
     """
     if not backups:
         raise ValueError("No backups to merge")
 
     # Target is always SY for the merge result to hold max info
-    target_schema = sy_pb2
+    target_schema = SCHEMA_MAP[BackupFormat.SY]
     merged_backup = target_schema.Backup()
     
     # Track seen manga to deduplicate
     # Key: (source_id, url) -> MangaMessage
     seen_manga: Dict[tuple[int, str], Message] = {}
-    
-    all_categories = []
-    all_sources = []
-    all_extensions = []
+    # Hash indexes for manga that have duplicates, built on the first duplicate
+    unions: Dict[tuple[int, str], MangaUnion] = {}
+    # Categories by name, sources by id, extension repos by url
+    tables = MergedTables(target_schema)
+    convert = trace.timed("to_schema", to_schema)
+    convert_raw = trace.timed("convert_bytes", convert_bytes)
+    parse = trace.timed("parse", target_schema.BackupManga.FromString)
+    add_copy = trace.timed("union", MangaUnion.add)
+    loaded = 0
     
     for backup_obj, fmt in backups:
-        # Convert to SY first to standardize
-        if fmt != BackupFormat.SY:
+        path = getattr(backup_obj, "path", None)
+        with trace.stage("merge_input", **({"file": path} if path else {})) as st:
+            # Convert to SY first to standardize. This is done per manga, so streamed
+            # inputs (BackupReader) never have to be materialized as a whole.
             # We treat everything as SY during merge to capture 'superset' fields if possible
             # But realistically if we convert Mihon->SY we just map common fields.
-            work_obj = convert_backup(backup_obj, BackupFormat.SY)
-        else:
-            work_obj = backup_obj
-
-        # Merge Manga
-        for manga in work_obj.backupManga:
-            key = (manga.source, manga.url)
-            
-            if key in seen_manga:
-                existing = seen_manga[key]
-                # Merge strategy: Update existing with 'better' data? 
-                # For now: Newest 'dateAdded' or 'favorite' wins?
-                # Simple strategy: Keep existing, maybe fill missing chapters?
-                # Let's just keep the "first found" or "favorite" one.
-                
-                if not existing.favorite and manga.favorite:
-                    seen_manga[key] = manga # Upgrade to favorite version
-                
-                # TODO: intelligent chapter merging (union of chapters)
+
+            # Manga refer to categories by this input's numbering, and for streamed
+            # inputs the category table only comes after the manga. So references are
+            # set aside here and rewritten in one pass once the table is known.
+            pending_categories: List[tuple[tuple[int, str], List[int]]] = []
+
+            # A streamed input can turn out to be truncated or corrupt part way
+            # through, and is then skipped as a whole. So nothing merged so far is
+            # modified until it has been read to the end: its new manga are only
+            # added (and removed again on an error), and copies of manga already
+            # seen are kept as raw bytes and folded in afterwards.
+            added: List[tuple[int, str]] = []
+            duplicates: List[tuple[tuple[int, str], Any]] = []
+            if isinstance(backup_obj, Message):
+                items = backup_obj.backupManga
             else:
-                seen_manga[key] = manga
+                from .view import lazy_manga_class
+                src_desc = backup_obj.schema.BackupManga.DESCRIPTOR
+                dst_desc = target_schema.BackupManga.DESCRIPTOR
+                # Only decodes the header fields, enough for the key
+                header = lazy_manga_class(backup_obj.schema)()
+                items = backup_obj.iter_raw_manga()
+
+            try:
+                # Merge Manga
+                for item in items:
+                    st.count()
+                    if isinstance(item, Message):
+                        converted = convert(item, target_schema)
+                        key = (converted.source, converted.url)
+                    else:
+                        header.Clear()
+                        header.ParseFromString(item)
+                        key = (header.source, header.url)
+                        converted = None
+
+                    if key in seen_manga:
+                        duplicates.append((key, converted if converted is not None else item))
+                        continue
+
+                    if converted is None:
+                        converted = parse(convert_raw(item, src_desc, dst_desc))
+                    if converted.categories:
+                        pending_categories.append((key, list(converted.categories)))
+                        if converted is item:
+                            # Don't modify the caller's input backup
+                            converted = target_schema.BackupManga()
+                            converted.CopyFrom(item)
+                        del converted.categories[:]
+                    seen_manga[key] = converted
+                    added.append(key)
 
-        # Merge Lists
-        if hasattr(work_obj, "backupCategories"):
-            all_categories.extend(work_obj.backupCategories)
-        if hasattr(work_obj, "backupSources"):
-            all_sources.extend(work_obj.backupSources)
-        if hasattr(work_obj, "backupExtensionRepo"):
-             all_extensions.extend(work_obj.backupExtensionRepo)
+                categories = getattr(backup_obj, "backupCategories", [])
+            except READ_ERRORS as e:
+                logging.error(f"Failed to load {path}: {e}")
+                for key in added:
+                    del seen_manga[key]
+                continue
+            loaded += 1
+
+            for key, copy in duplicates:
+                if not isinstance(copy, Message):
+                    copy = parse(convert_raw(copy, src_desc, dst_desc))
+                if copy.categories:
+                    pending_categories.append((key, list(copy.categories)))
+                # Duplicate: union chapters/history/tracking into one entry,
+                # the favorite copy's metadata wins (see merge.py)
+                union = unions.get(key)
+                if union is None:
+                    # Work on a copy so the caller's input backups aren't modified
+                    base = target_schema.BackupManga()
+                    base.CopyFrom(seen_manga[key])
+                    seen_manga[key] = base
+                    union = unions[key] = MangaUnion(base)
+                add_copy(union, copy, categories=False)
+
+            # Merge Lists
+            remap = tables.add_categories(categories)
+            tables.add_sources(getattr(backup_obj, "backupSources", []))
+            tables.add_extension_repos(getattr(backup_obj, "backupExtensionRepo", []))
+
+            # References to categories missing from the input's table are dropped
+            for key, values in pending_categories:
+                merge_categories(seen_manga[key], [remap[v] for v in values if v in remap])
+
+    if not loaded:
+        raise NoBackupsLoaded("No valid backups loaded")
+
+    if writer is not None:
+        with trace.stage("write", file=writer.path) as st:
+            for manga in seen_manga.values():
+                writer.add_manga(manga)
+            tables.write_to(writer)
+            st.count(writer.manga_count)
+        return None
 
     # Reassemble
     merged_backup.backupManga.extend(seen_manga.values())
-    
-    # Dedupe aux lists by simple heuristics (e.g. name/id)
-    # (Simplified for MVP)
-    merged_backup.backupCategories.extend(all_categories) # TODO: dedupe categories by name
-    merged_backup.backupSources.extend(all_sources) # TODO: dedupe by sourceId (generated files usually define this multiple times)
+    tables.fill(merged_backup)
     
     return merged_backup
@@ -0,0 +1,276 @@
+import logging
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from google.protobuf.message import Message
+
+from . import trace
+from .core import BackupFormat, READ_ERRORS
+from .merge import merge_categories, merge_trackers
+from .stream import BackupReader, open_backup
+from .view import lazy_manga_class
+
+# Cross-source duplicate detection.
+#
+# The merge only treats the same (source, url) as a duplicate, so a series
+# followed on two sources stays in the library twice. This pass finds such
+# pairs by title: every title of a manga (title, customTitle and the
+# flatMetadata search titles of SY/Komikku) is normalized (accents, case and
+# punctuation dropped) and compared as a set of character trigrams. Two manga
+# from different sources are duplicates if any pair of their titles has a
+# Jaccard similarity of at least the threshold.
+#
+# Comparing every pair is out of the question for 20k+ manga, so candidates
+# come from a trigram index with prefix filtering: trigrams are ordered from
+# rarest to most common, and a title only needs to be indexed and looked up by
+# its first |grams| - ceil(threshold * |grams|) + 1 trigrams. Two titles that
+# reach the threshold always share one of those, so nothing is missed, while
+# common trigrams (" th", "the", ...) never produce candidates. Titles are
+# processed shortest first, which also allows skipping candidates that are too
+# short to reach the threshold.
+#
+# Duplicates are grouped (transitively) and each group is folded into one
+# manga: a favorite wins, then the one with the most chapters. Chapters of
+# different sources don't share urls, so read/bookmark flags are carried over
+# by chapter number; categories and tracking are merged as in merge.py.
+
+DEFAULT_THRESHOLD = 0.8
+_MIN_TITLE_LENGTH = 3
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize_title(title: str) -> str:
+    title = unicodedata.normalize("NFKD", title)
+    title = "".join(c for c in title if not unicodedata.combining(c)).casefold()
+    return " ".join(_NON_WORD.sub(" ", title).split())
+
+
+def trigrams(title: str) -> Set[str]:
+    padded = f" {title} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def manga_titles(manga: Message, schema_module) -> List[str]:
+    """Normalized titles of a (lazy, see view.py) BackupManga, deduplicated, in order."""
+    titles = [manga.title]
+    if "customTitle" in manga.DESCRIPTOR.fields_by_name:
+        titles.append(manga.customTitle)
+    if "flatMetadata" in manga.DESCRIPTOR.fields_by_name and manga.flatMetadata:
+        metadata = schema_module.BackupFlatMetadata.FromString(manga.flatMetadata)
+        titles.extend(t.title for t in metadata.searchTitles)
+    normalized = []
+    for title in titles:
+        title = normalize_title(title)
+        if len(title) >= _MIN_TITLE_LENGTH and title not in normalized:
+            normalized.append(title)
+    return normalized
+
+
+class TitleRecord(NamedTuple):
+    source: int
+    url: str
+    title: str
+    favorite: bool
+    chapters: int
+    titles: List[str]
+
+
+def find_duplicates(records: List[TitleRecord], threshold: float = DEFAULT_THRESHOLD) -> Dict[Tuple[int, int], float]:
+    """
+    Pairs (i, j), i < j, of records from different sources with a title
+    similarity of at least `threshold`, mapped to the best similarity.
+    """
+    if not 0 < threshold <= 1:
+        raise ValueError(f"Threshold must be in (0, 1], got {threshold}")
+    entries = [(i, trigrams(title)) for i, record in enumerate(records) for title in record.titles]
+    frequency = Counter(gram for _, grams in entries for gram in grams)
+    rank = {gram: r for r, gram in enumerate(sorted(frequency, key=lambda g: (frequency[g], g)))}
+
+    sources = [record.source for record in records]
+    index: Dict[str, List[int]] = {}
+    pairs: Dict[Tuple[int, int], float] = {}
+    compared = 0
+    order = sorted(range(len(entries)), key=lambda e: len(entries[e][1]))
+    for e in order:
+        i, grams = entries[e]
+        size = len(grams)
+        min_size = threshold * size
+        # (the epsilon keeps e.g. 0.8 * 10 = 8.000000000000002 from rounding up)
+        prefix = sorted(grams, key=rank.__getitem__)[:size - math.ceil(threshold * size - 1e-9) + 1]
+
+        candidates = set()
+        for gram in prefix:
+            candidates.update(index.get(gram, ()))
+        source = sources[i]
+        for c in candidates:
+            j, other = entries[c]
+            if len(other) < min_size or sources[j] == source:
+                continue
+            compared += 1
+            common = len(grams & other)
+            score = common / (size + len(other) - common)
+            if score >= threshold:
+                key = (j, i) if j < i else (i, j)
+                if score > pairs.get(key, 0.0):
+                    pairs[key] = score
+
+        for gram in prefix:
+            index.setdefault(gram, []).append(e)
+
+    logging.info(f"Fuzzy dedupe: {len(entries)} titles, {compared} candidate comparisons, {len(pairs)} matches")
+    return pairs
+
+
+def group_duplicates(records: List[TitleRecord], pairs: Dict[Tuple[int, int], float]) -> List[List[int]]:
+    """
+    Connected groups of matched records. Each group is ordered with the manga
+    to keep first (favorite, then most chapters, then first in the file),
+    groups in file order of their first member.
+    """
+    parent = list(range(len(records)))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for i, j in pairs:
+        ri, rj = find(i), find(j)
+        if ri != rj:
+            parent[max(ri, rj)] = min(ri, rj)
+
+    groups: Dict[int, List[int]] = {}
+    for i in range(len(records)):
+        groups.setdefault(find(i), []).append(i)
+    result = []
+    for members in groups.values():
+        if len(members) > 1:
+            members.sort(key=lambda m: (not records[m].favorite, -records[m].chapters, m))
+            result.append(members)
+    result.sort(key=min)
+    return result
+
+
+def fold_cross_source(keep: Message, other: Message):
+    """Folds the reading state of `other`, the same series on another source, into `keep`."""
+    if other.favorite and not keep.favorite:
+        keep.favorite = True
+    by_number = {}
+    for chapter in other.chapters:
+        if chapter.chapterNumber > 0:
+            by_number.setdefault(chapter.chapterNumber, chapter)
+    for chapter in keep.chapters:
+        match = by_number.get(chapter.chapterNumber)
+        if match is not None:
+            if match.read and not chapter.read:
+                chapter.read = True
+            if match.bookmark and not chapter.bookmark:
+                chapter.bookmark = True
+    merge_trackers(keep, other.tracking)
+    merge_categories(keep, other.categories)
+
+
+def _open(path: str, fmt: Optional[BackupFormat] = None) -> BackupReader:
+    reader = open_backup(path, fmt)
+    if not reader:
+        raise ValueError(f"Could not load {path}")
+    return reader
+
+
+def _read_records(path: str) -> Tuple[List[TitleRecord], BackupReader]:
+    reader = _open(path)
+    manga_cls = lazy_manga_class(reader.schema)
+    manga = manga_cls()
+    records = []
+    with reader:
+        for payload in reader.iter_raw_manga():
+            manga.Clear()
+            manga.ParseFromString(payload)
+            records.append(TitleRecord(manga.source, manga.url, manga.title, manga.favorite,
+                                       len(manga.chapters), manga_titles(manga, reader.schema)))
+        reader.finish()
+    return records, reader
+
+
+def dedupe_file(path: str, threshold: float = DEFAULT_THRESHOLD, writer=None) -> dict:
+    """
+    Finds cross-source duplicates in the backup at `path` and returns a report
+    of them. If a `writer` (of the backup's format) is given, the backup is
+    written through it with every group folded into its first manga, in the
+    position of that manga; otherwise nothing is changed (report only).
+
+    Raises ValueError if the backup can't be read, also when it turns out
+    truncated or corrupt part way through.
+    """
+    try:
+        return _dedupe(path, threshold, writer)
+    except READ_ERRORS as e:
+        raise ValueError(f"Failed to load {path}: {e}") from e
+
+
+def _dedupe(path: str, threshold: float, writer) -> dict:
+    with trace.stage("dedupe_scan", file=path) as st:
+        records, reader = _read_records(path)
+        st.count(len(records))
+    with trace.stage("dedupe_match") as st:
+        pairs = find_duplicates(records, threshold)
+        groups = group_duplicates(records, pairs)
+        st.count(len(pairs))
+
+    def describe(i):
+        return {"source": records[i].source, "url": records[i].url, "title": records[i].title}
+
+    # Best match of each manga, all of its matches are in its own group
+    best: Dict[int, float] = {}
+    for pair, score in pairs.items():
+        for i in pair:
+            best[i] = max(best.get(i, 0.0), score)
+    report_groups = [
+        {"keep": describe(members[0]), "duplicates": [dict(describe(m), score=round(best[m], 3)) for m in members[1:]]}
+        for members in groups
+    ]
+    report = {
+        "manga": len(records),
+        "groups": report_groups,
+        "removed": sum(len(members) - 1 for members in groups),
+        "threshold": threshold,
+    }
+    if writer is None:
+        return report
+
+    with trace.stage("write", file=writer.path) as st:
+        grouped = {m for members in groups for m in members}
+        schema = reader.schema
+        src_desc = schema.BackupManga.DESCRIPTOR
+        # Second pass: the members of each group, a small part of the library
+        members: Dict[int, Message] = {}
+        if grouped:
+            with _open(path, reader.fmt) as again:
+                for i, payload in enumerate(again.iter_raw_manga()):
+                    if i in grouped:
+                        members[i] = schema.BackupManga.FromString(payload)
+        folded = {}
+        for group in groups:
+            keep = members[group[0]]
+            for m in group[1:]:
+                fold_cross_source(keep, members[m])
+            folded[group[0]] = keep
+
+        with _open(path, reader.fmt) as again:
+            for i, payload in enumerate(again.iter_raw_manga()):
+                if i in folded:
+                    writer.add_manga(folded[i])
+                elif i not in grouped:
+                    writer.add_raw_manga(payload, src_desc)
+            extras = again.finish()
+        for field, items in extras.ListFields():
+            for item in items:
+                writer.add(field.name, item)
+        st.count(writer.manga_count)
+
+    logging.info(f"Fuzzy dedupe: folded {report['removed']} manga into {len(groups)} others")
+    return report
@@ -0,0 +1,245 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+from google.protobuf.message import Message
+
+from . import trace
+from .cache import file_digest
+from .core import READ_ERRORS
+from .converter import convert_bytes
+from .merge import MangaUnion, MergedTables, merge_categories
+from .schemas import sy_pb2
+from .stream import open_backup
+
+# Incremental merge.
+#
+# A merged backup can be stored together with a fingerprint index
+# (<output>.fp.json) listing, per merged manga in file order, its (source, url)
+# key, a hash of its serialized bytes and the hashes of every input copy that
+# has been folded into it. The next merge with that backup as its base:
+#   - hashes each input manga's raw bytes and skips the ones already folded in,
+#     without decoding them
+#   - decodes and unions only the new or changed copies into their merged entry
+#   - copies every untouched merged entry from the base file as raw bytes
+#
+# The union merge is associative and folding the same copy twice changes
+# nothing, so the result equals a full merge of the previous inputs plus the
+# new ones, in the same order.
+#
+# Manga refer to categories by their input's numbering, so an input copy's
+# hash also covers its input's category table: renaming a category on a device
+# re-merges that device's manga.
+
+INDEX_VERSION = 1
+
+Key = Tuple[int, str]
+
+
+def fingerprint_path(path: str) -> str:
+    return f"{path}.fp.json"
+
+
+def _hash(*parts: bytes) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update(part)
+    return h.hexdigest()
+
+
+class FingerprintEntry:
+    __slots__ = ("key", "digest", "inputs")
+
+    def __init__(self, key: Key, digest: str, inputs: List[str]):
+        self.key = key
+        # Hash of the merged manga's serialized bytes
+        self.digest = digest
+        # Hashes of the input copies folded into it
+        self.inputs = inputs
+
+
+class FingerprintIndex:
+    """Per-manga fingerprints of a merged backup, in the backup's manga order."""
+
+    def __init__(self, entries: List[FingerprintEntry], extras: Message, digest: Optional[str] = None):
+        self.entries = entries
+        self.extras = extras
+        # file_digest of the merged backup the index belongs to
+        self.digest = digest
+
+    @classmethod
+    def load(cls, backup_path: str) -> Optional["FingerprintIndex"]:
+        """Index of `backup_path`, or None if there is none or it is stale."""
+        path = fingerprint_path(backup_path)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != INDEX_VERSION:
+                return None
+            if data["digest"] != file_digest(backup_path):
+                logging.warning(f"Ignoring {path}: {backup_path} changed since it was written")
+                return None
+            entries = [FingerprintEntry((source, url), digest, inputs) for source, url, digest, inputs in data["manga"]]
+            extras = sy_pb2.Backup.FromString(base64.b64decode(data["extras"]))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.warning(f"Ignoring unreadable index {path}: {e}")
+            return None
+        return cls(entries, extras, data["digest"])
+
+    def save(self, backup_path: str):
+        """Writes the index next to `backup_path`, which must be fully written."""
+        self.digest = file_digest(backup_path)
+        data = {
+            "version": INDEX_VERSION,
+            "digest": self.digest,
+            "extras": base64.b64encode(self.extras.SerializeToString()).decode("ascii"),
+            "manga": [[e.key[0], e.key[1], e.digest, e.inputs] for e in self.entries],
+        }
+        path = fingerprint_path(backup_path)
+        tmp = f"{path}.tmp{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp, path)
+
+
+def _read_changed(path: str, known: set) -> Tuple[Optional[Message], List[Tuple[str, Message]], int]:
+    # Returns the input's top-level lists, its copies not in `known` (hash and
+    # SY manga, category references not remapped yet) and its manga count. The
+    # category table comes after the manga and is part of each copy's hash, so
+    # it is read first in a pass that skips the manga; then the manga are
+    # streamed and hashed, and only the changed ones decoded and kept.
+    with_tables = open_backup(path)
+    if not with_tables:
+        return None, [], 0
+    with with_tables:
+        extras = with_tables.finish()
+    backup = open_backup(path, with_tables.fmt)
+    if not backup:
+        return None, [], 0
+    categories = b"".join(c.SerializeToString() for c in extras.backupCategories)
+    src_desc = backup.schema.BackupManga.DESCRIPTOR
+    dst_desc = sy_pb2.BackupManga.DESCRIPTOR
+    changed = []
+    seen = set()
+    count = 0
+    with backup:
+        for payload in backup.iter_raw_manga():
+            count += 1
+            fp = _hash(categories, b"\0", payload)
+            if fp in known or fp in seen:
+                continue
+            seen.add(fp)
+            changed.append((fp, sy_pb2.BackupManga.FromString(convert_bytes(payload, src_desc, dst_desc))))
+    return extras, changed, count
+
+
+def merge_incremental(base_path: Optional[str], paths: List[str], writer) -> FingerprintIndex:
+    """
+    Merges `paths` into the merged backup at `base_path` and writes the result
+    through the SY `writer`. Returns the new output's FingerprintIndex, to be
+    saved once the writer is closed.
+
+    Without a usable index for `base_path` the base is merged like any other
+    input (a full merge); with `base_path` None only `paths` are merged.
+    """
+    index = FingerprintIndex.load(base_path) if base_path else None
+    if base_path and index is None:
+        logging.info(f"No fingerprint index for {base_path}, doing a full merge")
+        paths = [base_path] + list(paths)
+        base_path = None
+    entries = index.entries if index else []
+
+    tables = MergedTables(sy_pb2)
+    if index:
+        # The base goes first, so its category numbering stays as it is
+        tables.add_categories(index.extras.backupCategories)
+        tables.add_sources(index.extras.backupSources)
+        tables.add_extension_repos(index.extras.backupExtensionRepo)
+
+    known = {fp for entry in entries for fp in entry.inputs}
+    # New or changed copies per key, remapped to the merged categories, first-seen order
+    pending: Dict[Key, List[Message]] = {}
+    pending_inputs: Dict[Key, List[str]] = {}
+    loaded = skipped = 0
+
+    for path in paths:
+        with trace.stage("merge_input", file=path) as st:
+            try:
+                extras, changed, count = _read_changed(path, known)
+            except READ_ERRORS as e:
+                # Truncated or corrupt past the header, nothing of it has been merged yet
+                logging.error(f"Failed to load {path}: {e}")
+                continue
+            if extras is None:
+                logging.error(f"Skipping {path}: could not be loaded")
+                continue
+            loaded += 1
+            skipped += count - len(changed)
+            remap = tables.add_categories(extras.backupCategories)
+            tables.add_sources(getattr(extras, "backupSources", []))
+            tables.add_extension_repos(getattr(extras, "backupExtensionRepo", []))
+
+            for fp, manga in changed:
+                known.add(fp)
+                values = [remap[v] for v in manga.categories if v in remap]
+                del manga.categories[:]
+                merge_categories(manga, values)
+                key = (manga.source, manga.url)
+                pending.setdefault(key, []).append(manga)
+                pending_inputs.setdefault(key, []).append(fp)
+            st.count(count)
+
+    if not loaded and index is None:
+        raise ValueError("No valid backups loaded")
+
+    def fold(base: Optional[Message], copies: List[Message]) -> Message:
+        if base is None:
+            base, copies = copies[0], copies[1:]
+        union = MangaUnion(base)
+        for copy in copies:
+            union.add(copy)
+        return base
+
+    with trace.stage("write", file=writer.path) as st:
+        new_entries: List[FingerprintEntry] = []
+        copied = 0
+        if index:
+            base = open_backup(base_path)
+            if not base:
+                raise ValueError(f"Could not read {base_path}")
+            with base:
+                count = 0
+                for entry, payload in zip(entries, base.iter_raw_manga()):
+                    count += 1
+                    copies = pending.pop(entry.key, None)
+                    if copies is None:
+                        # Untouched, straight through without decoding
+                        writer.add_raw_manga(payload)
+                        new_entries.append(entry)
+                        copied += 1
+                        continue
+                    payload = fold(sy_pb2.BackupManga.FromString(payload), copies).SerializeToString()
+                    writer.add_raw_manga(payload)
+                    new_entries.append(FingerprintEntry(entry.key, _hash(payload), entry.inputs + pending_inputs[entry.key]))
+            if count != len(entries):
+                raise ValueError(f"{base_path} doesn't match its fingerprint index")
+
+        # Manga the base doesn't have yet, in first-seen order
+        for key, copies in pending.items():
+            payload = fold(None, copies).SerializeToString()
+            writer.add_raw_manga(payload)
+            new_entries.append(FingerprintEntry(key, _hash(payload), pending_inputs[key]))
+
+        tables.write_to(writer)
+        st.count(writer.manga_count)
+
+    extras = sy_pb2.Backup()
+    tables.fill(extras)
+    logging.info(f"Incremental merge: {copied} manga copied unchanged, {len(new_entries) - copied} re-merged, "
+                 f"{skipped} input copies already merged")
+    return FingerprintIndex(new_entries, extras)
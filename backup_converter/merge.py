@@ -0,0 +1,210 @@
+from typing import Dict, Iterable
+
+from google.protobuf.message import Message
+
+from .converter import copy_message, is_repeated
+
+# Union merge of duplicate manga.
+#
+# When the same (source, url) shows up in several backups we keep one entry but
+# fold the per-device state of every copy into it:
+#   - chapters (by url): read/bookmark are OR'ed, lastPageRead, lastModifiedAt
+#     and version take the max
+#   - history (by url): lastRead and readDuration take the max
+#   - tracking (by syncId): lastChapterRead/totalChapters take the max, fields the
+#     first copy doesn't have are filled in from later ones
+#   - categories: union (after remapping to the merged category table)
+# Manga metadata comes from the favorite copy (or the first one if none is a
+# favorite), with lastModifiedAt/version the max over all copies.
+#
+# Lists always keep first-seen order and ties keep the first copy, which makes
+# the merge associative: merging per file first (parallel merge) gives the
+# same result as merging everything in one go.
+#
+# Each duplicate manga gets hash indexes over its lists, built once and reused
+# for every further copy, so merging is linear in the number of chapters.
+
+UNION_FIELDS = ("chapters", "history", "tracking", "categories")
+
+
+def _max_field(dst: Message, src: Message, name: str):
+    if src.HasField(name) and (not dst.HasField(name) or getattr(src, name) > getattr(dst, name)):
+        setattr(dst, name, getattr(src, name))
+
+
+def _fill_missing(dst: Message, src: Message):
+    for field, value in src.ListFields():
+        if is_repeated(field) or dst.HasField(field.name):
+            continue
+        if field.cpp_type == field.CPPTYPE_MESSAGE:
+            getattr(dst, field.name).CopyFrom(value)
+        else:
+            setattr(dst, field.name, value)
+
+
+def merge_chapter(dst: Message, src: Message):
+    if src.read and not dst.read:
+        dst.read = True
+    if src.bookmark and not dst.bookmark:
+        dst.bookmark = True
+    _max_field(dst, src, "lastPageRead")
+    _max_field(dst, src, "lastModifiedAt")
+    _max_field(dst, src, "version")
+
+
+def merge_history(dst: Message, src: Message):
+    _max_field(dst, src, "lastRead")
+    _max_field(dst, src, "readDuration")
+
+
+def merge_tracking(dst: Message, src: Message):
+    _max_field(dst, src, "lastChapterRead")
+    _max_field(dst, src, "totalChapters")
+    _fill_missing(dst, src)
+
+
+def _take_metadata(dst: Message, src: Message):
+    # Replace every non-list field of dst with src's, leaving the merged lists alone
+    for field in dst.DESCRIPTOR.fields:
+        if field.name not in UNION_FIELDS:
+            dst.ClearField(field.name)
+    for field, value in src.ListFields():
+        if field.name in UNION_FIELDS:
+            continue
+        if is_repeated(field):
+            getattr(dst, field.name).extend(value)
+        elif field.cpp_type == field.CPPTYPE_MESSAGE:
+            getattr(dst, field.name).CopyFrom(value)
+        else:
+            setattr(dst, field.name, value)
+
+
+def merge_categories(manga: Message, values: Iterable[int]):
+    # Category lists are tiny, no index needed
+    present = set(manga.categories)
+    for value in values:
+        if value not in present:
+            present.add(value)
+            manga.categories.append(value)
+
+
+def _index(items, key_name: str) -> Dict:
+    index = {}
+    for item in items:
+        index.setdefault(getattr(item, key_name), item)
+    return index
+
+
+class MangaUnion:
+    """
+    Accumulates duplicate copies of one manga into `manga`.
+
+    `manga` is modified in place, so pass a copy if the original must be kept.
+    """
+
+    def __init__(self, manga: Message):
+        self.manga = manga
+        self.chapters = _index(manga.chapters, "url")
+        self.history = _index(manga.history, "url")
+        self.tracking = _index(manga.tracking, "syncId")
+
+    def add(self, other: Message, categories: bool = True):
+        """
+        Folds `other` into the merged manga. Pass categories=False when the
+        category references of `other` still need remapping (see MergedTables).
+        """
+        manga = self.manga
+
+        # Favorite wins the metadata; list order stays first-seen either way
+        last_modified = max(manga.lastModifiedAt, other.lastModifiedAt)
+        version = max(manga.version, other.version)
+        if not manga.favorite and other.favorite:
+            _take_metadata(manga, other)
+        if last_modified:
+            manga.lastModifiedAt = last_modified
+        if version:
+            manga.version = version
+
+        self._union(manga.chapters, self.chapters, other.chapters, "url", merge_chapter)
+        self._union(manga.history, self.history, other.history, "url", merge_history)
+        self._union(manga.tracking, self.tracking, other.tracking, "syncId", merge_tracking)
+
+        if categories:
+            merge_categories(manga, other.categories)
+
+    @staticmethod
+    def _union(container, index: Dict, items, key_name: str, merge_item):
+        for item in items:
+            key = getattr(item, key_name)
+            existing = index.get(key)
+            if existing is None:
+                added = container.add()
+                added.CopyFrom(item)
+                index[key] = added
+            else:
+                merge_item(existing, item)
+
+
+def merge_trackers(manga: Message, trackers: Iterable[Message]):
+    """Folds `trackers` into the tracking of `manga`, merging the ones of the same tracker (syncId)."""
+    MangaUnion._union(manga.tracking, _index(manga.tracking, "syncId"), trackers, "syncId", merge_tracking)
+
+
+class MergedTables:
+    """
+    Deduplicated top-level tables of a merge: categories by name, sources by
+    sourceId and extension repos by baseUrl. First seen wins.
+
+    Merged categories keep their order value unless another category already
+    uses it, in which case they go to the end. add_categories returns the remap
+    table (input order value -> merged order value) for rewriting the
+    BackupManga.categories references of that input.
+    """
+
+    def __init__(self, schema_module):
+        self.schema = schema_module
+        self.categories: Dict[str, Message] = {}
+        self._used_orders = set()
+        self.sources: Dict[int, Message] = {}
+        self.extension_repos: Dict[str, Message] = {}
+
+    def add_categories(self, categories: Iterable[Message]) -> Dict[int, int]:
+        remap: Dict[int, int] = {}
+        for category in categories:
+            merged = self.categories.get(category.name)
+            if merged is None:
+                merged = self.schema.BackupCategory()
+                copy_message(category, merged)
+                if merged.order in self._used_orders:
+                    merged.order = max(self._used_orders) + 1
+                self._used_orders.add(merged.order)
+                self.categories[category.name] = merged
+            # Manga refer to categories by their order value
+            remap.setdefault(category.order, merged.order)
+        return remap
+
+    def add_sources(self, sources: Iterable[Message]):
+        for source in sources:
+            merged = self.sources.get(source.sourceId)
+            if merged is None:
+                self.sources[source.sourceId] = copy_message(source, self.schema.BackupSource())
+            elif not merged.name and source.name:
+                merged.name = source.name
+
+    def add_extension_repos(self, repos: Iterable[Message]):
+        for repo in repos:
+            if repo.baseUrl not in self.extension_repos:
+                self.extension_repos[repo.baseUrl] = copy_message(repo, self.schema.BackupExtensionRepos())
+
+    def write_to(self, writer):
+        for category in self.categories.values():
+            writer.add_category(category)
+        for source in self.sources.values():
+            writer.add_source(source)
+        for repo in self.extension_repos.values():
+            writer.add_extension_repo(repo)
+
+    def fill(self, backup: Message):
+        backup.backupCategories.extend(self.categories.values())
+        backup.backupSources.extend(self.sources.values())
+        backup.backupExtensionRepo.extend(self.extension_repos.values())
@@ -0,0 +1,125 @@
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+from google.protobuf.message import Message
+
+from . import trace
+from .core import NoBackupsLoaded, merge_backups
+from .merge import MangaUnion, MergedTables
+from .schemas import sy_pb2
+from .stream import open_backup
+
+# Parallel merge.
+#
+# Each worker streams one input file, converts its manga to SY and dedupes them
+# locally with the same union rules as merge_backups. Workers send back
+# serialized manga (plus the small top-level lists), and the parent reduces the
+# partials in input order, so the result doesn't depend on which worker
+# finishes first and is identical to the serial merge.
+
+
+class PartialMerge(NamedTuple):
+    path: str
+    fmt_name: str
+    # (source, url, serialized SY BackupManga), in first-seen order
+    manga: List[Tuple[int, str, bytes]]
+    # SY Backup holding only the top-level lists (categories, sources, ...)
+    extras: bytes
+
+
+def _load_partial(path: str) -> Optional[PartialMerge]:
+    backup = open_backup(path)
+    if not backup:
+        return None
+
+    with backup:
+        try:
+            # A single-input merge is exactly the local convert + dedupe step
+            merged = merge_backups([(backup, backup.fmt)])
+        except NoBackupsLoaded:
+            # Truncated or corrupt past the header, merge_backups skipped (and logged) it.
+            # Conversion errors propagate, as in the serial merge.
+            return None
+
+    manga = [(m.source, m.url, m.SerializeToString()) for m in merged.backupManga]
+    del merged.backupManga[:]
+    return PartialMerge(path, backup.fmt.name, manga, merged.SerializeToString())
+
+
+def merge_files_parallel(paths: List[str], jobs: int, writer=None) -> Optional[Message]:
+    """
+    Loads, converts and pre-dedupes each input on its own process, then reduces
+    the partial results like merge_backups. Writes through `writer` if given,
+    otherwise returns the merged SY Backup.
+    """
+    # Serialized manga per key, parsed only when it has to be modified (duplicates,
+    # category remapping). Dicts keep first-seen order like the serial merge.
+    seen: Dict[Tuple[int, str], Union[bytes, Message]] = {}
+    unions: Dict[Tuple[int, str], MangaUnion] = {}
+    tables = MergedTables(sy_pb2)
+    loaded = 0
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        # map() yields in submission order regardless of completion order
+        for path, partial in zip(paths, pool.map(_load_partial, paths)):
+            if partial is None:
+                logging.error(f"Skipping {path}: could not be loaded")
+                continue
+            loaded += 1
+            logging.info(f"Loaded {partial.path} ({partial.fmt_name}, {len(partial.manga)} unique manga)")
+
+            with trace.stage("reduce", file=partial.path) as st:
+                # The partial's tables are already deduped, references use its own numbering
+                extras = sy_pb2.Backup.FromString(partial.extras)
+                remap = tables.add_categories(extras.backupCategories)
+                tables.add_sources(extras.backupSources)
+                tables.add_extension_repos(extras.backupExtensionRepo)
+                identity = all(k == v for k, v in remap.items())
+
+                for source, url, payload in partial.manga:
+                    key = (source, url)
+                    existing = seen.get(key)
+                    if existing is None and identity:
+                        seen[key] = payload
+                        continue
+
+                    manga = sy_pb2.BackupManga.FromString(payload)
+                    if not identity:
+                        categories = [remap[c] for c in manga.categories if c in remap]
+                        del manga.categories[:]
+                        manga.categories.extend(categories)
+                    if existing is None:
+                        seen[key] = manga
+                        continue
+
+                    # The union merge is associative, so folding per-file partials
+                    # gives the same result as the serial merge
+                    union = unions.get(key)
+                    if union is None:
+                        if isinstance(existing, bytes):
+                            existing = seen[key] = sy_pb2.BackupManga.FromString(existing)
+                        union = unions[key] = MangaUnion(existing)
+                    union.add(manga)
+                st.count(len(partial.manga))
+
+    if not loaded:
+        raise ValueError("No valid backups loaded")
+
+    payloads = (
+        entry if isinstance(entry, bytes) else entry.SerializeToString()
+        for entry in seen.values()
+    )
+    if writer is not None:
+        with trace.stage("write", file=writer.path) as st:
+            for payload in payloads:
+                writer.add_raw_manga(payload)
+            tables.write_to(writer)
+            st.count(writer.manga_count)
+        return None
+
+    merged = sy_pb2.Backup()
+    for payload in payloads:
+        merged.backupManga.add().MergeFromString(payload)
+    tables.fill(merged)
+    return merged
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# source: schema-komikku.proto
+"""Generated protocol buffer code."""
+from google.protobuf.internal import builder as _builder
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import descriptor_pool as _descriptor_pool
+from google.protobuf import symbol_database as _symbol_database
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+
+
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x14schema-komikku.proto\x12\x07komikku\"2\n\x0fPreferenceValue\x12\x0c\n\x04type\x18\x01 \x02(\t\x12\x11\n\ttruevalue\x18\x02 \x02(\x0c\"\xae\x03\n\x06\x42\x61\x63kup\x12)\n\x0b\x62\x61\x63kupManga\x18\x01 \x03(\x0b\x32\x14.komikku.BackupManga\x12\x31\n\x10\x62\x61\x63kupCategories\x18\x02 \x03(\x0b\x32\x17.komikku.BackupCategory\x12,\n\rbackupSources\x18\x65 \x03(\x0b\x32\x15.komikku.BackupSource\x12\x34\n\x11\x62\x61\x63kupPreferences\x18h \x03(\x0b\x32\x19.komikku.BackupPreference\x12\x41\n\x17\x62\x61\x63kupSourcePreferences\x18i \x03(\x0b\x32 .komikku.BackupSourcePreferences\x12:\n\x13\x62\x61\x63kupExtensionRepo\x18j \x03(\x0b\x32\x1d.komikku.BackupExtensionRepos\x12\x38\n\x13\x62\x61\x63kupSavedSearches\x18\xd8\x04 \x03(\x0b\x32\x1a.komikku.BackupSavedSearch\x12)\n\x0b\x62\x61\x63kupFeeds\x18\xe2\x04 \x03(\x0b\x32\x13.komikku.BackupFeed\"Y\n\x0e\x42\x61\x63kupCategory\x12\x0c\n\x04name\x18\x01 \x02(\t\x12\r\n\x05order\x18\x02 \x01(\x03\x12\n\n\x02id\x18\x03 \x01(\x03\x12\r\n\x05\x66lags\x18\x64 \x01(\x03\x12\x0f\n\x06hidden\x18\x84\x07 \x01(\x08\"\xef\x01\n\rBackupChapter\x12\x0b\n\x03url\x18\x01 \x02(\t\x12\x0c\n\x04name\x18\x02 \x02(\t\x12\x11\n\tscanlator\x18\x03 \x01(\t\x12\x0c\n\x04read\x18\x04 \x01(\x08\x12\x10\n\x08\x62ookmark\x18\x05 \x01(\x08\x12\x14\n\x0clastPageRead\x18\x06 \x01(\x03\x12\x11\n\tdateFetch\x18\x07 \x01(\x03\x12\x12\n\ndateUpload\x18\x08 \x01(\x03\x12\x15\n\rchapterNumber\x18\t \x01(\x02\x12\x13\n\x0bsourceOrder\x18\n \x01(\x03\x12\x16\n\x0elastModifiedAt\x18\x0b \x01(\x03\x12\x0f\n\x07version\x18\x0c \x01(\x03\"x\n\x14\x42\x61\x63kupExtensionRepos\x12\x0f\n\x07\x62\x61seUrl\x18\x01 \x02(\t\x12\x0c\n\x04name\x18\x02 \x02(\t\x12\x11\n\tshortName\x18\x03 \x01(\t\x12\x0f\n\x07website\x18\x04 \x02(\t\x12\x1d\n\x15signingKeyFingerprint\x18\x05 \x02(\t\"]\n\nBackupFeed\x12\x0e\n\x06source\x18\x01 \x01(\x03\x12\x0e\n\x06global\x18\x02 \x01(\x08\x12/\n\x0bsavedSearch\x18\t \x01(\x0b\x32\x1a.komikku.BackupSavedSearch\"\xab\x01\n\x12\x42\x61\x63kupFlatMetadata\x12\x35\n\x0esearchMetadata\x18\x01 \x02(\x0b\x32\x1d.komikku.BackupSearchMetadata\x12,\n\nsearchTags\x18\x02 \x03(\x0b\x32\x18.komikku.BackupSearchTag\x12\x30\n\x0csearchTitles\x18\x03 \x03(\x0b\x32\x1a.komikku.BackupSearchTitle\"D\n\rBackupHistory\x12\x0b\n\x03url\x18\x01 \x02(\t\x12\x10\n\x08lastRead\x18\x02 \x02(\x03\x12\x14\n\x0creadDuration\x18\x03 \x01(\x03\"\xda\x06\n\x0b\x42\x61\x63kupManga\x12\x0e\n\x06source\x18\x01 \x02(\x03\x12\x0b\n\x03url\x18\x02 \x02(\t\x12\r\n\x05title\x18\x03 \x01(\t\x12\x0e\n\x06\x61rtist\x18\x04 \x01(\t\x12\x0e\n\x06\x61uthor\x18\x05 \x01(\t\x12\x13\n\x0b\x64\x65scription\x18\x06 \x01(\t\x12\r\n\x05genre\x18\x07 \x03(\t\x12\x0e\n\x06status\x18\x08 \x01(\x05\x12\x14\n\x0cthumbnailUrl\x18\t \x01(\t\x12\x11\n\tdateAdded\x18\r \x01(\x03\x12\x0e\n\x06viewer\x18\x0e \x01(\x05\x12(\n\x08\x63hapters\x18\x10 \x03(\x0b\x32\x16.komikku.BackupChapter\x12\x12\n\ncategories\x18\x11 \x03(\x03\x12)\n\x08tracking\x18\x12 \x03(\x0b\x32\x17.komikku.BackupTracking\x12\x10\n\x08\x66\x61vorite\x18\x64 \x01(\x08\x12\x14\n\x0c\x63hapterFlags\x18\x65 \x01(\x05\x12\x14\n\x0cviewer_flags\x18g \x01(\x05\x12\'\n\x07history\x18h \x03(\x0b\x32\x16.komikku.BackupHistory\x12/\n\x0eupdateStrategy\x18i \x01(\x0e\x32\x17.komikku.UpdateStrategy\x12\x16\n\x0elastModifiedAt\x18j \x01(\x03\x12\x1a\n\x12\x66\x61voriteModifiedAt\x18k \x01(\x03\x12\x1a\n\x12\x65xcludedScanlators\x18l \x03(\t\x12\x0f\n\x07version\x18m \x01(\x03\x12\r\n\x05notes\x18n \x01(\t\x12\x43\n\x15mergedMangaReferences\x18\xd8\x04 \x03(\x0b\x32#.komikku.BackupMergedMangaReference\x12\x32\n\x0c\x66latMetadata\x18\xd9\x04 \x01(\x0b\x32\x1b.komikku.BackupFlatMetadata\x12\x15\n\x0c\x63ustomStatus\x18\xda\x04 \x01(\x05\x12\x1b\n\x12\x63ustomThumbnailUrl\x18\xdb\x04 \x01(\t\x12\x14\n\x0b\x63ustomTitle\x18\xa0\x06 \x01(\t\x12\x15\n\x0c\x63ustomArtist\x18\xa1\x06 \x01(\t\x12\x15\n\x0c\x63ustomAuthor\x18\xa2\x06 \x01(\t\x12\x1a\n\x11\x63ustomDescription\x18\xa4\x06 \x01(\t\x12\x14\n\x0b\x63ustomGenre\x18\xa5\x06 \x03(\t\"\xd3\x01\n\x1a\x42\x61\x63kupMergedMangaReference\x12\x13\n\x0bisInfoManga\x18\x01 \x02(\x08\x12\x19\n\x11getChapterUpdates\x18\x02 \x02(\x08\x12\x17\n\x0f\x63hapterSortMode\x18\x03 \x02(\x05\x12\x17\n\x0f\x63hapterPriority\x18\x04 \x02(\x05\x12\x18\n\x10\x64ownloadChapters\x18\x05 \x02(\x08\x12\x10\n\x08mergeUrl\x18\x06 \x02(\t\x12\x10\n\x08mangaUrl\x18\x07 \x02(\t\x12\x15\n\rmangaSourceId\x18\x08 \x02(\x03\"H\n\x10\x42\x61\x63kupPreference\x12\x0b\n\x03key\x18\x01 \x02(\t\x12\'\n\x05value\x18\x02 \x02(\x0b\x32\x18.komikku.PreferenceValue\"V\n\x17\x42\x61\x63kupSourcePreferences\x12\x11\n\tsourceKey\x18\x01 \x02(\t\x12(\n\x05prefs\x18\x02 \x03(\x0b\x32\x19.komikku.BackupPreference\"#\n\x12IntPreferenceValue\x12\r\n\x05value\x18\x01 \x02(\x05\"$\n\x13LongPreferenceValue\x12\r\n\x05value\x18\x01 \x02(\x03\"%\n\x14\x46loatPreferenceValue\x12\r\n\x05value\x18\x01 \x02(\x02\"&\n\x15StringPreferenceValue\x12\r\n\x05value\x18\x01 \x02(\t\"\'\n\x16\x42ooleanPreferenceValue\x12\r\n\x05value\x18\x01 \x02(\x08\")\n\x18StringSetPreferenceValue\x12\r\n\x05value\x18\x01 \x03(\t\"T\n\x11\x42\x61\x63kupSavedSearch\x12\x0c\n\x04name\x18\x01 \x02(\t\x12\r\n\x05query\x18\x02 \x01(\t\x12\x12\n\nfilterList\x18\x03 \x01(\t\x12\x0e\n\x06source\x18\x04 \x01(\x03\".\n\x0c\x42\x61\x63kupSource\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\x10\n\x08sourceId\x18\x02 \x02(\x03\"\x95\x02\n\x0e\x42\x61\x63kupTracking\x12\x0e\n\x06syncId\x18\x01 \x02(\x05\x12\x11\n\tlibraryId\x18\x02 \x02(\x03\x12\x12\n\nmediaIdInt\x18\x03 \x01(\x05\x12\x13\n\x0btrackingUrl\x18\x04 \x01(\t\x12\r\n\x05title\x18\x05 \x01(\t\x12\x17\n\x0flastChapterRead\x18\x06 \x01(\x02\x12\x15\n\rtotalChapters\x18\x07 \x01(\x05\x12\r\n\x05score\x18\x08 \x01(\x02\x12\x0e\n\x06status\x18\t \x01(\x05\x12\x1a\n\x12startedReadingDate\x18\n \x01(\x03\x12\x1b\n\x13\x66inishedReadingDate\x18\x0b \x01(\x03\x12\x0f\n\x07private\x18\x0c \x01(\x08\x12\x0f\n\x07mediaId\x18\x64 \x01(\x03\"c\n\x14\x42\x61\x63kupSearchMetadata\x12\x10\n\x08uploader\x18\x01 \x01(\t\x12\r\n\x05\x65xtra\x18\x02 \x02(\t\x12\x14\n\x0cindexedExtra\x18\x03 \x01(\t\x12\x14\n\x0c\x65xtraVersion\x18\x04 \x02(\x05\"@\n\x0f\x42\x61\x63kupSearchTag\x12\x11\n\tnamespace\x18\x01 \x01(\t\x12\x0c\n\x04name\x18\x02 \x02(\t\x12\x0c\n\x04type\x18\x03 \x02(\x05\"0\n\x11\x42\x61\x63kupSearchTitle\x12\r\n\x05title\x18\x01 \x02(\t\x12\x0c\n\x04type\x18\x02 \x02(\x05*8\n\x0eUpdateStrategy\x12\x11\n\rALWAYS_UPDATE\x10\x00\x12\x13\n\x0fONLY_FETCH_ONCE\x10\x01')
+
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, globals())
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'schema_komikku_pb2', globals())
+if _descriptor._USE_C_DESCRIPTORS == False:
+
+  DESCRIPTOR._options = None
+  _UPDATESTRATEGY._serialized_start=3418
+  _UPDATESTRATEGY._serialized_end=3474
+  _PREFERENCEVALUE._serialized_start=33
+  _PREFERENCEVALUE._serialized_end=83
+  _BACKUP._serialized_start=86
+  _BACKUP._serialized_end=516
+  _BACKUPCATEGORY._serialized_start=518
+  _BACKUPCATEGORY._serialized_end=607
+  _BACKUPCHAPTER._serialized_start=610
+  _BACKUPCHAPTER._serialized_end=849
+  _BACKUPEXTENSIONREPOS._serialized_start=851
+  _BACKUPEXTENSIONREPOS._serialized_end=971
+  _BACKUPFEED._serialized_start=973
+  _BACKUPFEED._serialized_end=1066
+  _BACKUPFLATMETADATA._serialized_start=1069
+  _BACKUPFLATMETADATA._serialized_end=1240
+  _BACKUPHISTORY._serialized_start=1242
+  _BACKUPHISTORY._serialized_end=1310
+  _BACKUPMANGA._serialized_start=1313
+  _BACKUPMANGA._serialized_end=2171
+  _BACKUPMERGEDMANGAREFERENCE._serialized_start=2174
+  _BACKUPMERGEDMANGAREFERENCE._serialized_end=2385
+  _BACKUPPREFERENCE._serialized_start=2387
+  _BACKUPPREFERENCE._serialized_end=2459
+  _BACKUPSOURCEPREFERENCES._serialized_start=2461
+  _BACKUPSOURCEPREFERENCES._serialized_end=2547
+  _INTPREFERENCEVALUE._serialized_start=2549
+  _INTPREFERENCEVALUE._serialized_end=2584
+  _LONGPREFERENCEVALUE._serialized_start=2586
+  _LONGPREFERENCEVALUE._serialized_end=2622
+  _FLOATPREFERENCEVALUE._serialized_start=2624
+  _FLOATPREFERENCEVALUE._serialized_end=2661
+  _STRINGPREFERENCEVALUE._serialized_start=2663
+  _STRINGPREFERENCEVALUE._serialized_end=2701
+  _BOOLEANPREFERENCEVALUE._serialized_start=2703
+  _BOOLEANPREFERENCEVALUE._serialized_end=2742
+  _STRINGSETPREFERENCEVALUE._serialized_start=2744
+  _STRINGSETPREFERENCEVALUE._serialized_end=2785
+  _BACKUPSAVEDSEARCH._serialized_start=2787
+  _BACKUPSAVEDSEARCH._serialized_end=2871
+  _BACKUPSOURCE._serialized_start=2873
+  _BACKUPSOURCE._serialized_end=2919
+  _BACKUPTRACKING._serialized_start=2922
+  _BACKUPTRACKING._serialized_end=3199
+  _BACKUPSEARCHMETADATA._serialized_start=3201
+  _BACKUPSEARCHMETADATA._serialized_end=3300
+  _BACKUPSEARCHTAG._serialized_start=3302
+  _BACKUPSEARCHTAG._serialized_end=3366
+  _BACKUPSEARCHTITLE._serialized_start=3368
+  _BACKUPSEARCHTITLE._serialized_end=3416
+# @@protoc_insertion_point(module_scope)
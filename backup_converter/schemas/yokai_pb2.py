@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# source: schema-yokai.proto
+"""Generated protocol buffer code."""
+from google.protobuf.internal import builder as _builder
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import descriptor_pool as _descriptor_pool
+from google.protobuf import symbol_database as _symbol_database
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+
+
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x12schema-yokai.proto\x12\x05yokai\"2\n\x0fPreferenceValue\x12\x0c\n\x04type\x18\x01 \x02(\t\x12\x11\n\ttruevalue\x18\x02 \x02(\x0c\"\x83\x02\n\x06\x42\x61\x63kup\x12\'\n\x0b\x62\x61\x63kupManga\x18\x01 \x03(\x0b\x32\x12.yokai.BackupManga\x12/\n\x10\x62\x61\x63kupCategories\x18\x02 \x03(\x0b\x32\x15.yokai.BackupCategory\x12*\n\rbackupSources\x18\x65 \x03(\x0b\x32\x13.yokai.BackupSource\x12\x32\n\x11\x62\x61\x63kupPreferences\x18h \x03(\x0b\x32\x17.yokai.BackupPreference\x12?\n\x17\x62\x61\x63kupSourcePreferences\x18i \x03(\x0b\x32\x1e.yokai.BackupSourcePreferences\"P\n\x0e\x42\x61\x63kupCategory\x12\x0c\n\x04name\x18\x01 \x02(\t\x12\r\n\x05order\x18\x02 \x01(\x05\x12\r\n\x05\x66lags\x18\x64 \x01(\x05\x12\x12\n\tmangaSort\x18\xa0\x06 \x01(\t\"\xda\x01\n\rBackupChapter\x12\x0b\n\x03url\x18\x01 \x02(\t\x12\x0c\n\x04name\x18\x02 \x02(\t\x12\x11\n\tscanlator\x18\x03 \x01(\t\x12\x0c\n\x04read\x18\x04 \x01(\x08\x12\x10\n\x08\x62ookmark\x18\x05 \x01(\x08\x12\x14\n\x0clastPageRead\x18\x06 \x01(\x05\x12\x11\n\tdateFetch\x18\x07 \x01(\x03\x12\x12\n\ndateUpload\x18\x08 \x01(\x03\x12\x15\n\rchapterNumber\x18\t \x01(\x02\x12\x13\n\x0bsourceOrder\x18\n \x01(\x05\x12\x12\n\tpagesLeft\x18\xa0\x06 \x01(\x05\"D\n\rBackupHistory\x12\x0b\n\x03url\x18\x01 \x02(\t\x12\x10\n\x08lastRead\x18\x02 \x02(\x03\x12\x14\n\x0creadDuration\x18\x03 \x01(\x03\"J\n\x13\x42rokenBackupHistory\x12\x0b\n\x03url\x18\x01 \x02(\t\x12\x10\n\x08lastRead\x18\x02 \x02(\x03\x12\x14\n\x0creadDuration\x18\x03 \x01(\x03\"\x9b\x05\n\x0b\x42\x61\x63kupManga\x12\x0e\n\x06source\x18\x01 \x02(\x03\x12\x0b\n\x03url\x18\x02 \x02(\t\x12\r\n\x05title\x18\x03 \x01(\t\x12\x0e\n\x06\x61rtist\x18\x04 \x01(\t\x12\x0e\n\x06\x61uthor\x18\x05 \x01(\t\x12\x13\n\x0b\x64\x65scription\x18\x06 \x01(\t\x12\r\n\x05genre\x18\x07 \x03(\t\x12\x0e\n\x06status\x18\x08 \x01(\x05\x12\x14\n\x0cthumbnailUrl\x18\t \x01(\t\x12\x11\n\tdateAdded\x18\r \x01(\x03\x12\x0e\n\x06viewer\x18\x0e \x01(\x05\x12&\n\x08\x63hapters\x18\x10 \x03(\x0b\x32\x14.yokai.BackupChapter\x12\x12\n\ncategories\x18\x11 \x03(\x05\x12\'\n\x08tracking\x18\x12 \x03(\x0b\x32\x15.yokai.BackupTracking\x12\x10\n\x08\x66\x61vorite\x18\x64 \x01(\x08\x12\x14\n\x0c\x63hapterFlags\x18\x65 \x01(\x05\x12\x31\n\rbrokenHistory\x18\x66 \x03(\x0b\x32\x1a.yokai.BrokenBackupHistory\x12\x14\n\x0cviewer_flags\x18g \x01(\x05\x12%\n\x07history\x18h \x03(\x0b\x32\x14.yokai.BackupHistory\x12-\n\x0eupdateStrategy\x18i \x01(\x0e\x32\x15.yokai.UpdateStrategy\x12\x1a\n\x12\x65xcludedScanlators\x18l \x03(\t\x12\x15\n\x0c\x63ustomStatus\x18\xda\x04 \x01(\x05\x12\x14\n\x0b\x63ustomTitle\x18\xa0\x06 \x01(\t\x12\x15\n\x0c\x63ustomArtist\x18\xa1\x06 \x01(\t\x12\x15\n\x0c\x63ustomAuthor\x18\xa2\x06 \x01(\t\x12\x1a\n\x11\x63ustomDescription\x18\xa4\x06 \x01(\t\x12\x14\n\x0b\x63ustomGenre\x18\xa5\x06 \x03(\t\"F\n\x10\x42\x61\x63kupPreference\x12\x0b\n\x03key\x18\x01 \x02(\t\x12%\n\x05value\x18\x02 \x02(\x0b\x32\x16.yokai.PreferenceValue\"T\n\x17\x42\x61\x63kupSourcePreferences\x12\x11\n\tsourceKey\x18\x01 \x02(\t\x12&\n\x05prefs\x18\x02 \x03(\x0b\x32\x17.yokai.BackupPreference\"#\n\x12IntPreferenceValue\x12\r\n\x05value\x18\x01 \x02(\x05\"$\n\x13LongPreferenceValue\x12\r\n\x05value\x18\x01 \x02(\x03\"%\n\x14\x46loatPreferenceValue\x12\r\n\x05value\x18\x01 \x02(\x02\"&\n\x15StringPreferenceValue\x12\r\n\x05value\x18\x01 \x02(\t\"\'\n\x16\x42ooleanPreferenceValue\x12\r\n\x05value\x18\x01 \x02(\x08\")\n\x18StringSetPreferenceValue\x12\r\n\x05value\x18\x01 \x03(\t\"4\n\x12\x42rokenBackupSource\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\x10\n\x08sourceId\x18\x02 \x02(\x03\".\n\x0c\x42\x61\x63kupSource\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\x10\n\x08sourceId\x18\x02 \x02(\x03\"\x84\x02\n\x0e\x42\x61\x63kupTracking\x12\x0e\n\x06syncId\x18\x01 \x02(\x05\x12\x11\n\tlibraryId\x18\x02 \x02(\x03\x12\x12\n\nmediaIdInt\x18\x03 \x01(\x05\x12\x13\n\x0btrackingUrl\x18\x04 \x01(\t\x12\r\n\x05title\x18\x05 \x01(\t\x12\x17\n\x0flastChapterRead\x18\x06 \x01(\x02\x12\x15\n\rtotalChapters\x18\x07 \x01(\x05\x12\r\n\x05score\x18\x08 \x01(\x02\x12\x0e\n\x06status\x18\t \x01(\x05\x12\x1a\n\x12startedReadingDate\x18\n \x01(\x03\x12\x1b\n\x13\x66inishedReadingDate\x18\x0b \x01(\x03\x12\x0f\n\x07mediaId\x18\x64 \x01(\x03*8\n\x0eUpdateStrategy\x12\x11\n\rALWAYS_UPDATE\x10\x00\x12\x13\n\x0fONLY_FETCH_ONCE\x10\x01')
+
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, globals())
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'schema_yokai_pb2', globals())
+if _descriptor._USE_C_DESCRIPTORS == False:
+
+  DESCRIPTOR._options = None
+  _UPDATESTRATEGY._serialized_start=2223
+  _UPDATESTRATEGY._serialized_end=2279
+  _PREFERENCEVALUE._serialized_start=29
+  _PREFERENCEVALUE._serialized_end=79
+  _BACKUP._serialized_start=82
+  _BACKUP._serialized_end=341
+  _BACKUPCATEGORY._serialized_start=343
+  _BACKUPCATEGORY._serialized_end=423
+  _BACKUPCHAPTER._serialized_start=426
+  _BACKUPCHAPTER._serialized_end=644
+  _BACKUPHISTORY._serialized_start=646
+  _BACKUPHISTORY._serialized_end=714
+  _BROKENBACKUPHISTORY._serialized_start=716
+  _BROKENBACKUPHISTORY._serialized_end=790
+  _BACKUPMANGA._serialized_start=793
+  _BACKUPMANGA._serialized_end=1460
+  _BACKUPPREFERENCE._serialized_start=1462
+  _BACKUPPREFERENCE._serialized_end=1532
+  _BACKUPSOURCEPREFERENCES._serialized_start=1534
+  _BACKUPSOURCEPREFERENCES._serialized_end=1618
+  _INTPREFERENCEVALUE._serialized_start=1620
+  _INTPREFERENCEVALUE._serialized_end=1655
+  _LONGPREFERENCEVALUE._serialized_start=1657
+  _LONGPREFERENCEVALUE._serialized_end=1693
+  _FLOATPREFERENCEVALUE._serialized_start=1695
+  _FLOATPREFERENCEVALUE._serialized_end=1732
+  _STRINGPREFERENCEVALUE._serialized_start=1734
+  _STRINGPREFERENCEVALUE._serialized_end=1772
+  _BOOLEANPREFERENCEVALUE._serialized_start=1774
+  _BOOLEANPREFERENCEVALUE._serialized_end=1813
+  _STRINGSETPREFERENCEVALUE._serialized_start=1815
+  _STRINGSETPREFERENCEVALUE._serialized_end=1856
+  _BROKENBACKUPSOURCE._serialized_start=1858
+  _BROKENBACKUPSOURCE._serialized_end=1910
+  _BACKUPSOURCE._serialized_start=1912
+  _BACKUPSOURCE._serialized_end=1958
+  _BACKUPTRACKING._serialized_start=1961
+  _BACKUPTRACKING._serialized_end=2221
+# @@protoc_insertion_point(module_scope)
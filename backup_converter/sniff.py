@@ -0,0 +1,251 @@
+from typing import Dict, Optional, Tuple
+
+from google.protobuf.message import DecodeError
+
+from .compress import DECOMPRESS_ERRORS, open_read
+from .wire import FIXED32, FIXED64, LENGTH_DELIMITED, VARINT, decode_varint, read_exact, read_varint
+
+# Content-based format detection.
+#
+# Only the first few KB of the decompressed backup are read. That window is
+# walked once, and every field number it contains is looked up in the tables
+# below. Fields only some forks have, e.g. SY's 600/800-series manga fields or
+# J2K's brokenHistory (102) and pagesLeft (800), rule out the formats that
+# don't know them.
+#
+# The tables are written out by hand rather than built from the schema
+# descriptors, so sniffing doesn't have to import every schema module (see
+# core._SchemaMap). They only cover the messages where the forks differ, and
+# need updating along with the .proto files.
+#
+# The schemas are mostly supersets of each other (Komikku ⊇ SY ⊇ Mihon), so a
+# window that happens to contain no fork-specific fields fits several of them.
+# The file name decides between those if it names one, otherwise the narrowest
+# wins: a backup with nothing but Mihon fields is a Mihon backup. Parsing it
+# with the wider SY schema is decided separately (see core.read_schema). SY and
+# J2K aren't subsets of each other, so if the window fits both and the name
+# doesn't say, the rest of the file is scanned until it shows which one it is.
+# The confidence score says how ambiguous the result is.
+
+DEFAULT_WINDOW = 64 * 1024
+
+# Formats by BackupFormat value. Neko shares the SY schema, no way to tell
+# them apart by content.
+_FORMATS = ("sy", "mihon", "j2k", "komikku", "yokai")
+_SY_LIKE = frozenset({"sy", "mihon", "komikku"})
+_J2K_LIKE = frozenset({"j2k", "yokai"})
+_SY_FORKS = frozenset({"sy", "komikku"})
+_CUSTOM_INFO = frozenset({"sy", "komikku", "j2k", "yokai"})
+
+# Field numbers every fork has, per message
+_COMMON = {
+    "Backup": {1, 2, 101, 104, 105},
+    "BackupManga": {1, 2, 3, 4, 5, 6, 7, 8, 9, 13, 14, 16, 17, 18, 100, 101, 103, 104, 105},
+    "BackupChapter": {1, 2, 3, 4, 5, 6, 7, 8, 9, 10},
+    "BackupCategory": {1, 2, 100},
+    "BackupTracking": {1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 100},
+}
+
+# Field numbers only some forks have -> those forks
+_FORK_FIELDS = {
+    "Backup": {
+        100: frozenset({"j2k"}),  # backupBrokenSources
+        106: _SY_LIKE,  # backupExtensionRepo
+        600: _SY_FORKS,  # backupSavedSearches
+        610: frozenset({"komikku"}),  # backupFeeds
+    },
+    "BackupManga": {
+        102: _J2K_LIKE,  # brokenHistory
+        106: _SY_LIKE, 107: _SY_LIKE, 109: _SY_LIKE, 110: _SY_LIKE,  # lastModifiedAt, ..., notes
+        108: _SY_LIKE | {"yokai"},  # excludedScanlators
+        600: _SY_FORKS, 601: _SY_FORKS, 603: _SY_FORKS,  # merged manga, flatMetadata, customThumbnailUrl
+        602: _CUSTOM_INFO,  # customStatus
+        800: _CUSTOM_INFO, 801: _CUSTOM_INFO, 802: _CUSTOM_INFO, 804: _CUSTOM_INFO, 805: _CUSTOM_INFO,
+    },
+    "BackupChapter": {
+        11: _SY_LIKE, 12: _SY_LIKE,  # lastModifiedAt, version
+        800: _J2K_LIKE,  # pagesLeft
+    },
+    "BackupCategory": {
+        3: _SY_LIKE,  # id
+        800: _J2K_LIKE,  # mangaSort
+        900: frozenset({"komikku"}),  # hidden
+    },
+    "BackupTracking": {
+        12: _SY_LIKE,  # private
+    },
+}
+
+# Submessages walked into: (message, field number) -> message
+_NESTED = {
+    ("Backup", 1): "BackupManga",
+    ("Backup", 2): "BackupCategory",
+    ("BackupManga", 16): "BackupChapter",
+    ("BackupManga", 18): "BackupTracking",
+}
+
+
+class _Tally:
+    def __init__(self):
+        # Fields every format knows / no format knows
+        self.common = 0
+        self.unknown = 0
+        # Fork-specific fields: the forks that have them -> count
+        self.forks: Dict[frozenset, int] = {}
+
+    def known_unknown(self, fmt: str) -> Tuple[int, int]:
+        known, unknown = self.common, self.unknown
+        for formats, count in self.forks.items():
+            if fmt in formats:
+                known += count
+            else:
+                unknown += count
+        return known, unknown
+
+
+def _scan(buf: bytes, pos: int, end: int, message: str, tally: _Tally):
+    # Walks buf[pos:end] as `message`. The window may cut the last field short,
+    # in which case whatever part of it is available is still scanned.
+    while pos < end:
+        try:
+            key, pos = decode_varint(buf, pos)
+            number, wire_type = key >> 3, key & 7
+            if wire_type == VARINT:
+                _, value_end = decode_varint(buf, pos)
+            elif wire_type == LENGTH_DELIMITED:
+                size, pos = decode_varint(buf, pos)
+                value_end = pos + size
+            elif wire_type == FIXED64:
+                value_end = pos + 8
+            elif wire_type == FIXED32:
+                value_end = pos + 4
+            else:
+                # Groups and invalid wire types: not something we can read
+                tally.unknown += 1
+                return
+        except DecodeError:
+            return
+
+        nested = _count(message, number, tally)
+        if nested and wire_type == LENGTH_DELIMITED:
+            _scan(buf, pos, min(value_end, end), nested, tally)
+        if value_end > end:
+            return
+        pos = value_end
+
+
+def _count(message: str, number: int, tally: _Tally) -> Optional[str]:
+    # Tallies one field, returns the message to walk its value as, if any
+    if number in _COMMON[message]:
+        tally.common += 1
+        return _NESTED.get((message, number))
+    formats = _FORK_FIELDS[message].get(number)
+    if formats is None:
+        tally.unknown += 1
+    else:
+        tally.forks[formats] = tally.forks.get(formats, 0) + 1
+    return None
+
+
+def _fits(tally: _Tally) -> set:
+    # Formats that know every field seen
+    return {fmt for fmt in _FORMATS if not tally.known_unknown(fmt)[1]}
+
+
+def _both_families(fits: set) -> bool:
+    # Fits an SY-like and a J2K-like format
+    return bool(fits & _SY_LIKE) and bool(fits & _J2K_LIKE)
+
+
+def _scan_file(path: str, fits: set) -> set:
+    # Reads on through the whole backup while it fits both an SY-like and a
+    # J2K-like format, and returns the formats that still fit. Walking every
+    # chapter in Python would take seconds, so each manga is parsed (in C) with
+    # the schemas that still fit instead: a manga with fields one doesn't know
+    # gets smaller when its unknown fields are discarded. The schema modules
+    # are only imported in this case.
+    from .core import BackupFormat, SCHEMA_MAP
+    classes = {fmt: SCHEMA_MAP[BackupFormat(fmt)].BackupManga for fmt in fits}
+    fits = set(fits)
+    try:
+        with open_read(path) as f:
+            while _both_families(fits):
+                key = read_varint(f)
+                size = read_varint(f) if key is not None and key & 7 == LENGTH_DELIMITED else None
+                if size is None:
+                    break
+                payload = read_exact(f, size)
+                if key >> 3 == 1:
+                    for fmt in list(fits):
+                        manga = classes[fmt].FromString(payload)
+                        manga.DiscardUnknownFields()
+                        if manga.ByteSize() != size:
+                            fits.discard(fmt)
+                else:
+                    tally = _Tally()
+                    nested = _count("Backup", key >> 3, tally)
+                    if nested:
+                        _scan(payload, 0, size, nested, tally)
+                    fits &= _fits(tally)
+    except DECOMPRESS_ERRORS + (DecodeError,):
+        pass
+    return fits
+
+
+def _read_window(path: str, size: int) -> Optional[bytes]:
+    try:
+        with open_read(path) as f:
+            return f.read(size)
+    except DECOMPRESS_ERRORS:
+        return None
+
+
+def sniff_format(path: str, window: int = DEFAULT_WINDOW) -> Tuple[Optional["BackupFormat"], float]:
+    """
+    Guesses the backup format from its content.
+
+    Returns (BackupFormat or None, confidence). Confidence is 1.0 when exactly
+    one schema explains every field seen, 1/n when n schemas do, and below 0.5
+    when none of them fit cleanly. When several fit, the filename's format wins
+    if it is one of them, otherwise Mihon > SY > J2K > Yokai > Komikku.
+    """
+    # Imported here, core uses this module for resolve_format
+    from .core import BackupFormat, SCHEMA_MODULES, detect_schema
+    # Narrowest first
+    tie_order = (BackupFormat.MIHON, BackupFormat.SY, BackupFormat.J2K, BackupFormat.YOKAI, BackupFormat.KOMIKKU)
+
+    buf = _read_window(path, window)
+    if not buf:
+        return None, 0.0
+
+    tally = _Tally()
+    _scan(buf, 0, len(buf), "Backup", tally)
+    if not tally.common and not tally.forks:
+        return None, 0.0
+
+    # Neko files are SY files as far as the content goes, keep the name's label
+    hint = detect_schema(path)
+
+    def labelled(fmt):
+        return hint if hint and SCHEMA_MODULES[hint] == SCHEMA_MODULES[fmt] else fmt
+
+    tallies = {BackupFormat(fmt): tally.known_unknown(fmt) for fmt in _FORMATS}
+    consistent = [fmt for fmt, (known, unknown) in tallies.items() if known and not unknown]
+    # Only worth reading on when the name doesn't settle it
+    fits = {fmt.value for fmt in consistent}
+    if _both_families(fits) and not (hint and any(labelled(fmt) is hint for fmt in consistent)):
+        fits = _scan_file(path, fits)
+        # Nothing fitting the rest of the file too (corrupt?): stick with the window
+        consistent = [fmt for fmt in consistent if fmt.value in fits] or consistent
+    if not consistent:
+        fmt, (known, unknown) = max(tallies.items(), key=lambda item: item[1][0] / sum(item[1]))
+        return labelled(fmt), 0.5 * known / (known + unknown)
+    if len(consistent) == 1:
+        return labelled(consistent[0]), 1.0
+
+    # Several schemas fit, e.g. when no fork-specific field came up
+    confidence = 1.0 / len(consistent)
+    if hint and any(labelled(fmt) is hint for fmt in consistent):
+        return hint, confidence
+    fmt = next(fmt for fmt in tie_order if fmt in consistent)
+    return labelled(fmt), confidence
@@ -0,0 +1,211 @@
+import logging
+import os
+from operator import methodcaller
+from typing import Iterator, Optional, Tuple
+
+from google.protobuf.descriptor import Descriptor
+from google.protobuf.message import DecodeError, Message
+
+from . import trace
+from .compress import open_read, open_write
+from .converter import convert_bytes, copy_message, is_repeated
+from .core import BackupFormat, SCHEMA_MAP, read_schema, resolve_format
+from .wire import LENGTH_DELIMITED, encode_field, read_exact, read_varint, skip_exact
+
+# Backup.backupManga, identical in every fork
+MANGA_FIELD = 1
+
+
+class BackupReader:
+    """
+    Streams a compressed backup one top-level field at a time.
+
+    Iterating over `backupManga` yields each BackupManga as soon as it has been
+    parsed, so only one manga is held in memory at a time. Every other top-level
+    field (categories, sources, preferences, ...) is small and collected into
+    `extras`, a Backup message without any manga.
+
+    The reader quacks like a Backup for the repeated fields: `reader.backupCategories`
+    etc. are read from `extras`. Touching them before the manga have been consumed
+    finishes the stream, skipping (not parsing) the remaining manga.
+    """
+
+    def __init__(self, path: str, fmt: Optional[BackupFormat] = None):
+        self.path = path
+        self.fmt = fmt or resolve_format(path)
+        self.schema = read_schema(self.fmt)
+        self.extras = self.schema.Backup()
+        self._file = trace.wrap_file(open_read(path), "decompress")
+        self._started = False
+        self._finished = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def _fields(self, skip_manga: bool = False) -> Iterator[Tuple[int, bytes]]:
+        # Yields (offset, raw manga payload); everything else goes into extras.
+        # Offsets are positions in the decompressed stream.
+        stream = self._file
+        while True:
+            key = read_varint(stream)
+            if key is None:
+                self._finished = True
+                return
+            number, wire_type = key >> 3, key & 7
+            if wire_type != LENGTH_DELIMITED:
+                raise DecodeError(f"{self.path}: unexpected wire type {wire_type} for top-level field {number}")
+            size = read_varint(stream)
+            if size is None:
+                raise DecodeError(f"{self.path}: truncated length for field {number}")
+            if number == MANGA_FIELD:
+                if skip_manga:
+                    skip_exact(stream, size)
+                else:
+                    offset = stream.tell()
+                    yield offset, read_exact(stream, size)
+            else:
+                self.extras.MergeFromString(encode_field(number, wire_type, read_exact(stream, size)))
+
+    def iter_raw_manga(self, offsets: bool = False) -> Iterator:
+        """
+        Yields the serialized bytes of each BackupManga without parsing them,
+        or (offset, bytes) tuples with `offsets=True`.
+        """
+        if self._started:
+            raise RuntimeError(f"{self.path}: backup stream can only be iterated once")
+        self._started = True
+        if offsets:
+            return self._fields()
+        return (payload for _, payload in self._fields())
+
+    def __iter__(self) -> Iterator[Message]:
+        parse = trace.timed("parse", self.schema.BackupManga.FromString)
+        for payload in self.iter_raw_manga():
+            yield parse(payload)
+
+    @property
+    def backupManga(self) -> Iterator[Message]:
+        return iter(self)
+
+    def finish(self) -> Message:
+        """Consumes the rest of the stream (skipping manga) and returns `extras`."""
+        if not self._finished:
+            self._started = True
+            for _ in self._fields(skip_manga=True):
+                pass
+        return self.extras
+
+    def __getattr__(self, name):
+        # Only called for attributes not found normally, i.e. Backup fields
+        if name.startswith("backup") and name in self.schema.Backup.DESCRIPTOR.fields_by_name:
+            return getattr(self.finish(), name)
+        raise AttributeError(name)
+
+
+def open_backup(path: str, fmt: Optional[BackupFormat] = None) -> Optional[BackupReader]:
+    """Streaming counterpart of load_backup."""
+    reader = None
+    try:
+        reader = BackupReader(path, fmt)
+        # Touch the header so uncompressed/corrupt files fail here rather than mid-merge
+        reader._file.peek(1)
+        return reader
+    except Exception as e:
+        if reader:
+            reader.close()
+        logging.error(f"Failed to load {path}: {e}")
+        return None
+
+
+class BackupWriter:
+    """
+    Writes a compressed backup incrementally.
+
+    Each top-level Backup field is serialized and written as soon as it is added,
+    so the full Backup message (and its serialized bytes) never has to exist in
+    memory. Messages from other schemas are converted to the writer's format.
+
+    Protobuf doesn't care about the order of fields on the wire, but adding
+    manga first and the small lists afterwards gives the same bytes as
+    Backup.SerializeToString().
+
+    Output is gzip unless the path ends in .zst/.lz4 (see compress.py); `level`
+    and `threads` are passed on to the compressor.
+    """
+
+    def __init__(self, path: str, fmt: BackupFormat = BackupFormat.SY,
+                 level: Optional[int] = None, threads: int = 1):
+        self.path = path
+        self.fmt = fmt
+        self.schema = SCHEMA_MAP[fmt]
+        self.manga_count = 0
+        self._fields = self.schema.Backup.DESCRIPTOR.fields_by_name
+        self._file = trace.wrap_file(open_write(path, level=level, threads=threads), "compress")
+        self._convert = trace.timed("convert_bytes", convert_bytes)
+        self._serialize = trace.timed("serialize", methodcaller("SerializeToString"))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        if exc_type is not None:
+            # Don't leave a truncated backup behind that looks valid at a glance
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def close(self):
+        self._file.close()
+
+    def _write(self, number: int, payload: bytes):
+        self._file.write(encode_field(number, LENGTH_DELIMITED, payload))
+
+    def add_raw_manga(self, payload: bytes, src_desc: Optional[Descriptor] = None):
+        """
+        Writes an already serialized BackupManga of the writer's schema, or of
+        the schema of `src_desc`, in which case it is converted on the wire.
+        """
+        if src_desc is not None:
+            payload = self._convert(payload, src_desc, self.schema.BackupManga.DESCRIPTOR)
+        self._write(MANGA_FIELD, payload)
+        self.manga_count += 1
+
+    def add_manga(self, manga: Message):
+        self.add_raw_manga(self._serialize(manga), manga.DESCRIPTOR)
+
+    def add(self, field_name: str, item: Message):
+        """Writes one element of a repeated top-level field, e.g. add("backupSources", src)."""
+        field = self._fields.get(field_name)
+        if field is None:
+            # Target format doesn't have this list (e.g. extension repos in J2K)
+            return
+        if item.DESCRIPTOR is not field.message_type:
+            item = copy_message(item, getattr(self.schema, field.message_type.name)())
+        self._write(field.number, item.SerializeToString())
+
+    def add_category(self, category: Message):
+        self.add("backupCategories", category)
+
+    def add_source(self, source: Message):
+        self.add("backupSources", source)
+
+    def add_extension_repo(self, repo: Message):
+        self.add("backupExtensionRepo", repo)
+
+    def add_backup(self, backup: Message):
+        """Writes every field of a Backup message (manga and top-level lists)."""
+        for field, value in backup.ListFields():
+            if field.number == MANGA_FIELD:
+                for manga in value:
+                    self.add_manga(manga)
+            elif field.cpp_type == field.CPPTYPE_MESSAGE and is_repeated(field):
+                for item in value:
+                    self.add(field.name, item)
@@ -0,0 +1,403 @@
+import logging
+import re
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+
+from google.protobuf.message import Message
+
+from . import trace
+from .core import READ_ERRORS
+from .stream import open_backup
+from .view import lazy_manga_class
+
+# Library subsets.
+#
+# `filter` keeps the manga of a backup that match a predicate, e.g. only the
+# favorites, or one source, or a few categories, to slim a backup down for a
+# low-memory device. Predicates only look at the cheap header fields of each
+# BackupManga: every manga is parsed with the lazy schema (see view.py), which
+# leaves chapters, history and tracking as undecoded bytes, and kept manga are
+# written out as their original bytes. Only the read ratio needs the chapters,
+# and it decodes just their `read` flags, for manga that passed every other
+# test.
+#
+# Predicates compose with &, | and ~, and `parse_predicate` reads the same from
+# a string:
+#     favorite and (genre = "Action" or source = 2499283573021220255,123) and read_ratio < 0.5
+#     category = Reading and updated >= 2024-01-01 and not genre = Romance
+#
+# Manga refer to categories by their order value, and the category table comes
+# after the manga in the file. A category predicate needs it up front, which
+# costs one extra pass that decompresses the file without parsing the manga.
+
+
+class Predicate:
+    # Cheaper predicates are tested first in an `and`/`or`
+    cost = 0
+    needs_categories = False
+
+    def prepare(self, extras: Message):
+        """Called with the backup's top-level lists (categories, ...) before filtering."""
+
+    def __call__(self, manga: Message) -> bool:
+        raise NotImplementedError
+
+    def __and__(self, other: "Predicate") -> "Predicate":
+        return And([self, other])
+
+    def __or__(self, other: "Predicate") -> "Predicate":
+        return Or([self, other])
+
+    def __invert__(self) -> "Predicate":
+        return Not(self)
+
+
+class _Compound(Predicate):
+    def __init__(self, parts: Iterable[Predicate]):
+        flat = []
+        for part in parts:
+            # (a & b) & c is just a & b & c
+            flat.extend(part.parts if type(part) is type(self) else [part])
+        self.parts = sorted(flat, key=lambda p: p.cost)
+        self.cost = max((p.cost for p in self.parts), default=0)
+        self.needs_categories = any(p.needs_categories for p in self.parts)
+
+    def prepare(self, extras: Message):
+        for part in self.parts:
+            part.prepare(extras)
+
+
+class And(_Compound):
+    def __call__(self, manga: Message) -> bool:
+        return all(part(manga) for part in self.parts)
+
+
+class Or(_Compound):
+    def __call__(self, manga: Message) -> bool:
+        return any(part(manga) for part in self.parts)
+
+
+class Not(Predicate):
+    def __init__(self, part: Predicate):
+        self.part = part
+        self.cost = part.cost
+        self.needs_categories = part.needs_categories
+
+    def prepare(self, extras: Message):
+        self.part.prepare(extras)
+
+    def __call__(self, manga: Message) -> bool:
+        return not self.part(manga)
+
+
+class Everything(Predicate):
+    def __call__(self, manga: Message) -> bool:
+        return True
+
+
+class SourceIn(Predicate):
+    def __init__(self, source_ids: Iterable[int]):
+        self.source_ids = set(source_ids)
+
+    def __call__(self, manga: Message) -> bool:
+        return manga.source in self.source_ids
+
+
+class Favorite(Predicate):
+    def __call__(self, manga: Message) -> bool:
+        return manga.favorite
+
+
+class InCategory(Predicate):
+    """In any of the categories `names`. "Default" matches manga without a category."""
+
+    needs_categories = True
+
+    def __init__(self, names: Iterable[str]):
+        self.names = list(names)
+        self.orders = set()
+        self.default = False
+
+    def prepare(self, extras: Message):
+        categories = getattr(extras, "backupCategories", [])
+        orders = {c.name.casefold(): c.order for c in categories}
+        self.orders = set()
+        self.default = False
+        for name in self.names:
+            key = name.casefold()
+            if key in orders:
+                self.orders.add(orders[key])
+            elif key == "default":
+                self.default = True
+            else:
+                known = ", ".join(c.name for c in categories) or "none"
+                raise ValueError(f"Unknown category {name!r}, the backup has: {known}")
+
+    def __call__(self, manga: Message) -> bool:
+        if not manga.categories:
+            return self.default
+        return any(c in self.orders for c in manga.categories)
+
+
+class HasGenre(Predicate):
+    """Has any of the genres `names` (case-insensitive)."""
+
+    cost = 1
+
+    def __init__(self, names: Iterable[str]):
+        self.names = {name.casefold() for name in names}
+
+    def __call__(self, manga: Message) -> bool:
+        return any(genre.casefold() in self.names for genre in manga.genre)
+
+
+def _millis(value: int) -> int:
+    # Mihon stores lastModifiedAt in seconds, dateAdded in milliseconds
+    return value * 1000 if value < 100_000_000_000 else value
+
+
+class UpdatedSince(Predicate):
+    """Modified (or, without a modification time, added) at or after `since_ms`."""
+
+    def __init__(self, since_ms: int):
+        self.since_ms = since_ms
+
+    def __call__(self, manga: Message) -> bool:
+        modified = getattr(manga, "lastModifiedAt", 0) or manga.dateAdded
+        return _millis(modified) >= self.since_ms
+
+
+class ReadRatio(Predicate):
+    """Read chapters / all chapters within [minimum, maximum]. No chapters counts as 0."""
+
+    cost = 10
+
+    def __init__(self, minimum: Optional[float] = None, maximum: Optional[float] = None,
+                 min_inclusive: bool = True, max_inclusive: bool = True):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.min_inclusive = min_inclusive
+        self.max_inclusive = max_inclusive
+        self.flags_class = None
+
+    def __call__(self, manga: Message) -> bool:
+        total = len(manga.chapters)
+        if total:
+            # Decode just the read flags of the chapters (see view.py). Serializing
+            # the lazy manga only copies its bytes back together.
+            chapters = self.flags_class.FromString(manga.SerializeToString()).chapters
+            ratio = sum(1 for chapter in chapters if chapter.read) / total
+        else:
+            ratio = 0.0
+        if self.minimum is not None and (ratio < self.minimum or (ratio == self.minimum and not self.min_inclusive)):
+            return False
+        if self.maximum is not None and (ratio > self.maximum or (ratio == self.maximum and not self.max_inclusive)):
+            return False
+        return True
+
+
+def _bind(predicate: Predicate, schema_module):
+    # ReadRatio needs the read-flags variant of the backup's schema
+    if isinstance(predicate, ReadRatio):
+        predicate.flags_class = lazy_manga_class(schema_module, read_flags=True)
+    elif isinstance(predicate, Not):
+        _bind(predicate.part, schema_module)
+    elif isinstance(predicate, _Compound):
+        for part in predicate.parts:
+            _bind(part, schema_module)
+
+
+def parse_date(text: str) -> int:
+    """YYYY-MM-DD[THH:MM[:SS]] (local time) or epoch milliseconds, as epoch milliseconds."""
+    if text.isdigit():
+        return int(text)
+    try:
+        return int(datetime.fromisoformat(text).timestamp() * 1000)
+    except ValueError:
+        raise ValueError(f"Invalid date {text!r}, expected YYYY-MM-DD or epoch milliseconds")
+
+
+_TOKEN = re.compile(r"""\s*(?:(\(|\)|,)|(>=|<=|!=|=|>|<)|"([^"]*)"|'([^']*)'|([^\s(),=<>!"']+))""")
+
+
+def _tokenize(text: str) -> List[Tuple[str, str]]:
+    tokens = []
+    pos = 0
+    text = text.strip()
+    while pos < len(text):
+        match = _TOKEN.match(text, pos)
+        if not match or match.end() == pos:
+            raise ValueError(f"Unexpected {text[pos:]!r} in filter")
+        punct, op, dquoted, squoted, word = match.groups()
+        if punct:
+            tokens.append(("punct", punct))
+        elif op:
+            tokens.append(("op", op))
+        elif word is not None:
+            tokens.append(("word", word))
+        else:
+            tokens.append(("string", dquoted if dquoted is not None else squoted))
+        pos = match.end()
+        while pos < len(text) and text[pos].isspace():
+            pos += 1
+    return tokens
+
+
+def parse_predicate(text: str) -> Predicate:
+    """
+    Parses a filter expression: atoms joined with `and`, `or`, `not` and
+    parentheses. Atoms:
+        favorite
+        source = ID[,ID...]
+        category = NAME[,NAME...]
+        genre = NAME[,NAME...]
+        updated >= DATE          (also >, <, <=)
+        read_ratio >= 0.5        (also >, <, <=, =)
+    `!=` negates source/category/genre. Names with spaces go in quotes.
+    """
+    tokens = _tokenize(text)
+    pos = 0
+
+    def peek():
+        return tokens[pos] if pos < len(tokens) else (None, None)
+
+    def take(kind=None, value=None):
+        nonlocal pos
+        token = peek()
+        if token[0] is None or (kind and token[0] != kind) or (value and token[1].lower() != value):
+            expected = value or kind or "more"
+            raise ValueError(f"Expected {expected} in filter, got {token[1] or 'end of filter'!r}")
+        pos += 1
+        return token[1]
+
+    def keyword(word):
+        token = peek()
+        return token[0] == "word" and token[1].lower() == word
+
+    def values():
+        result = [take()]
+        while peek() == ("punct", ","):
+            take()
+            result.append(take())
+        return result
+
+    def atom() -> Predicate:
+        if peek() == ("punct", "("):
+            take()
+            inner = expression()
+            take("punct", ")")
+            return inner
+        if keyword("not"):
+            take()
+            return ~atom()
+        name = take("word").lower()
+        if name == "favorite":
+            return Favorite()
+        op = take("op")
+        if name in ("source", "category", "genre"):
+            if op not in ("=", "!="):
+                raise ValueError(f"{name} only supports = and !=")
+            names = values()
+            if name == "source":
+                try:
+                    predicate = SourceIn(int(v) for v in names)
+                except ValueError:
+                    raise ValueError(f"Source ids must be numbers, got {', '.join(names)}")
+            else:
+                predicate = InCategory(names) if name == "category" else HasGenre(names)
+            return ~predicate if op == "!=" else predicate
+        if name == "updated":
+            since = UpdatedSince(parse_date(take()))
+            if op in (">=", ">"):
+                return since
+            if op in ("<", "<="):
+                return ~since
+            raise ValueError("updated supports >=, >, <= and <")
+        if name == "read_ratio":
+            try:
+                value = float(take())
+            except ValueError:
+                raise ValueError("read_ratio needs a number between 0 and 1")
+            return {
+                ">=": lambda: ReadRatio(minimum=value),
+                ">": lambda: ReadRatio(minimum=value, min_inclusive=False),
+                "<=": lambda: ReadRatio(maximum=value),
+                "<": lambda: ReadRatio(maximum=value, max_inclusive=False),
+                "=": lambda: ReadRatio(minimum=value, maximum=value),
+            }.get(op, lambda: ~ReadRatio(minimum=value, maximum=value))()
+        raise ValueError(f"Unknown filter field {name!r}")
+
+    def conjunction() -> Predicate:
+        parts = [atom()]
+        while keyword("and"):
+            take()
+            parts.append(atom())
+        return parts[0] if len(parts) == 1 else And(parts)
+
+    def expression() -> Predicate:
+        parts = [conjunction()]
+        while keyword("or"):
+            take()
+            parts.append(conjunction())
+        return parts[0] if len(parts) == 1 else Or(parts)
+
+    if not tokens:
+        return Everything()
+    result = expression()
+    if pos != len(tokens):
+        raise ValueError(f"Unexpected {tokens[pos][1]!r} in filter")
+    return result
+
+
+def filter_backup(path: str, predicate: Predicate, writer) -> Tuple[int, int]:
+    """
+    Writes the manga of the backup at `path` that match `predicate` through
+    `writer`, followed by the backup's top-level lists. Sources no kept manga
+    uses are dropped. Returns (kept, total).
+
+    Raises ValueError if the backup can't be read, also when it turns out
+    truncated or corrupt part way through; the writer then deletes its output.
+    """
+    reader = open_backup(path)
+    if not reader:
+        raise ValueError(f"Could not load {path}")
+    try:
+        with reader:
+            return _filter(path, reader, predicate, writer)
+    except READ_ERRORS as e:
+        raise ValueError(f"Failed to load {path}: {e}") from e
+
+
+def _filter(path: str, reader, predicate: Predicate, writer) -> Tuple[int, int]:
+    if predicate.needs_categories:
+        tables = open_backup(path, reader.fmt)
+        if not tables:
+            raise ValueError(f"Could not load {path}")
+        with trace.stage("filter_categories", file=path), tables:
+            predicate.prepare(tables.finish())
+    else:
+        predicate.prepare(reader.schema.Backup())
+    _bind(predicate, reader.schema)
+
+    src_desc = reader.schema.BackupManga.DESCRIPTOR
+    manga = lazy_manga_class(reader.schema)()
+    kept = total = 0
+    used_sources = set()
+    with trace.stage("filter", file=path) as st:
+        for payload in reader.iter_raw_manga():
+            total += 1
+            manga.Clear()
+            manga.ParseFromString(payload)
+            if predicate(manga):
+                kept += 1
+                used_sources.add(manga.source)
+                writer.add_raw_manga(payload, src_desc)
+        extras = reader.finish()
+        for field, items in extras.ListFields():
+            for item in items:
+                if field.name == "backupSources" and item.sourceId not in used_sources:
+                    continue
+                writer.add(field.name, item)
+        st.count(total)
+    logging.info(f"Kept {kept} of {total} manga")
+    return kept, total
@@ -0,0 +1,284 @@
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows, peak RSS isn't reported there
+    resource = None
+
+# Stage profiling.
+#
+# `--profile` / `--trace FILE` record, for each stage of a run (load, convert,
+# each input of a merge, write, ...), its wall and CPU time, how much the peak
+# RSS grew, optionally tracemalloc's view of Python allocations, and how many
+# items (manga) it handled. --trace writes the stages as Chrome trace events
+# (open in chrome://tracing or Perfetto); both print a summary table at exit.
+#
+# Stages are spans:
+#     with trace.stage("merge_input", file=path) as st:
+#         ...
+#         st.count(n)
+# Work that happens per manga inside a stage (decompressing, parsing,
+# converting, serializing, compressing) is far too fine-grained for spans, so
+# it is timed by wrapping the function once up front:
+#     parse = trace.timed("parse", manga_cls.FromString)
+# or the file object (trace.wrap_file). Those totals are added to the
+# innermost open stage and show up as its sub-rows.
+#
+# When profiling is off, stage() returns a shared no-op object and timed() /
+# wrap_file() return what they were given, so the cost is one global lookup per
+# stage and nothing per manga.
+
+_tracer: Optional["Tracer"] = None
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def count(self, n: int = 1):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+def _peak_rss_kib() -> Optional[int]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KiB elsewhere
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+class Stage:
+    __slots__ = ("tracer", "name", "args", "items", "timers", "start", "cpu_start",
+                 "rss_start", "malloc_start", "malloc_peak", "event")
+
+    def __init__(self, tracer: "Tracer", name: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.items = 0
+        # sub-stage name -> [seconds, calls]
+        self.timers: Dict[str, List] = {}
+        self.event = None
+
+    def count(self, n: int = 1):
+        self.items += n
+
+    def __enter__(self):
+        self.tracer._enter(self)
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer._exit(self)
+        return False
+
+
+class Tracer:
+    def __init__(self, malloc: bool = False):
+        self.malloc = malloc
+        self.events: List[dict] = []
+        self._stack: List[Stage] = []
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+        self._tid = threading.get_ident()
+        if malloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stage(self, name: str, args: dict) -> Stage:
+        return Stage(self, name, args)
+
+    def _enter(self, stage: Stage):
+        if self.malloc:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                parent = self._stack[-1]
+                parent.malloc_peak = max(parent.malloc_peak, peak)
+            tracemalloc.reset_peak()
+            stage.malloc_start = stage.malloc_peak = current
+        stage.rss_start = _peak_rss_kib()
+        self._stack.append(stage)
+        stage.cpu_start = time.process_time()
+        stage.start = time.perf_counter()
+
+    def _exit(self, stage: Stage):
+        end = time.perf_counter()
+        cpu = time.process_time() - stage.cpu_start
+        self._stack.remove(stage)
+        args = dict(stage.args)
+        args["cpu_ms"] = round(cpu * 1000, 3)
+        if stage.items:
+            args["items"] = stage.items
+        rss = _peak_rss_kib()
+        if rss is not None:
+            args["peak_rss_kib"] = rss
+            args["peak_rss_growth_kib"] = rss - stage.rss_start
+        if self.malloc:
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(stage.malloc_peak, peak)
+            if self._stack:
+                parent = self._stack[-1]
+                parent.malloc_peak = max(parent.malloc_peak, peak)
+            args["malloc_delta_kib"] = (current - stage.malloc_start) // 1024
+            args["malloc_peak_kib"] = (peak - stage.malloc_start) // 1024
+        if stage.timers:
+            args["timers"] = {name: {"ms": round(seconds * 1000, 3), "calls": calls}
+                              for name, (seconds, calls) in stage.timers.items()}
+        stage.event = {
+            "name": stage.name,
+            "cat": "stage",
+            "ph": "X",
+            "ts": round((stage.start - self._origin) * 1e6, 1),
+            "dur": round((end - stage.start) * 1e6, 1),
+            "pid": self._pid,
+            "tid": self._tid,
+            "args": args,
+        }
+        self.events.append(stage.event)
+
+    def add_time(self, name: str, seconds: float, calls: int = 1):
+        if not self._stack:
+            return
+        timer = self._stack[-1].timers.get(name)
+        if timer is None:
+            self._stack[-1].timers[name] = [seconds, calls]
+        else:
+            timer[0] += seconds
+            timer[1] += calls
+
+    def finish(self):
+        # Stages left open by an early exit
+        for stage in reversed(list(self._stack)):
+            self._exit(stage)
+        if self.malloc:
+            tracemalloc.stop()
+
+    def write_chrome_trace(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": sorted(self.events, key=lambda e: e["ts"]), "displayTimeUnit": "ms"}, f)
+
+    def summary(self) -> str:
+        """Table of the stages (per file where they have one) and their timed sub-stages."""
+        rows: Dict[tuple, list] = {}
+        # Stages finish inner first; list them in start order
+        for event in sorted(self.events, key=lambda e: e["ts"]):
+            args = event["args"]
+            label = event["name"] + (f" {os.path.basename(args['file'])}" if "file" in args else "")
+            row = rows.setdefault((label,), [0, 0.0, 0.0, 0, None, None])
+            row[0] += 1
+            row[1] += event["dur"] / 1e6
+            row[2] += args["cpu_ms"] / 1000
+            row[3] += args.get("items", 0)
+            if "peak_rss_growth_kib" in args:
+                row[4] = max(row[4] or 0, args["peak_rss_growth_kib"])
+            if "malloc_peak_kib" in args:
+                row[5] = max(row[5] or 0, args["malloc_peak_kib"])
+            for name, timer in args.get("timers", {}).items():
+                sub = rows.setdefault((label, name), [0, 0.0, None, 0, None, None])
+                sub[0] += timer["calls"]
+                sub[1] += timer["ms"] / 1000
+
+        header = f"{'Stage':<40} {'Calls':>8} {'Wall s':>9} {'CPU s':>9} {'Items':>8} {'+RSS MiB':>9}"
+        lines = [header + (f" {'Py peak MiB':>12}" if self.malloc else "")]
+        for key, (calls, wall, cpu, items, rss, malloc) in rows.items():
+            label = key[0] if len(key) == 1 else f"  {key[1]}"
+            cpu_text = f"{cpu:9.3f}" if cpu is not None else f"{'':>9}"
+            items_text = f"{items:8d}" if items else f"{'':>8}"
+            rss_text = f"{rss / 1024:9.1f}" if rss is not None else f"{'':>9}"
+            malloc_text = f" {malloc / 1024:12.1f}" if malloc is not None else ""
+            lines.append(f"{label[:40]:<40} {calls:8d} {wall:9.3f} {cpu_text} {items_text} {rss_text}{malloc_text}".rstrip())
+        return "\n".join(lines)
+
+
+def enable(malloc: bool = False, root: Optional[str] = None, **args) -> Tracer:
+    """Starts recording, inside a stage `root` that lasts until disable() if given."""
+    global _tracer
+    _tracer = Tracer(malloc)
+    if root:
+        _tracer.stage(root, args).__enter__()
+    return _tracer
+
+
+def disable() -> Optional[Tracer]:
+    """Stops recording, closing any open stages. Returns the tracer, if there was one."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None:
+        tracer.finish()
+    return tracer
+
+
+def stage(name: str, **args):
+    if _tracer is None:
+        return _NULL_STAGE
+    return _tracer.stage(name, args)
+
+
+def timed(name: str, fn: Callable) -> Callable:
+    """`fn`, timed as sub-stage `name` of the current stage while profiling."""
+    tracer = _tracer
+    if tracer is None:
+        return fn
+    clock = time.perf_counter
+
+    def wrapper(*args, **kwargs):
+        start = clock()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            tracer.add_time(name, clock() - start)
+
+    return wrapper
+
+
+class _TimedFile:
+    # Times reads/writes (and so the (de)compression behind them) of a file object
+    def __init__(self, file, name: str, tracer: Tracer):
+        self._file = file
+        self._name = name
+        self._tracer = tracer
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._tracer.add_time(self._name, time.perf_counter() - start)
+
+    def read(self, *args):
+        return self._timed(self._file.read, *args)
+
+    def peek(self, *args):
+        return self._timed(self._file.peek, *args)
+
+    def write(self, data):
+        return self._timed(self._file.write, data)
+
+    def close(self):
+        return self._timed(self._file.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+def wrap_file(file, name: str):
+    """`file` with its reads/writes timed as sub-stage `name` while profiling."""
+    if _tracer is None:
+        return file
+    return _TimedFile(file, name, _tracer)
@@ -0,0 +1,135 @@
+import functools
+import logging
+from array import array
+from collections import Counter
+from typing import List, Optional, Tuple
+
+from google.protobuf import descriptor_pb2, descriptor_pool, message_factory
+from google.protobuf.message import Message
+
+from .compress import open_read
+from .core import BackupFormat, READ_ERRORS, read_schema
+from .stream import BackupReader, open_backup
+
+# Lazy backup view.
+#
+# For statistics we only need the cheap header fields of each manga (source,
+# url, favorite, genre) plus how many chapters it has. Building every
+# BackupChapter message just to count them is where most of the time in `info`
+# used to go, so the view parses manga with a "lazy" variant of the schema in
+# which every message-typed field of BackupManga is declared as bytes. That is
+# the same thing on the wire, so the C parser just slices the chapter payloads
+# instead of decoding them, and len(manga.chapters) is the chapter count.
+
+
+# BackupChapter.read, the same in every fork
+CHAPTER_READ_FIELD = 4
+
+
+@functools.lru_cache(maxsize=None)
+def lazy_manga_class(schema_module, read_flags: bool = False):
+    """
+    BackupManga of `schema_module` with chapters/history/tracking/... left undecoded.
+    With `read_flags`, chapters are decoded, but only their `read` field.
+    """
+    file_proto = descriptor_pb2.FileDescriptorProto()
+    schema_module.DESCRIPTOR.CopyToProto(file_proto)
+    prefix = f".{file_proto.package}." if file_proto.package else "."
+    if read_flags:
+        flag_proto = file_proto.message_type.add(name="ChapterReadFlag")
+        flag_proto.field.add(name="read", number=CHAPTER_READ_FIELD,
+                             type=descriptor_pb2.FieldDescriptorProto.TYPE_BOOL,
+                             label=descriptor_pb2.FieldDescriptorProto.LABEL_OPTIONAL)
+    for message_proto in file_proto.message_type:
+        if message_proto.name != "BackupManga":
+            continue
+        for field in message_proto.field:
+            if field.type != descriptor_pb2.FieldDescriptorProto.TYPE_MESSAGE:
+                continue
+            if read_flags and field.name == "chapters":
+                field.type_name = prefix + "ChapterReadFlag"
+            else:
+                field.type = descriptor_pb2.FieldDescriptorProto.TYPE_BYTES
+                field.ClearField("type_name")
+
+    # A private pool, so the names don't clash with the real schema
+    pool = descriptor_pool.DescriptorPool()
+    pool.Add(file_proto)
+    return message_factory.GetMessageClass(pool.FindMessageTypeByName(prefix[1:] + "BackupManga"))
+
+
+class BackupView:
+    """
+    Index and statistics of a backup, built in a single streaming pass.
+
+    Per manga it keeps the offset/size of its bytes in the decompressed stream,
+    its (source, url) key, favorite flag and chapter count, so individual manga
+    can be loaded later without parsing the rest of the file.
+    """
+
+    def __init__(self, path: str, fmt: BackupFormat):
+        self.path = path
+        self.fmt = fmt
+        self.offsets = array("q")
+        self.sizes = array("q")
+        self.sources = array("q")
+        self.urls: List[str] = []
+        self.favorites = bytearray()
+        self.chapter_counts = array("q")
+        self.genre_counts: Counter = Counter()
+        self.extras: Optional[Message] = None
+
+    @classmethod
+    def build(cls, reader: BackupReader) -> "BackupView":
+        view = cls(reader.path, reader.fmt)
+        manga_cls = lazy_manga_class(reader.schema)
+        manga = manga_cls()
+        for offset, payload in reader.iter_raw_manga(offsets=True):
+            manga.Clear()
+            manga.ParseFromString(payload)
+            view.offsets.append(offset)
+            view.sizes.append(len(payload))
+            view.sources.append(manga.source)
+            view.urls.append(manga.url)
+            view.favorites.append(1 if manga.favorite else 0)
+            view.chapter_counts.append(len(manga.chapters))
+            view.genre_counts.update(manga.genre)
+        view.extras = reader.finish()
+        return view
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def key(self, index: int) -> Tuple[int, str]:
+        return self.sources[index], self.urls[index]
+
+    @property
+    def favorite_count(self) -> int:
+        return sum(self.favorites)
+
+    @property
+    def total_chapters(self) -> int:
+        return sum(self.chapter_counts)
+
+    @property
+    def source_counts(self) -> Counter:
+        return Counter(self.sources)
+
+    def manga(self, index: int) -> Message:
+        """Fully parses one manga, reading only up to its position in the file."""
+        with open_read(self.path) as f:
+            f.seek(self.offsets[index])
+            payload = f.read(self.sizes[index])
+        return read_schema(self.fmt).BackupManga.FromString(payload)
+
+
+def open_view(path: str) -> Optional[BackupView]:
+    reader = open_backup(path)
+    if not reader:
+        return None
+    with reader:
+        try:
+            return BackupView.build(reader)
+        except READ_ERRORS as e:
+            logging.error(f"Failed to load {path}: {e}")
+            return None
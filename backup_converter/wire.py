@@ -0,0 +1,124 @@
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+from google.protobuf.message import DecodeError
+
+# Minimal protobuf wire-format helpers.
+#
+# Just enough to walk a message field by field without building it, so the
+# big repeated fields (backupManga, chapters, ...) can be streamed or skipped.
+
+VARINT = 0
+FIXED64 = 1
+LENGTH_DELIMITED = 2
+START_GROUP = 3
+END_GROUP = 4
+FIXED32 = 5
+
+
+def encode_varint(value: int) -> bytes:
+    if value < 0:
+        # Negative int32/int64 are encoded as 10-byte two's complement
+        value += 1 << 64
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def encode_tag(field_number: int, wire_type: int) -> bytes:
+    return encode_varint((field_number << 3) | wire_type)
+
+
+def decode_varint(buf, pos: int) -> Tuple[int, int]:
+    """Decodes a varint from `buf` at `pos`. Returns (value, new_pos)."""
+    result = 0
+    shift = 0
+    while True:
+        try:
+            byte = buf[pos]
+        except IndexError:
+            raise DecodeError("Truncated varint")
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+        if shift >= 70:
+            raise DecodeError("Varint too long")
+
+
+def read_varint(stream: BinaryIO) -> Optional[int]:
+    """Reads a varint from a stream. Returns None on a clean EOF."""
+    result = 0
+    shift = 0
+    while True:
+        b = stream.read(1)
+        if not b:
+            if shift:
+                raise DecodeError("Truncated varint")
+            return None
+        byte = b[0]
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result
+        shift += 7
+        if shift >= 70:
+            raise DecodeError("Varint too long")
+
+
+def read_exact(stream: BinaryIO, size: int) -> bytes:
+    data = stream.read(size)
+    if len(data) != size:
+        raise DecodeError(f"Truncated field: expected {size} bytes, got {len(data)}")
+    return data
+
+
+def skip_exact(stream: BinaryIO, size: int, chunk_size: int = 1 << 20):
+    # Reads and discards in chunks so skipping a huge field doesn't allocate it whole
+    while size > 0:
+        data = stream.read(min(size, chunk_size))
+        if not data:
+            raise DecodeError("Truncated field while skipping")
+        size -= len(data)
+
+
+def iter_fields(buf, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[int, int, int, int]]:
+    """
+    Walks the fields of an encoded message in `buf[start:end]`.
+
+    Yields (field_number, wire_type, value_start, value_end). For varints the
+    value span covers the encoded varint, for length-delimited fields it covers
+    the payload only (without the length prefix).
+    """
+    pos = start
+    end = len(buf) if end is None else end
+    while pos < end:
+        key, pos = decode_varint(buf, pos)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == VARINT:
+            value_start = pos
+            _, pos = decode_varint(buf, pos)
+        elif wire_type == LENGTH_DELIMITED:
+            size, value_start = decode_varint(buf, pos)
+            pos = value_start + size
+        elif wire_type == FIXED64:
+            value_start = pos
+            pos += 8
+        elif wire_type == FIXED32:
+            value_start = pos
+            pos += 4
+        else:
+            # Groups are not used by any backup schema
+            raise DecodeError(f"Unsupported wire type {wire_type} for field {number}")
+        if pos > end:
+            raise DecodeError(f"Truncated field {number}")
+        yield number, wire_type, value_start, pos
+
+
+def encode_field(number: int, wire_type: int, value: bytes) -> bytes:
+    """Encodes a single field from its (payload) bytes."""
+    if wire_type == LENGTH_DELIMITED:
+        return encode_tag(number, wire_type) + encode_varint(len(value)) + value
+    return encode_tag(number, wire_type) + value
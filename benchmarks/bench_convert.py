@@ -0,0 +1,84 @@
+"""
+Compares the direct descriptor converter against the old JSON round-trip, and
+times the streaming conversion `convert` does, for each pair of formats.
+
+    python -m benchmarks.bench_convert --manga 2000 --chapters 75
+    python -m benchmarks.bench_convert --pairs j2k:sy yokai:sy --no-json
+
+J2K and Yokai chapters are laid out differently from SY/Mihon ones, so those
+pairs take the parse-and-copy path rather than the wire passthrough.
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from backup_converter.core import BackupFormat, convert_backup, convert_backup_json, save_backup
+from backup_converter.stream import BackupWriter, open_backup
+from .synth import make_sy_backup
+
+PAIRS = ["sy:mihon", "mihon:sy", "sy:j2k", "j2k:sy", "j2k:mihon", "sy:yokai", "yokai:sy", "j2k:yokai"]
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def convert_file(src_path, src, dst, out_path):
+    with open_backup(src_path, src) as reader, BackupWriter(out_path, dst, level=1) as writer:
+        convert_backup(reader, dst, writer=writer)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="convert_backup benchmark")
+    parser.add_argument("--manga", type=int, default=2000)
+    parser.add_argument("--chapters", type=int, default=75)
+    parser.add_argument("--pairs", nargs="+", default=PAIRS, metavar="SRC:DST",
+                        help=f"Format pairs to convert (default: {' '.join(PAIRS)})")
+    parser.add_argument("--no-json", action="store_true", help="Skip the JSON round-trip, which is slow")
+    args = parser.parse_args()
+
+    sy_backup = make_sy_backup(args.manga, args.chapters)
+    sources = {BackupFormat.SY: sy_backup}
+    print(f"{args.manga} manga x {args.chapters} chapters")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for pair in args.pairs:
+            src, dst = (BackupFormat[name.upper()] for name in pair.split(":"))
+            if src not in sources:
+                sources[src] = convert_backup(sy_backup, src)
+            backup = sources[src]
+            src_path = os.path.join(tmp, f"{src.value}.tachibk")
+            if not os.path.exists(src_path):
+                save_backup(backup, src_path, level=1)
+            print(f"{src.name} -> {dst.name}")
+
+            results = {}
+            for label, fn in (("json", convert_backup_json), ("direct", convert_backup)):
+                if label == "json" and args.no_json:
+                    continue
+                out, elapsed, peak = measure(fn, backup, dst)
+                results[label] = out.SerializeToString(deterministic=True)
+                print(f"  {label:<7}: {elapsed:7.2f}s  peak {peak / 2**20:8.1f} MiB")
+
+            out_path = os.path.join(tmp, "out.tachibk")
+            start = time.perf_counter()
+            convert_file(src_path, src, dst, out_path)
+            print(f"  {'stream':<7}: {time.perf_counter() - start:7.2f}s  (file to file)")
+            with open_backup(out_path, dst) as reader:
+                streamed = convert_backup(reader, dst)
+            results["stream"] = streamed.SerializeToString(deterministic=True)
+
+            same = len(set(results.values())) == 1
+            print(f"  outputs identical: {same}")
+
+
+if __name__ == "__main__":
+    main()
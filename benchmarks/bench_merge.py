@@ -0,0 +1,38 @@
+"""
+Times merge_backups on backups with heavy overlap (every manga duplicated
+in every file) at growing chapter counts. With the per-manga hash indexes the
+time per chapter should stay roughly flat.
+
+    python -m benchmarks.bench_merge --files 3 --manga 20
+"""
+import argparse
+import time
+
+from backup_converter.core import BackupFormat, merge_backups
+from .synth import make_overlapping_backups
+
+
+def main():
+    parser = argparse.ArgumentParser(description="merge_backups benchmark")
+    parser.add_argument("--files", type=int, default=3)
+    parser.add_argument("--manga", type=int, default=20)
+    parser.add_argument("--chapters", type=int, nargs="+", default=[1000, 2000, 5000, 10000])
+    parser.add_argument("--overlap", type=float, default=0.9)
+    args = parser.parse_args()
+
+    print(f"{args.files} files x {args.manga} manga, {args.overlap:.0%} chapter overlap")
+    for chapters in args.chapters:
+        backups = make_overlapping_backups(args.files, args.manga, chapters, args.overlap)
+        total = args.files * args.manga * chapters
+
+        start = time.perf_counter()
+        merged = merge_backups([(b, BackupFormat.SY) for b in backups])
+        elapsed = time.perf_counter() - start
+
+        out_chapters = sum(len(m.chapters) for m in merged.backupManga)
+        print(f"  {chapters:>6} chapters/manga: {elapsed:6.2f}s  "
+              f"{elapsed / total * 1e6:5.2f} us/input chapter  -> {out_chapters} merged chapters")
+
+
+if __name__ == "__main__":
+    main()
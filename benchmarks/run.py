@@ -0,0 +1,214 @@
+"""
+Stage-by-stage benchmark of the backup pipeline.
+
+Generates synthetic backups for each schema and times every stage of a
+load -> convert -> merge -> save cycle, recording wall time and peak RSS per
+stage. Results are written as JSON so runs on different commits can be diffed:
+
+    python -m benchmarks.run --manga 5000 --chapters 100 -o before.json
+    python -m benchmarks.run --manga 5000 --chapters 100 -o after.json
+    python -m benchmarks.run --compare before.json after.json
+"""
+import argparse
+import gzip
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+try:
+    import resource
+except ImportError:  # Windows, peak RSS isn't recorded there
+    resource = None
+
+from google.protobuf import __version__ as protobuf_version
+from google.protobuf.internal import api_implementation
+
+from backup_converter.core import SCHEMA_MAP, BackupFormat, convert_backup, merge_backups
+from .synth import SynthConfig, write_backups
+
+STAGES = ["decompress", "parse", "convert", "dedupe", "serialize", "compress"]
+
+
+def _read_status(field: str):
+    # VmHWM/VmRSS in bytes, Linux only
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak() -> bool:
+    # Writing 5 to clear_refs resets VmHWM to the current RSS (Linux >= 4.0)
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss() -> Optional[int]:
+    peak = _read_status("VmHWM")
+    if peak is not None or resource is None:
+        return peak
+    # ru_maxrss is the peak over the whole process (KiB on Linux, bytes on macOS)
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+class StageRecorder:
+    def __init__(self):
+        self.results = {}
+        self.per_stage_peak = _reset_peak()
+
+    @contextmanager
+    def stage(self, name: str, count: int = 0):
+        _reset_peak()
+        rss_before = _read_status("VmRSS") or 0
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        yield
+        entry = self.results.setdefault(name, {"seconds": 0.0, "cpu_seconds": 0.0, "peak_rss": 0, "rss_delta": 0, "items": 0})
+        entry["seconds"] += time.perf_counter() - start
+        entry["cpu_seconds"] += time.process_time() - cpu_start
+        peak = _peak_rss()
+        entry["peak_rss"] = None if peak is None else max(entry["peak_rss"] or 0, peak)
+        entry["rss_delta"] += (_read_status("VmRSS") or 0) - rss_before
+        entry["items"] += count
+
+
+def run_schema(config: SynthConfig, workdir: str) -> dict:
+    paths = write_backups(config, os.path.join(workdir, config.fmt.value))
+    schema = SCHEMA_MAP[config.fmt]
+    recorder = StageRecorder()
+
+    loaded = []
+    for path in paths:
+        with recorder.stage("decompress"):
+            with gzip.open(path, "rb") as f:
+                data = f.read()
+        with recorder.stage("parse", count=1):
+            backup = schema.Backup()
+            backup.ParseFromString(data)
+        del data
+        loaded.append(backup)
+
+    # Convert to something else: SY -> Mihon, everything else -> SY
+    target = BackupFormat.MIHON if config.fmt is BackupFormat.SY else BackupFormat.SY
+    with recorder.stage("convert", count=sum(len(b.backupManga) for b in loaded)):
+        for backup in loaded:
+            convert_backup(backup, target)
+
+    with recorder.stage("dedupe", count=sum(len(b.backupManga) for b in loaded)):
+        merged = merge_backups([(b, config.fmt) for b in loaded])
+    del loaded
+
+    with recorder.stage("serialize", count=len(merged.backupManga)):
+        data = merged.SerializeToString()
+    with recorder.stage("compress"):
+        compressed = gzip.compress(data)
+
+    return {
+        "config": {k: (v.value if isinstance(v, BackupFormat) else v) for k, v in vars(config).items()},
+        "input_bytes": sum(os.path.getsize(p) for p in paths),
+        "output_bytes": len(compressed),
+        "per_stage_peak_rss": recorder.per_stage_peak,
+        "stages": recorder.results,
+    }
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _mib(size: Optional[int]) -> str:
+    return f"{'n/a':>8}" if size is None else f"{size / 2**20:8.1f}"
+
+
+def compare(old_path: str, new_path: str):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{old.get('commit')} -> {new.get('commit')}")
+    for fmt, new_run in new["runs"].items():
+        old_run = old["runs"].get(fmt)
+        if not old_run:
+            continue
+        print(f"\n[{fmt}]")
+        print(f"  {'stage':<11} {'old s':>8} {'new s':>8} {'ratio':>7}   {'old MiB':>8} {'new MiB':>8}")
+        for stage in STAGES:
+            a, b = old_run["stages"].get(stage), new_run["stages"].get(stage)
+            if not a or not b:
+                continue
+            ratio = b["seconds"] / a["seconds"] if a["seconds"] else float("inf")
+            print(f"  {stage:<11} {a['seconds']:8.3f} {b['seconds']:8.3f} {ratio:6.2f}x   "
+                  f"{_mib(a['peak_rss'])} {_mib(b['peak_rss'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backup pipeline benchmark")
+    parser.add_argument("--formats", nargs="+", choices=["sy", "mihon", "j2k", "komikku", "yokai"], default=["sy", "mihon", "j2k"])
+    parser.add_argument("--files", type=int, default=3)
+    parser.add_argument("--manga", type=int, default=2000)
+    parser.add_argument("--chapters", type=int, default=75)
+    parser.add_argument("--history-density", type=float, default=0.05)
+    parser.add_argument("--tracking-density", type=float, default=0.3)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "protobuf": f"{protobuf_version} ({api_implementation.Type()})",
+        "runs": {},
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for fmt in args.formats:
+            config = SynthConfig(
+                fmt=BackupFormat(fmt),
+                files=args.files,
+                manga=args.manga,
+                chapters=args.chapters,
+                history_density=args.history_density,
+                tracking_density=args.tracking_density,
+                duplicate_ratio=args.duplicate_ratio,
+                seed=args.seed,
+            )
+            run = run_schema(config, workdir)
+            results["runs"][fmt] = run
+            print(f"[{fmt}] {run['input_bytes'] / 2**20:.1f} MiB in, {run['output_bytes'] / 2**20:.1f} MiB out")
+            for stage in STAGES:
+                entry = run["stages"][stage]
+                print(f"  {stage:<11} {entry['seconds']:8.3f}s  peak RSS {_mib(entry['peak_rss'])} MiB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Synthetic backup generator.
+
+    python -m benchmarks.synth --format mihon --manga 5000 --chapters 200 --files 3 -o /tmp/synth
+
+Libraries are generated as SY (the superset) and converted to the requested
+format, so every schema gets the same shape of data.
+"""
+import argparse
+import os
+import random
+from dataclasses import dataclass
+from typing import List
+
+from backup_converter.core import BackupFormat, convert_backup, save_backup
+from backup_converter.schemas import sy_pb2
+
+GENRES = ["Action", "Adventure", "Comedy", "Drama", "Fantasy", "Horror", "Isekai", "Romance", "Sci-Fi", "Slice of Life"]
+
+
+@dataclass
+class SynthConfig:
+    fmt: BackupFormat = BackupFormat.SY
+    files: int = 1
+    manga: int = 2000
+    chapters: int = 75
+    # Fraction of chapters with a history entry, of manga with a tracker
+    history_density: float = 0.05
+    tracking_density: float = 0.3
+    # Fraction of each file's manga that also appear in the other files
+    duplicate_ratio: float = 0.0
+    categories: int = 8
+    sources: int = 20
+    seed: int = 0
+
+
+def _add_manga(backup, rng: random.Random, config: SynthConfig, index: int):
+    manga = backup.backupManga.add(
+        source=1000 + index % config.sources,
+        url=f"/manga/{index}",
+        title=f"Manga {index}",
+        author="Author",
+        description="Lorem ipsum " * 8,
+        status=rng.randrange(6),
+        thumbnailUrl=f"https://example.org/cover/{index}.jpg",
+        dateAdded=1_600_000_000_000 + index,
+        favorite=rng.random() < 0.8,
+        lastModifiedAt=1_600_000_000 + rng.randrange(1_000_000),
+    )
+    manga.genre.extend(rng.sample(GENRES, 2))
+    if config.categories:
+        manga.categories.append(rng.randrange(config.categories))
+    if rng.random() < 0.05:
+        manga.customTitle = f"Custom {index}"
+
+    for c in range(config.chapters):
+        url = f"/manga/{index}/chapter/{c}"
+        manga.chapters.add(
+            url=url,
+            name=f"Chapter {c}",
+            scanlator="Group",
+            read=rng.random() < 0.5,
+            lastPageRead=rng.randrange(40),
+            dateFetch=1_600_000_000_000 + c,
+            dateUpload=1_600_000_000_000 + c,
+            chapterNumber=float(c),
+            sourceOrder=c,
+            lastModifiedAt=1_600_000_000 + rng.randrange(1_000_000),
+        )
+        if rng.random() < config.history_density:
+            manga.history.add(url=url, lastRead=1_600_000_000_000 + rng.randrange(10**9), readDuration=rng.randrange(10**6))
+    if rng.random() < config.tracking_density:
+        manga.tracking.add(
+            syncId=rng.randrange(1, 6),
+            libraryId=index,
+            title=manga.title,
+            lastChapterRead=float(rng.randrange(config.chapters + 1)),
+            totalChapters=config.chapters,
+        )
+
+
+def generate_backups(config: SynthConfig) -> List:
+    """
+    Generates `config.files` backups in `config.fmt`. Each file has
+    `config.manga` manga, `duplicate_ratio` of which are shared by all files
+    (same source and url, independently generated read state).
+    """
+    shared = int(config.manga * config.duplicate_ratio)
+    backups = []
+    for f in range(config.files):
+        rng = random.Random(config.seed * 1009 + f)
+        backup = sy_pb2.Backup()
+        for i in range(config.categories):
+            backup.backupCategories.add(name=f"Category {i}", order=i, id=i)
+        for s in range(config.sources):
+            backup.backupSources.add(name=f"Source {s}", sourceId=1000 + s)
+
+        for i in range(config.manga):
+            # Shared manga keep their index, the rest get one unique to this file
+            index = i if i < shared else shared + f * config.manga + i
+            _add_manga(backup, rng, config, index)
+
+        if config.fmt not in (BackupFormat.SY, BackupFormat.NEKO):
+            backup = convert_backup(backup, config.fmt)
+        backups.append(backup)
+    return backups
+
+
+def write_backups(config: SynthConfig, directory: str) -> List[str]:
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for f, backup in enumerate(generate_backups(config)):
+        path = os.path.join(directory, f"synth_{config.fmt.value}_{f}.tachibk")
+        save_backup(backup, path)
+        paths.append(path)
+    return paths
+
+
+def make_sy_backup(manga_count: int = 2000, chapters_per_manga: int = 75, seed: int = 0):
+    """A single SY backup shaped roughly like a real library."""
+    return generate_backups(SynthConfig(manga=manga_count, chapters=chapters_per_manga, seed=seed))[0]
+
+
+def make_overlapping_backups(files: int = 3, manga_count: int = 50, chapters_per_manga: int = 5000,
+                             overlap: float = 0.9, seed: int = 0):
+    """
+    Builds `files` SY backups of the same library as seen from different devices:
+    every manga is in every file, each copy has `overlap` of the chapters in
+    common with the others, with its own read progress, history and tracking.
+    """
+    backups = []
+    for f in range(files):
+        rng = random.Random(seed * 1000 + f)
+        backup = sy_pb2.Backup()
+        for i in range(manga_count):
+            manga = backup.backupManga.add(
+                source=1000 + i % 20,
+                url=f"/manga/{i}",
+                title=f"Manga {i}",
+                favorite=rng.random() < 0.5,
+                lastModifiedAt=rng.randrange(1_000_000),
+            )
+            manga.categories.append(rng.randrange(8))
+            shared = int(chapters_per_manga * overlap)
+            # Shared chapters first, then ones only this device has seen
+            urls = [f"/manga/{i}/chapter/{c}" for c in range(shared)]
+            urls += [f"/manga/{i}/chapter/{f}-{c}" for c in range(chapters_per_manga - shared)]
+            for c, url in enumerate(urls):
+                manga.chapters.add(
+                    url=url,
+                    name=f"Chapter {c}",
+                    read=rng.random() < 0.5,
+                    bookmark=rng.random() < 0.05,
+                    lastPageRead=rng.randrange(40),
+                    chapterNumber=float(c),
+                    lastModifiedAt=rng.randrange(1_000_000),
+                )
+            for url in rng.sample(urls, min(len(urls), 20)):
+                manga.history.add(url=url, lastRead=rng.randrange(1_000_000), readDuration=rng.randrange(10_000))
+            manga.tracking.add(syncId=rng.randrange(1, 4), libraryId=i, lastChapterRead=float(rng.randrange(100)))
+        backups.append(backup)
+    return backups
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic backup generator")
+    parser.add_argument("--format", choices=["sy", "mihon", "j2k", "komikku", "yokai"], default="sy")
+    parser.add_argument("--files", type=int, default=1)
+    parser.add_argument("--manga", type=int, default=2000)
+    parser.add_argument("--chapters", type=int, default=75)
+    parser.add_argument("--history-density", type=float, default=0.05)
+    parser.add_argument("--tracking-density", type=float, default=0.3)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default="synth", help="Output directory")
+    args = parser.parse_args()
+
+    config = SynthConfig(
+        fmt=BackupFormat(args.format),
+        files=args.files,
+        manga=args.manga,
+        chapters=args.chapters,
+        history_density=args.history_density,
+        tracking_density=args.tracking_density,
+        duplicate_ratio=args.duplicate_ratio,
+        seed=args.seed,
+    )
+    for path in write_backups(config, args.output):
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
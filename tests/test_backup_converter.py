@@ -0,0 +1,265 @@
+import gzip
+import itertools
+
+import pytest
+
+from backup_converter.converter import convert_bytes, copy_message
+from backup_converter.core import SCHEMA_MAP, BackupFormat
+from backup_converter.merge import MangaUnion
+from backup_converter.schemas import j2k_pb2, mihon_pb2, sy_pb2
+from backup_converter.sniff import sniff_format
+from backup_converter.subset import And, Everything, Favorite, HasGenre, InCategory, Not, Or, ReadRatio, \
+    SourceIn, UpdatedSince, parse_predicate
+
+# Neko shares the SY schema
+FORMATS = [fmt for fmt in BackupFormat if fmt is not BackupFormat.NEKO]
+
+
+def _value(field, n):
+    if field.cpp_type == field.CPPTYPE_ENUM:
+        values = field.enum_type.values
+        return values[n % len(values)].number
+    if field.cpp_type == field.CPPTYPE_BOOL:
+        return bool(n % 2)
+    if field.cpp_type in (field.CPPTYPE_FLOAT, field.CPPTYPE_DOUBLE):
+        return n + 0.5
+    if field.cpp_type == field.CPPTYPE_STRING:
+        return f"{field.name} {n}" if field.type == field.TYPE_STRING else bytes([n % 256])
+    return n
+
+
+def _fill(message, seed=1):
+    # Sets every field the schema has, two entries per list, so each
+    # fork-specific field takes part in the conversion
+    for field in message.DESCRIPTOR.fields:
+        n = seed + field.number
+        container = getattr(message, field.name)
+        if field.cpp_type == field.CPPTYPE_MESSAGE:
+            for i in range(2 if field.is_repeated else 1):
+                _fill(container.add() if field.is_repeated else container, n + i)
+        elif field.is_repeated:
+            container.extend([_value(field, n), _value(field, n + 1)])
+        else:
+            setattr(message, field.name, _value(field, n))
+    return message
+
+
+@pytest.mark.parametrize("src,dst", [pair for pair in itertools.product(FORMATS, FORMATS) if pair[0] is not pair[1]],
+                         ids=lambda fmt: fmt.value)
+def test_convert_bytes_matches_copy_message(src, dst):
+    src_cls = SCHEMA_MAP[src].BackupManga
+    dst_cls = SCHEMA_MAP[dst].BackupManga
+    manga = _fill(src_cls())
+    expected = copy_message(manga, dst_cls())
+    converted = dst_cls.FromString(convert_bytes(manga.SerializeToString(), src_cls.DESCRIPTOR, dst_cls.DESCRIPTOR))
+    assert converted == expected
+    assert converted.chapters[1].url == manga.chapters[1].url
+
+
+def _write(path, backup):
+    with gzip.open(path, "wb") as f:
+        f.write(backup.SerializeToString())
+    return str(path)
+
+
+def _plain_backup(schema, count=1):
+    # Only fields every fork has
+    backup = schema.Backup()
+    for i in range(count):
+        manga = backup.backupManga.add(source=1, url=f"/manga/{i}", title=f"Manga {i}", favorite=True)
+        manga.chapters.add(url=f"/manga/{i}/1", name="Chapter 1", read=True)
+    backup.backupCategories.add(name="Reading", order=0)
+    return backup
+
+
+def test_sniff_unlabelled_common_fields_is_mihon(tmp_path):
+    path = _write(tmp_path / "library.tachibk", _plain_backup(sy_pb2))
+    fmt, confidence = sniff_format(path)
+    assert fmt is BackupFormat.MIHON
+    assert confidence < 1.0
+
+
+@pytest.mark.parametrize("name,fmt", [
+    ("library_sy.tachibk", BackupFormat.SY),
+    ("library_neko.tachibk", BackupFormat.NEKO),
+    ("library_komikku.tachibk", BackupFormat.KOMIKKU),
+    ("library_j2k.tachibk", BackupFormat.J2K),
+    ("library_yokai.tachibk", BackupFormat.YOKAI),
+])
+def test_sniff_consistent_hint_wins_over_tie_order(tmp_path, name, fmt):
+    path = _write(tmp_path / name, _plain_backup(sy_pb2))
+    assert sniff_format(path)[0] is fmt
+
+
+def test_sniff_mihon_fields_reported_as_mihon(tmp_path):
+    backup = _plain_backup(mihon_pb2)
+    backup.backupManga[0].lastModifiedAt = 1700000000
+    backup.backupManga[0].chapters[0].version = 2
+    path = _write(tmp_path / "library.tachibk", backup)
+    assert sniff_format(path)[0] is BackupFormat.MIHON
+
+
+def test_sniff_inconsistent_hint_loses(tmp_path):
+    backup = _plain_backup(j2k_pb2)
+    backup.backupManga[0].chapters[0].pagesLeft = 7
+    path = _write(tmp_path / "library_sy.tachibk", backup)
+    # Fits J2K and Yokai, J2K first in the tie order
+    assert sniff_format(path)[0] is BackupFormat.J2K
+
+
+def test_sniff_unlabelled_j2k_with_late_fields(tmp_path):
+    # Nothing J2K-specific until the last manga, well past the window
+    backup = _plain_backup(j2k_pb2, count=200)
+    backup.backupManga[-1].chapters[0].pagesLeft = 7
+    path = _write(tmp_path / "library.tachibk", backup)
+    assert sniff_format(path, window=256)[0] is BackupFormat.J2K
+
+
+def test_sniff_unlabelled_sy_with_late_fields(tmp_path):
+    backup = _plain_backup(sy_pb2, count=200)
+    backup.backupManga[-1].customTitle = "Custom"
+    backup.backupManga[-1].chapters[0].lastModifiedAt = 5
+    path = _write(tmp_path / "library.tachibk", backup)
+    assert sniff_format(path, window=256)[0] is BackupFormat.SY
+
+
+def test_sniff_not_a_backup(tmp_path):
+    path = tmp_path / "notes.tachibk"
+    path.write_bytes(b"not gzip at all")
+    assert sniff_format(str(path)) == (None, 0.0)
+
+
+def _manga(source=1, url="/m", **fields):
+    return sy_pb2.BackupManga(source=source, url=url, **fields)
+
+
+def test_parse_predicate_empty_is_everything():
+    assert isinstance(parse_predicate("   "), Everything)
+
+
+def test_parse_predicate_and_binds_tighter_than_or():
+    predicate = parse_predicate("favorite or genre = Action and source = 2")
+    assert isinstance(predicate, Or)
+    assert any(isinstance(part, And) for part in predicate.parts)
+    assert predicate(_manga(favorite=True, source=3))
+    assert predicate(_manga(source=2, genre=["action"]))
+    assert not predicate(_manga(source=3, genre=["Action"]))
+
+
+def test_parse_predicate_parentheses_and_not():
+    predicate = parse_predicate("not (favorite or source = 5)")
+    assert isinstance(predicate, Not)
+    assert predicate(_manga(source=1))
+    assert not predicate(_manga(source=5))
+    assert not predicate(_manga(favorite=True))
+
+
+def test_parse_predicate_lists_quotes_and_negation():
+    predicate = parse_predicate("genre != 'Slice of Life',Romance")
+    assert isinstance(predicate, Not) and isinstance(predicate.part, HasGenre)
+    assert not predicate(_manga(genre=["slice of life"]))
+    assert predicate(_manga(genre=["Action"]))
+    sources = parse_predicate("source = 1,2")
+    assert isinstance(sources, SourceIn) and sources.source_ids == {1, 2}
+
+
+def test_parse_predicate_keywords_are_case_insensitive():
+    assert isinstance(parse_predicate("FAVORITE AND Source = 1"), And)
+    assert isinstance(parse_predicate("Favorite"), Favorite)
+
+
+def test_parse_predicate_comparisons():
+    assert isinstance(parse_predicate("updated >= 2024-01-01"), UpdatedSince)
+    assert isinstance(parse_predicate("updated < 2024-01-01"), Not)
+    ratio = parse_predicate("read_ratio > 0.5")
+    assert isinstance(ratio, ReadRatio) and ratio.minimum == 0.5 and not ratio.min_inclusive
+    ratio = parse_predicate("read_ratio <= 0.25")
+    assert ratio.maximum == 0.25 and ratio.max_inclusive
+    assert isinstance(parse_predicate("read_ratio != 1"), Not)
+
+
+@pytest.mark.parametrize("text", [
+    "favorite and",
+    "(favorite",
+    "favorite)",
+    "favorite favorite",
+    "source = abc",
+    "source > 1",
+    "genre",
+    "updated = 2024-01-01",
+    "updated >= yesterday",
+    "read_ratio >= half",
+    "rating >= 3",
+    "genre = \"Action",
+])
+def test_parse_predicate_errors(text):
+    with pytest.raises(ValueError):
+        parse_predicate(text)
+
+
+def test_category_predicate_default_and_unknown():
+    extras = sy_pb2.Backup()
+    extras.backupCategories.add(name="Reading", order=3)
+    predicate = parse_predicate("category = reading,Default")
+    assert isinstance(predicate, InCategory)
+    predicate.prepare(extras)
+    assert predicate(_manga(categories=[3]))
+    assert predicate(_manga())
+    assert not predicate(_manga(categories=[4]))
+    with pytest.raises(ValueError):
+        parse_predicate("category = Missing").prepare(extras)
+
+
+def test_manga_union_merges_lists():
+    first = _manga(title="First", lastModifiedAt=10, categories=[1])
+    first.chapters.add(url="/c1", name="1", read=True, lastPageRead=3)
+    first.chapters.add(url="/c2", name="2", bookmark=False)
+    first.history.add(url="/c1", lastRead=100, readDuration=5)
+    first.tracking.add(syncId=1, libraryId=1, lastChapterRead=2.0)
+
+    second = _manga(title="Second", favorite=True, lastModifiedAt=20, version=3, categories=[2, 1])
+    second.chapters.add(url="/c2", name="2", read=True, bookmark=True, lastPageRead=1)
+    second.chapters.add(url="/c3", name="3")
+    second.history.add(url="/c1", lastRead=50, readDuration=9)
+    second.tracking.add(syncId=1, libraryId=1, lastChapterRead=1.0, title="Tracked")
+    second.tracking.add(syncId=2, libraryId=7)
+
+    union = MangaUnion(first)
+    union.add(second)
+    merged = union.manga
+    assert merged is first
+    # The favorite copy's metadata, max of the modification times
+    assert (merged.title, merged.favorite, merged.lastModifiedAt, merged.version) == ("Second", True, 20, 3)
+    assert [c.url for c in merged.chapters] == ["/c1", "/c2", "/c3"]
+    assert (merged.chapters[0].read, merged.chapters[0].lastPageRead) == (True, 3)
+    assert (merged.chapters[1].read, merged.chapters[1].bookmark, merged.chapters[1].lastPageRead) == (True, True, 1)
+    assert (merged.history[0].lastRead, merged.history[0].readDuration) == (100, 9)
+    assert [t.syncId for t in merged.tracking] == [1, 2]
+    assert (merged.tracking[0].lastChapterRead, merged.tracking[0].title) == (2.0, "Tracked")
+    assert list(merged.categories) == [1, 2]
+
+
+def test_manga_union_is_associative():
+    copies = []
+    for i in range(3):
+        copy = _manga(favorite=i == 1, title=f"Copy {i}", lastModifiedAt=i, categories=[i])
+        copy.chapters.add(url=f"/c{i}", name=str(i), read=True)
+        copy.chapters.add(url="/shared", name="shared", lastPageRead=i)
+        copy.tracking.add(syncId=1, libraryId=1, lastChapterRead=float(i))
+        copies.append(copy)
+
+    one_go = MangaUnion(sy_pb2.BackupManga.FromString(copies[0].SerializeToString()))
+    for copy in copies[1:]:
+        one_go.add(copy)
+
+    tail = MangaUnion(sy_pb2.BackupManga.FromString(copies[1].SerializeToString()))
+    tail.add(copies[2])
+    folded = MangaUnion(sy_pb2.BackupManga.FromString(copies[0].SerializeToString()))
+    folded.add(tail.manga)
+    assert folded.manga == one_go.manga
+
+
+def test_manga_union_without_categories():
+    union = MangaUnion(_manga(categories=[1]))
+    union.add(_manga(categories=[2]), categories=False)
+    assert list(union.manga.categories) == [1]